@@ -0,0 +1,88 @@
+"""
+Application module - Xử lý update song song nhưng giữ thứ tự theo từng chat/user
+"""
+import asyncio
+import logging
+from typing import Dict, Hashable, Set
+from telegram import Update
+from telegram.ext import Application
+# API nội bộ của python-telegram-bot 20.3 (cùng với _update_fetcher bên dưới): kiểm tra lại khi nâng cấp
+from telegram.ext._application import _STOP_SIGNAL
+from db import store_for_chat, use_store
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update: object) -> Hashable:
+    """
+    Khóa thứ tự của update: (chat_id, user_id) - giống khóa mặc định của ConversationHandler.
+    Update không gắn với chat/user nào thì không cần giữ thứ tự.
+    """
+    if isinstance(update, Update):
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        user_id = update.effective_user.id if update.effective_user else None
+        if chat_id is not None or user_id is not None:
+            return chat_id, user_id
+    return object()
+
+
+class OrderedApplication(Application):
+    """
+    Application xử lý nhiều update cùng lúc (tối đa max_concurrent_updates),
+    các update cùng chat/user vẫn chạy tuần tự theo đúng thứ tự nhận được.
+
+    Mỗi update được chạy trong task riêng, chờ task trước đó của cùng khóa xong
+    rồi mới lấy slot semaphore - update đang chờ không chiếm slot của người khác.
+    """
+
+    def __init__(self, *, max_concurrent_updates: int = 32, **kwargs):
+        super().__init__(**kwargs)
+        self._ordered_sem = asyncio.BoundedSemaphore(max(1, max_concurrent_updates))
+        self._max_concurrent_updates = max(1, max_concurrent_updates)
+        self._key_tails: Dict[Hashable, asyncio.Task] = {}
+        self._ordered_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._max_concurrent_updates
+
+    async def _process_in_order(self, update: object, previous: asyncio.Task = None):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            chat = update.effective_chat if isinstance(update, Update) else None
+            # Mọi truy cập DB của update (kể cả task con) đi tới store của chat
+            async with self._ordered_sem:
+                with use_store(store_for_chat(chat.id if chat else None)):
+                    await self.process_update(update)
+        except Exception as e:
+            # process_update đã gửi lỗi của handler cho error handler; đây chỉ là lỗi ngoài dự kiến
+            logger.error(f"Lỗi khi xử lý update: {e}", exc_info=True)
+        finally:
+            self.update_queue.task_done()
+
+    def _on_task_done(self, key: Hashable, task: asyncio.Task):
+        self._ordered_tasks.discard(task)
+        if self._key_tails.get(key) is task:
+            del self._key_tails[key]
+
+    async def _update_fetcher(self) -> None:
+        # Ghi đè vòng lấy update của Application (private trong PTB 20.3, xem requirements.txt)
+        while True:
+            try:
+                update = await self.update_queue.get()
+
+                if update is _STOP_SIGNAL:
+                    while not self.update_queue.empty():
+                        self.update_queue.task_done()
+                    self.update_queue.task_done()
+                    return
+
+                key = ordering_key(update)
+                task = asyncio.create_task(self._process_in_order(update, self._key_tails.get(key)))
+                self._key_tails[key] = task
+                self._ordered_tasks.add(task)
+                task.add_done_callback(lambda t, k=key: self._on_task_done(k, t))
+            except asyncio.CancelledError:
+                # Chỉ dừng qua Application.stop() (giống Application gốc)
+                logger.warning("Update fetcher bị cancel - bỏ qua, chỉ dừng qua Application.stop")
@@ -0,0 +1,174 @@
+"""
+Archive module - Chuyển dữ liệu các tháng đã đóng khỏi sales/expenses sang file archive theo tháng/năm
+
+- Tháng đã đóng: trước ARCHIVE_KEEP_MONTHS tháng gần nhất (mặc định tháng hiện tại và tháng trước ở lại database chính).
+- Mỗi phân vùng là một file ARCHIVE_DIR/<tên db>-<YYYY-MM|YYYY>.db cùng schema sales/expenses (kèm index
+  và bảng tìm kiếm FTS5), được ghi lại trong bảng archive_partitions của database chính.
+- Báo cáo, tìm kiếm và index khách quen ATTACH các phân vùng giao với khoảng cần đọc (db.iter_partitioned_rows);
+  daily_totals/stats_counters vẫn ở database chính nên /stats và tổng hợp không đổi.
+- Chạy nền trên thread bảo trì (db.MaintenanceRunner) mỗi ARCHIVE_INTERVAL_HOURS, hoặc `python db.py archive`.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import Config
+import db
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_TABLES = ("sales", "expenses")
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str]]:
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def archive_cutoff(today: date) -> date:
+    """Ngày đầu tiên còn ở database chính: đầu tháng, lùi ARCHIVE_KEEP_MONTHS - 1 tháng"""
+    months = today.year * 12 + today.month - 1 - (Config.ARCHIVE_KEEP_MONTHS - 1)
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def _period_bounds(day: date, period: str) -> Tuple[str, date, date]:
+    """(tên phân vùng, ngày đầu, ngày sau ngày cuối) của tháng/năm chứa `day`"""
+    if period == "year":
+        return str(day.year), date(day.year, 1, 1), date(day.year + 1, 1, 1)
+    next_month = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return f"{day:%Y-%m}", date(day.year, day.month, 1), next_month
+
+
+def _partition_for(day: date, partitions: List[Tuple[str, str, str]]) -> Tuple[str, date, date]:
+    """Phân vùng đã có chứa ngày này, nếu chưa có thì theo ARCHIVE_PERIOD (không chồng lên phân vùng cũ)"""
+    iso = day.isoformat()
+    for name, start, end in partitions:
+        if start <= iso < end:
+            return name, date.fromisoformat(start), date.fromisoformat(end)
+    name, start, end = _period_bounds(day, Config.ARCHIVE_PERIOD)
+    # Đổi ARCHIVE_PERIOD month -> year khi đã có phân vùng tháng trong năm: tiếp tục theo tháng
+    if any(s < end.isoformat() and e > start.isoformat() for _, s, e in partitions):
+        return _period_bounds(day, "month")
+    return name, start, end
+
+
+def _open_archive(path: str, hot: sqlite3.Connection, table: str) -> sqlite3.Connection:
+    """
+    Mở (tạo nếu chưa có) file archive với schema của bảng trong database chính.
+    File archive ít ghi nên dùng rollback journal: không có file -wal/-shm, copy/backup được như file thường.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute(f"PRAGMA synchronous={Config.DB_SYNCHRONOUS}")
+    schema = dict(hot.execute(
+        "SELECT type || ':' || name, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (table,)
+    ))
+    with conn:
+        conn.execute(schema[f"table:{table}"].replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1))
+        # Cột thêm sau (vd. created_ts khi bật DB_EPOCH_TIMESTAMPS) cũng có trong archive
+        archived = {name for name, _ in _columns(conn, table)}
+        for name, column_type in _columns(hot, table):
+            if name not in archived:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+        for key, sql in schema.items():
+            if key.startswith("index:"):
+                conn.execute(sql.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1))
+        db.create_search_table(conn, table)
+    return conn
+
+
+def archive_batch(conn: sqlite3.Connection, table: str, cutoff: date, after_id: int, upto_id: int,
+                  limit: int) -> Optional[Tuple[int, int]]:
+    """
+    Chạy trên write queue: chuyển tối đa `limit` dòng after_id < id <= upto_id có created_at < cutoff
+    sang file archive. Trả về (id cuối đã chuyển, số dòng), None khi không còn dòng nào.
+
+    Dòng được ghi (và commit) vào file archive trước, rồi mới xóa khỏi database chính và nâng max_id
+    của phân vùng trong cùng transaction: nếu dừng giữa chừng, bản sao trong archive có id > max_id
+    nên không bị đọc, lần chạy sau ghi lại (INSERT OR IGNORE) và xóa tiếp.
+    Raise db.ImportInProgress khi store đang import (trigger FTS5 đang tắt: xóa dòng lúc này sẽ để lại
+    index tìm kiếm cũ) - kiểm tra trong cùng transaction nên không xen được với begin_import.
+    """
+    if db.import_running(conn):
+        raise db.ImportInProgress("Đang có import chạy trên database này")
+    columns = [name for name, _ in _columns(conn, table)]
+    rows = conn.execute(f"""
+        SELECT {", ".join(columns)} FROM {table}
+        WHERE id > ? AND id <= ? AND created_at < ?
+        ORDER BY id
+        LIMIT ?
+    """, (after_id, upto_id, cutoff.isoformat(), limit)).fetchall()
+    if not rows:
+        return None
+
+    partitions = conn.execute(
+        "SELECT name, period_start, period_end FROM archive_partitions WHERE kind = ?", (table,)
+    ).fetchall()
+    created_at = columns.index("created_at")
+    groups: Dict[Tuple[str, date, date], List[tuple]] = defaultdict(list)
+    for row in rows:
+        groups[_partition_for(date.fromisoformat(row[created_at][:10]), partitions)].append(row)
+
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    main_path = db.main_db_path(conn)
+    for (name, start, end), group in groups.items():
+        archive = _open_archive(db.archive_path_for(main_path, name), conn, table)
+        try:
+            with archive:
+                archive.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    group
+                )
+        finally:
+            archive.close()
+        ids = [row[0] for row in group]
+        conn.executemany(f"DELETE FROM {table} WHERE id = ?", ((row_id,) for row_id in ids))
+        conn.execute("""
+            INSERT INTO archive_partitions (name, kind, period_start, period_end, min_id, max_id, rows, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name, kind) DO UPDATE SET
+                min_id = MIN(min_id, excluded.min_id),
+                max_id = MAX(max_id, excluded.max_id),
+                rows = rows + excluded.rows,
+                updated_at = excluded.updated_at
+        """, (name, table, start.isoformat(), end.isoformat(), min(ids), max(ids), len(ids), now))
+        partitions.append((name, start.isoformat(), end.isoformat()))
+    return rows[-1][0], len(rows)
+
+
+def archive_closed_periods(store: Optional[str], pause: float = 0,
+                           stopping: Optional[threading.Event] = None) -> int:
+    """
+    Chuyển mọi dòng của các tháng đã đóng sang archive, mỗi batch MIGRATION_BATCH_SIZE dòng là một
+    thao tác trên write queue. Dừng (lần lên lịch sau chạy tiếp) nếu store đang import.
+    Trả về số dòng đã chuyển.
+    Chặn thread hiện tại - không gọi trực tiếp từ event loop.
+    """
+    stopping = stopping or threading.Event()
+    cutoff = archive_cutoff(datetime.now(Config.get_timezone_info()).date())
+    started = time.perf_counter()
+    moved = 0
+    with db.use_store(store):
+        last_ids = db.read_sync(db.max_row_ids, ARCHIVE_TABLES)
+        try:
+            for table in ARCHIVE_TABLES:
+                after_id = 0
+                while not stopping.is_set():
+                    result = db.write_sync(archive_batch, table, cutoff, after_id, last_ids[table],
+                                           Config.MIGRATION_BATCH_SIZE)
+                    if result is None:
+                        break
+                    after_id, count = result
+                    moved += count
+                    if pause:
+                        stopping.wait(pause)
+        except db.ImportInProgress:
+            logger.info(f"Import running{f' ({store})' if store else ''} - archive postponed")
+    if moved:
+        logger.info(f"🗄️ Archived {moved:,} rows before {cutoff}{f' ({store})' if store else ''} "
+                    f"in {time.perf_counter() - started:.1f}s")
+    return moved
@@ -0,0 +1,332 @@
+"""
+Benchmark - Đo init_db, insert, /stats, tổng hợp báo cáo và xuất CSV trên dữ liệu giả lập
+
+    python benchmark.py --rows 100000 --save benchmarks/baseline.json
+    python benchmark.py --rows 100000 --compare benchmarks/baseline.json
+    python benchmark.py --rows 10000000 --db /tmp/bench-10m.db   # giữ lại DB để chạy lại nhanh
+
+Kết quả lưu dạng JSON (sort key, làm tròn) để so sánh bằng --compare hoặc git diff.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from config import Config
+import db
+from reports import build_report_file, format_summary, resolve_period
+
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = ["An", "Bình", "Chi", "Dung", "Giang", "Hà", "Hương", "Khánh", "Lan", "Linh", "Mai", "Nam",
+               "Ngọc", "Phương", "Quân", "Thảo", "Trang", "Tú", "Vy", "Yến"]
+LAST_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng"]
+SERVICES = ["Cắt tóc", "Gội đầu", "Nhuộm tóc", "Uốn tóc", "Duỗi tóc", "Massage", "Chăm sóc da", "Làm móng"]
+CATEGORIES = ["Mua nguyên liệu", "Điện nước", "Lương", "Tiền nhà", "Marketing", "Sửa chữa"]
+
+# Tỉ lệ chi phí so với hóa đơn trong dữ liệu giả lập
+EXPENSE_RATIO = 0.2
+INSERT_CHUNK = 50_000
+
+
+# ===========================
+# Sinh dữ liệu
+# ===========================
+def _iter_timestamps(rng: random.Random, total: int, start: date, end: date) -> Iterator[str]:
+    """Sinh `total` mốc thời gian tăng dần, rải đều theo ngày trong [start, end)"""
+    days = max(1, (end - start).days)
+    per_day, remainder = divmod(total, days)
+    for offset in range(days):
+        count = per_day + (1 if offset < remainder else 0)
+        day = start + timedelta(days=offset)
+        base = datetime(day.year, day.month, day.day, 8)
+        for seconds in sorted(rng.randrange(0, 14 * 3600) for _ in range(count)):
+            yield (base + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _sales_rows(rng: random.Random, total: int, start: date, end: date, customers: int) -> Iterator[tuple]:
+    phones = [f"09{rng.randrange(10 ** 8):08d}" for _ in range(customers)]
+    names = [f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}" for _ in range(customers)]
+    for created_at in _iter_timestamps(rng, total, start, end):
+        customer = rng.randrange(customers)
+        yield (names[customer], phones[customer], rng.choice(SERVICES), rng.randint(5, 500) * 1000,
+               "" if rng.random() < 0.7 else "Khách quen", created_at)
+
+
+def _expense_rows(rng: random.Random, total: int, start: date, end: date) -> Iterator[tuple]:
+    for created_at in _iter_timestamps(rng, total, start, end):
+        yield (rng.choice(CATEGORIES), float(rng.randint(10, 5000) * 1000), "", created_at)
+
+
+def _insert_chunks(table: str, columns: str, rows: Iterator[tuple]) -> int:
+    epoch = Config.DB_EPOCH_TIMESTAMPS
+    if epoch:
+        columns += ", created_ts, day_key"
+    placeholders = ", ".join("?" * len(columns.split(",")))
+    sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+    inserted = 0
+    chunk: List[tuple] = []
+
+    def flush():
+        with db.get_db() as conn:
+            conn.executemany(sql, chunk)
+
+    for row in rows:
+        chunk.append(row + db.time_columns(row[-1]) if epoch else row)
+        if len(chunk) >= INSERT_CHUNK:
+            flush()
+            inserted += len(chunk)
+            chunk = []
+    if chunk:
+        flush()
+        inserted += len(chunk)
+    return inserted
+
+
+def generate_data(rows: int, years: int, seed: int) -> Tuple[int, int]:
+    """Điền `rows` dòng (hóa đơn + chi phí) trải đều `years` năm tới hôm nay, rồi tạo lại rollup"""
+    rng = random.Random(seed)
+    end = datetime.now(Config.get_timezone_info()).date() + timedelta(days=1)
+    start = end - timedelta(days=365 * years)
+    expenses = int(rows * EXPENSE_RATIO)
+    sales = rows - expenses
+    customers = max(100, sales // 20)
+
+    started = time.perf_counter()
+    sales_inserted = _insert_chunks("sales", "name, phone, service, amount, note, created_at",
+                                    _sales_rows(rng, sales, start, end, customers))
+    expenses_inserted = _insert_chunks("expenses", "category, amount, note, created_at",
+                                       _expense_rows(rng, expenses, start, end))
+    with db.get_db() as conn:
+        db.rebuild_rollups(conn)
+    logger.info(f"Đã sinh {sales_inserted:,} hóa đơn + {expenses_inserted:,} chi phí "
+                f"({start} → {end}) trong {time.perf_counter() - started:.1f}s")
+    return sales_inserted, expenses_inserted
+
+
+# ===========================
+# Đo thời gian
+# ===========================
+def measure(fn: Callable[[], Any], repeat: int,
+            setup: Optional[Callable[[], Any]] = None) -> Tuple[Dict[str, float], Any]:
+    """Chạy fn `repeat` lần; setup (nếu có) chạy trước mỗi lần và không tính vào thời gian"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "runs": repeat,
+    }, result
+
+
+def _use_database(path: str):
+    db.shutdown()
+    Config.DB_NAME = path
+
+
+def bench_init_db(results: Dict[str, Any], repeat: int, db_path: str):
+    # Mỗi lần đo là một lần khởi động: shutdown() database đang mở nằm ngoài phần được đo
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = iter(os.path.join(tmp, f"init-{i}.db") for i in range(repeat))
+        results["init_db_empty"], _ = measure(db.init_db, repeat, setup=lambda: _use_database(next(paths)))
+        _use_database(db_path)
+
+    results["init_db_existing"], _ = measure(db.init_db, repeat, setup=lambda: _use_database(db_path))
+
+
+def bench_reads(results: Dict[str, Any], repeat: int, custom_days: int):
+    def stats():
+        with db.get_read_db() as conn:
+            return db.fetch_stats(conn)
+
+    results["stats"], _ = measure(stats, repeat)
+
+    today = datetime.now(Config.get_timezone_info()).date()
+    periods = {
+        "current": resolve_period("current"),
+        "previous": resolve_period("previous"),
+        "custom": resolve_period(None, today - timedelta(days=custom_days + 30), today - timedelta(days=31)),
+    }
+    for name, (start, end, period_text) in periods.items():
+        def summary():
+            with db.get_read_db() as conn:
+                return db.fetch_period_summary(conn, start, end)
+
+        results[f"report_{name}_summary"], period_summary = measure(summary, repeat)
+        _, profit_text = format_summary(period_summary, period_text)
+
+        def export_csv():
+            with db.get_read_db() as conn:
+                report_file, _ = build_report_file(conn, start, end, period_summary, profit_text)
+            try:
+                report_file.seek(0, os.SEEK_END)
+                return report_file.tell()
+            finally:
+                report_file.close()
+
+        results[f"report_{name}_csv"], size = measure(export_csv, max(1, repeat // 2))
+        results[f"report_{name}_csv"]["rows"] = period_summary["sales"]["count"] + period_summary["expenses"]["count"]
+        results[f"report_{name}_csv"]["bytes"] = size
+
+
+def bench_inserts(results: Dict[str, Any], count: int):
+    now = datetime.now(Config.get_timezone_info()).strftime("%Y-%m-%d %H:%M:%S")
+
+    def single_transactions():
+        for i in range(count // 10):
+            with db.get_db() as conn:
+                db.insert_sale(conn, "Bench", "0900000000", "Cắt tóc", 100000, "", now)
+
+    timing, _ = measure(single_transactions, 1)
+    timing["ops_per_s"] = round(count // 10 / (timing["median_ms"] / 1000), 1)
+    results["insert_sale_one_txn_each"] = timing
+
+    async def group_commit():
+        await asyncio.gather(*(
+            db.add_sale("Bench", "0900000000", "Cắt tóc", 100000, "", now) for _ in range(count)
+        ))
+
+    timing, _ = measure(lambda: asyncio.run(group_commit()), 1)
+    timing["ops_per_s"] = round(count / (timing["median_ms"] / 1000), 1)
+    results["insert_sale_group_commit"] = timing
+
+
+# ===========================
+# Lưu / so sánh kết quả
+# ===========================
+class BaselineMismatch(Exception):
+    """Baseline đo trên lượng dữ liệu khác: thời gian không so sánh được"""
+
+
+def compare(current: Dict[str, Any], baseline_path: str, threshold: float, min_delta_ms: float) -> int:
+    """In bảng so sánh với baseline, trả về số benchmark chậm hơn quá threshold %"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["meta"].get("rows") != current["meta"].get("rows"):
+        raise BaselineMismatch(f"baseline dùng {baseline['meta'].get('rows'):,} dòng, lần chạy này "
+                               f"{current['meta'].get('rows'):,} dòng (chạy lại với "
+                               f"--rows {baseline['meta'].get('rows')})")
+    regressions = 0
+    print(f"\n{'benchmark':<30}{'baseline':>12}{'hiện tại':>12}{'thay đổi':>10}")
+    for name, result in sorted(current["results"].items()):
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"{name:<30}{'-':>12}{result['median_ms']:>12.2f}{'mới':>10}")
+            continue
+        change = (result["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+        flag = ""
+        if abs(result["median_ms"] - old["median_ms"]) < min_delta_ms:
+            pass  # chênh lệch quá nhỏ, coi là nhiễu
+        elif change > threshold:
+            flag = "  ❌ chậm hơn"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  ✅ nhanh hơn"
+        print(f"{name:<30}{old['median_ms']:>12.2f}{result['median_ms']:>12.2f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database và báo cáo")
+    parser.add_argument("--rows", type=int, default=100_000, help="Tổng số dòng sales + expenses (10k - 10M)")
+    parser.add_argument("--years", type=int, default=3, help="Số năm dữ liệu, tính tới hôm nay")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi benchmark đọc")
+    parser.add_argument("--inserts", type=int, default=5000, help="Số insert cho benchmark ghi (0 = bỏ qua)")
+    parser.add_argument("--custom-days", type=int, default=90, help="Độ dài kỳ báo cáo tùy chỉnh")
+    parser.add_argument("--db", help="File database; nếu đã có dữ liệu thì dùng lại, không sinh lại")
+    parser.add_argument("--save", metavar="PATH", help="Lưu kết quả JSON (baseline)")
+    parser.add_argument("--compare", metavar="PATH", help="So sánh với baseline JSON")
+    parser.add_argument("--threshold", type=float, default=20, help="%% chậm hơn baseline coi là regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1, help="Bỏ qua chênh lệch nhỏ hơn N ms")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    Config.REPORT_RETENTION_DAYS = 0
+
+    tmp_dir = None
+    if args.db:
+        db_path = args.db
+    else:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="benchmark-")
+        db_path = os.path.join(tmp_dir.name, "bench.db")
+
+    results: Dict[str, Any] = {}
+    try:
+        _use_database(db_path)
+        db.init_db()
+        with db.get_read_db() as conn:
+            existing = db.fetch_stats(conn)
+        if existing["total_sales_count"] + existing["total_expenses_count"] == 0:
+            timing, _ = measure(lambda: generate_data(args.rows, args.years, args.seed), 1)
+            timing["rows_per_s"] = round(args.rows / (timing["median_ms"] / 1000), 1)
+            results["generate_data"] = timing
+        else:
+            logger.info(f"Dùng lại dữ liệu có sẵn trong {db_path}")
+
+        with db.get_read_db() as conn:
+            stats = db.fetch_stats(conn)
+
+        bench_init_db(results, args.repeat, db_path)
+        bench_reads(results, args.repeat, args.custom_days)
+        if args.inserts:
+            bench_inserts(results, args.inserts)
+    finally:
+        db.shutdown()
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    output = {
+        "meta": {
+            "rows": stats["total_sales_count"] + stats["total_expenses_count"],
+            "years": args.years,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "db_epoch_timestamps": Config.DB_EPOCH_TIMESTAMPS,
+            "db_journal_mode": Config.DB_JOURNAL_MODE,
+        },
+        "results": results,
+    }
+
+    print(f"\n{'benchmark':<30}{'median ms':>12}{'min ms':>12}{'max ms':>12}  khác")
+    for name, result in sorted(results.items()):
+        extra = ", ".join(f"{k}={v}" for k, v in result.items() if k not in ("median_ms", "min_ms", "max_ms", "runs"))
+        print(f"{name:<30}{result['median_ms']:>12.2f}{result['min_ms']:>12.2f}{result['max_ms']:>12.2f}  {extra}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+        print(f"\n💾 Đã lưu kết quả vào {args.save}")
+
+    if args.compare:
+        try:
+            regressions = compare(output, args.compare, args.threshold, args.min_delta_ms)
+        except BaselineMismatch as e:
+            print(f"\n❌ Không so sánh được với {args.compare}: {e}")
+            sys.exit(2)
+        if regressions:
+            print(f"\n❌ {regressions} benchmark chậm hơn baseline quá {args.threshold:g}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 # bot.py - Fixed & Improved Version
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 import logging
+from typing import Optional, Tuple
 from config import Config
-from handlers import start, echo, get_inbill_handler, get_expense_handler, get_report_handler
-from db import init_db
+from handlers import (start, echo, stats_command, get_inbill_handler, get_expense_handler, get_report_handler,
+                      get_import_handler, search_command, search_page_callback, subscribe_command,
+                      unsubscribe_command)
+from db import check_data_version, init_db, maintenance, shutdown as shutdown_db
+from customers import customer_directory
+from jobs import schedule_summaries
+from reports import report_workers
+from webhook import run_webhook
+from application import OrderedApplication
+from persistence import SQLitePersistence
+from instrumentation import InstrumentedRequest, instrument_application, start_metrics, stop_metrics
+from metrics import QUEUE_DEPTH
+from workers import DispatchApplication, WorkerPool
 
 # Logging với format đầy đủ hơn
 logging.basicConfig(
@@ -16,27 +28,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main():
-    """Hàm main khởi động bot"""
-    
-    # Validate cấu hình
-    if not Config.validate():
-        logger.error("❌ Cấu hình không hợp lệ! Vui lòng kiểm tra file .env")
-        return
-    
-    # Khởi tạo application
-    # Initialize DB (create file and tables if needed)
-    try:
-        init_db()
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize database: {e}")
-        return
+def _base_builder():
+    """ApplicationBuilder chung cho bot một process, process chính và worker"""
+    builder = (
+        ApplicationBuilder()
+        .token(Config.BOT_TOKEN)
+        # Đo thời gian từng lần gọi Bot API; endpoint /metrics mở cùng vòng đời app
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(start_metrics)
+        .post_shutdown(stop_metrics)
+    )
+    if Config.BOT_API_BASE_URL:
+        builder = builder.base_url(Config.BOT_API_BASE_URL)
+    if Config.BOT_API_BASE_FILE_URL:
+        builder = builder.base_file_url(Config.BOT_API_BASE_FILE_URL)
+    return builder
 
-    app = ApplicationBuilder().token(Config.BOT_TOKEN).build()
+async def _warm_caches(app: Application):
+    """post_init của Application đầy đủ handler: /metrics và index khách quen"""
+    await start_metrics(app)
+    # Bật sharding thì index của từng store được dựng khi store được dùng lần đầu
+    if not Config.DB_SHARDING:
+        await check_data_version()
+        customer_directory.warm(None)
+
+def create_application(updater: bool = True, worker: Optional[Tuple[int, int]] = None) -> Application:
+    """
+    Application đầy đủ handler; updater=False cho worker process (update do process chính gửi sang),
+    worker=(index, số worker) để chia chat nhận tóm tắt định kỳ giữa các worker
+    """
+    # Xử lý update song song, giữ thứ tự theo từng chat/user (ConversationHandler cần điều này)
+    builder = _base_builder().application_class(
+        OrderedApplication, kwargs={"max_concurrent_updates": Config.UPDATE_CONCURRENCY}
+    ).post_init(_warm_caches)
+    if not updater:
+        builder = builder.updater(None)
+    # Lưu trạng thái conversation vào SQLite (ghi gom theo PERSISTENCE_FLUSH_INTERVAL)
+    if Config.PERSISTENCE_ENABLED:
+        builder = builder.persistence(SQLitePersistence())
+    app = builder.build()
     
     # Handler /start
     app.add_handler(CommandHandler("start", start))
     
+    # Handler /stats - thống kê tổng quan
+    app.add_handler(CommandHandler("stats", stats_command))
+    
     # Handler /inbill (ConversationHandler) - BÂY GIỜ ĐÃ CHỨA CALLBACK
     app.add_handler(get_inbill_handler())
     
@@ -46,9 +83,58 @@ def main():
     # Handler /report (ConversationHandler) - BÂY GIỜ ĐÃ CHỨA CALLBACK
     app.add_handler(get_report_handler())
     
+    # Handler /import - import lịch sử từ file CSV
+    app.add_handler(get_import_handler())
+    
+    # Handler /search - tìm hóa đơn/chi phí (FTS5), nút chuyển trang
+    app.add_handler(CommandHandler("search", search_command))
+    app.add_handler(CallbackQueryHandler(search_page_callback, pattern="^search:"))
+    
+    # Handler /subscribe, /unsubscribe - nhận tóm tắt định kỳ (JobQueue, lúc SUMMARY_TIME)
+    app.add_handler(CommandHandler("subscribe", subscribe_command))
+    app.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    schedule_summaries(app, worker)
+    
     # Handler echo text (đặt cuối cùng để không conflict)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
     
+    # Đo latency của mọi handler (từng bước conversation) và độ dài hàng đợi
+    instrument_application(app)
+    return app
+
+def create_front_application(worker_pool: WorkerPool) -> Application:
+    """Application của process chính ở chế độ WORKERS > 0: chỉ nhận update và chia cho worker"""
+    app = _base_builder().application_class(DispatchApplication, kwargs={"worker_pool": worker_pool}).build()
+    QUEUE_DEPTH.set_function(app.update_queue.qsize, "updates")
+    return app
+
+def main():
+    """Hàm main khởi động bot"""
+    
+    # Validate cấu hình
+    if not Config.validate():
+        logger.error("❌ Cấu hình không hợp lệ! Vui lòng kiểm tra file .env")
+        return
+    
+    # Khởi tạo application
+    # Initialize DB (create file and tables if needed)
+    try:
+        init_db()
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize database: {e}")
+        return
+    # Backfill của migration và archive chạy nền theo batch trong khi bot phục vụ (process này là writer duy nhất)
+    maintenance.start()
+
+    worker_pool = None
+    if Config.WORKERS > 0:
+        # Handler chạy trong WORKERS process con; process này nhận update và là writer SQLite duy nhất
+        worker_pool = WorkerPool(Config.WORKERS)
+        worker_pool.start()
+        app = create_front_application(worker_pool)
+    else:
+        app = create_application()
+    
     # Thông báo khởi động
     logger.info("=" * 50)
     logger.info("🤖 Bot đang khởi động...")
@@ -56,10 +142,20 @@ def main():
     
     try:
         # Chạy bot
-        app.run_polling(drop_pending_updates=True)
+        if Config.RUN_MODE == "webhook":
+            run_webhook(app)
+        else:
+            app.run_polling(drop_pending_updates=Config.DROP_PENDING_UPDATES)
     except Exception as e:
         logger.error(f"❌ Lỗi khi chạy bot: {e}")
     finally:
+        # Dừng worker process (chúng còn ghi persistence qua process này nên dừng trước DB)
+        if worker_pool is not None:
+            worker_pool.stop()
+        # Dừng process pool báo cáo lớn
+        report_workers.shutdown()
+        # Ghi nốt write queue (group commit) rồi đóng thread pool và connection pool
+        shutdown_db()
         logger.info("🛑 Bot đã dừng.")
 
 if __name__ == "__main__":
@@ -2,8 +2,10 @@
 Configuration module - Quản lý tất cả cấu hình của ứng dụng
 """
 import os
+import re
 import logging
-from typing import Optional
+from datetime import datetime, time
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -17,21 +19,114 @@ class Config:
     
     # Telegram Bot
     BOT_TOKEN: Optional[str] = os.getenv("BOT_TOKEN")
+    # Bot API server khác (self-hosted hoặc fake_bot_api.py khi load test), vd. http://127.0.0.1:8081/bot
+    BOT_API_BASE_URL: Optional[str] = os.getenv("BOT_API_BASE_URL")
+    BOT_API_BASE_FILE_URL: Optional[str] = os.getenv("BOT_API_BASE_FILE_URL")
+    RUN_MODE: str = os.getenv("RUN_MODE", "polling").lower()  # polling | webhook
+    # Bỏ qua các update tồn đọng khi khởi động (mặc định giữ lại để không mất đơn)
+    DROP_PENDING_UPDATES: bool = os.getenv("DROP_PENDING_UPDATES", "false").lower() in ("1", "true", "yes")
+    # Số update xử lý song song tối đa (update cùng chat/user vẫn tuần tự); 1 = tuần tự hoàn toàn
+    UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+    # Số worker process xử lý update (chia theo user id); 0 = chạy mọi thứ trong một process
+    WORKERS: int = int(os.getenv("WORKERS", "0"))
+    
+    # Lưu trạng thái conversation/user_data vào database (khởi động lại không mất bill đang nhập)
+    PERSISTENCE_ENABLED: bool = os.getenv("PERSISTENCE_ENABLED", "true").lower() in ("1", "true", "yes")
+    PERSISTENCE_FLUSH_INTERVAL: float = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "5"))  # giây
+    PERSISTENCE_TTL_HOURS: int = int(os.getenv("PERSISTENCE_TTL_HOURS", "24"))  # bỏ thao tác dở quá hạn
+    
+    # Webhook (RUN_MODE=webhook)
+    WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "telegram")
+    # URL công khai (https://domain[:port]) để gọi setWebhook; để trống khi test local
+    WEBHOOK_URL: Optional[str] = os.getenv("WEBHOOK_URL")
+    WEBHOOK_SECRET_TOKEN: Optional[str] = os.getenv("WEBHOOK_SECRET_TOKEN")
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
     
     # Database
     DB_NAME: str = os.getenv("DB_NAME", "sales.db")
+    DB_READ_WORKERS: int = int(os.getenv("DB_READ_WORKERS", "4"))  # = số reader connection
+    DB_JOURNAL_MODE: str = os.getenv("DB_JOURNAL_MODE", "WAL")
+    DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE", "-16000"))  # âm = KiB
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    # Lưu thêm created_ts (epoch) + day_key (YYYYMMDD) để lọc theo thời gian bằng số nguyên
+    DB_EPOCH_TIMESTAMPS: bool = os.getenv("DB_EPOCH_TIMESTAMPS", "false").lower() in ("1", "true", "yes")
+    # Group commit: gom tối đa N thao tác ghi hoặc chờ tối đa X ms cho mỗi transaction
+    DB_WRITE_BATCH_SIZE: int = int(os.getenv("DB_WRITE_BATCH_SIZE", "200"))
+    DB_WRITE_BATCH_DELAY_MS: float = float(os.getenv("DB_WRITE_BATCH_DELAY_MS", "5"))
+    # Sharding: mỗi chat (hoặc cửa hàng theo DB_STORES) một file SQLite riêng trong DB_SHARD_DIR
+    DB_SHARDING: bool = os.getenv("DB_SHARDING", "false").lower() in ("1", "true", "yes")
+    DB_SHARD_DIR: str = os.getenv("DB_SHARD_DIR", "stores")
+    DB_SHARD_MAX_OPEN: int = int(os.getenv("DB_SHARD_MAX_OPEN", "16"))  # số file store mở cùng lúc
+    DB_SHARD_READERS: int = int(os.getenv("DB_SHARD_READERS", "2"))  # reader connection mỗi store
+    # Gộp nhiều chat vào một cửa hàng: "chat_id:store,chat_id:store" (chat khác dùng store chat_<id>)
+    DB_STORES: str = os.getenv("DB_STORES", "")
     
     # VietQR Bank Configuration
     BANK_CODE: str = os.getenv("BANK_CODE", "MB")
     BANK_ACCOUNT: Optional[str] = os.getenv("BANK_ACCOUNT")
+    # Mã BIN (NAPAS) của ngân hàng; để trống thì tra theo BANK_CODE
+    BANK_BIN: Optional[str] = os.getenv("BANK_BIN")
+    QR_CACHE_SIZE: int = int(os.getenv("QR_CACHE_SIZE", "256"))
+    QR_FILE_ID_TTL_DAYS: int = int(os.getenv("QR_FILE_ID_TTL_DAYS", "30"))
+    
+    # Metrics (Prometheus text format tại http://METRICS_LISTEN:METRICS_PORT/metrics)
+    METRICS_LISTEN: str = os.getenv("METRICS_LISTEN", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9108"))  # 0 = tắt
     
     # Logging
     LOG_FILE: str = os.getenv("LOG_FILE", "bot.log")
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # Report export
+    REPORT_DIR: str = os.getenv("REPORT_DIR", "report")
+    REPORT_RETENTION_DAYS: int = int(os.getenv("REPORT_RETENTION_DAYS", "0"))  # 0 = không lưu file ra đĩa
+    REPORT_GZIP: bool = os.getenv("REPORT_GZIP", "false").lower() in ("1", "true", "yes")
+    REPORT_FETCH_SIZE: int = int(os.getenv("REPORT_FETCH_SIZE", "1000"))
+    REPORT_SPOOL_MAX_BYTES: int = int(os.getenv("REPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+    # Báo cáo từ REPORT_PROCESS_MIN_ROWS dòng trở lên được tạo trong process pool riêng
+    REPORT_PROCESS_MIN_ROWS: int = int(os.getenv("REPORT_PROCESS_MIN_ROWS", "20000"))
+    REPORT_WORKERS: int = int(os.getenv("REPORT_WORKERS", "2"))
+    REPORT_MAX_PER_USER: int = int(os.getenv("REPORT_MAX_PER_USER", "1"))
+    REPORT_CACHE_SIZE: int = int(os.getenv("REPORT_CACHE_SIZE", "64"))  # 0 = tắt cache
+    # PTB 20.3 đọc cả file vào RAM khi upload; Bot API (cloud) cũng chỉ nhận file tối đa 50MB
+    REPORT_UPLOAD_MAX_MB: int = int(os.getenv("REPORT_UPLOAD_MAX_MB", "50"))
+    
+    # Gợi ý khách quen khi nhập hóa đơn (index trong RAM của khách có hóa đơn trong N ngày)
+    CUSTOMER_INDEX_DAYS: int = int(os.getenv("CUSTOMER_INDEX_DAYS", "365"))
+    CUSTOMER_SUGGESTIONS: int = int(os.getenv("CUSTOMER_SUGGESTIONS", "5"))  # số nút gợi ý tối đa
+    CUSTOMER_LAST_SERVICES: int = int(os.getenv("CUSTOMER_LAST_SERVICES", "3"))
+    
+    # Migration: backfill chạy nền theo batch (mỗi batch một transaction)
+    MIGRATION_BATCH_SIZE: int = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+    MIGRATION_BATCH_PAUSE_MS: float = float(os.getenv("MIGRATION_BATCH_PAUSE_MS", "50"))
+    
+    # Archive: chuyển dữ liệu các tháng đã đóng sang file ARCHIVE_DIR/<db>-<tháng|năm>.db (archive.py)
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+    ARCHIVE_PERIOD: str = os.getenv("ARCHIVE_PERIOD", "month")  # month | year
+    ARCHIVE_KEEP_MONTHS: int = int(os.getenv("ARCHIVE_KEEP_MONTHS", "2"))  # gồm tháng hiện tại
+    # Rỗng = thư mục archive/ cạnh DB_NAME (cùng volume với database, như DB_SHARD_DIR trong docker-compose)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "")
+    ARCHIVE_INTERVAL_HOURS: float = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+    
+    # /search: số kết quả mỗi trang
+    SEARCH_PAGE_SIZE: int = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+    
+    # Import CSV (/import và `python db.py import`)
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "50000"))
+    IMPORT_MAX_FILE_MB: int = int(os.getenv("IMPORT_MAX_FILE_MB", "20"))  # Bot API chỉ cho tải file ≤ 20MB
+    
     # Timezone
     TIMEZONE_OFFSET_HOURS: int = int(os.getenv("TIMEZONE_OFFSET_HOURS", "7"))
     
+    # Tóm tắt định kỳ (jobs.py, cần python-telegram-bot[job-queue]): giờ "HH:MM" theo TIMEZONE_OFFSET_HOURS,
+    # nên đặt ngoài giờ cao điểm; rỗng = tắt. SUMMARY_DAYS: thứ trong tuần, 0 = Chủ nhật ... 6 = Thứ bảy
+    SUMMARY_TIME: str = os.getenv("SUMMARY_TIME", "06:00")
+    SUMMARY_DAYS: str = os.getenv("SUMMARY_DAYS", "0,1,2,3,4,5,6")
+    
     @classmethod
     def validate(cls) -> bool:
         """
@@ -43,6 +138,33 @@ class Config:
         if not cls.BOT_TOKEN or cls.BOT_TOKEN == "YOUR_TOKEN_HERE":
             errors.append("BOT_TOKEN chưa được cấu hình")
         
+        if cls.RUN_MODE not in ("polling", "webhook"):
+            errors.append(f"RUN_MODE không hợp lệ: {cls.RUN_MODE} (polling | webhook)")
+        
+        if cls.WORKERS < 0:
+            errors.append(f"WORKERS không hợp lệ: {cls.WORKERS} (>= 0)")
+        
+        if cls.MIGRATION_BATCH_SIZE < 1:
+            errors.append(f"MIGRATION_BATCH_SIZE không hợp lệ: {cls.MIGRATION_BATCH_SIZE} (>= 1)")
+        
+        if cls.ARCHIVE_PERIOD not in ("month", "year"):
+            errors.append(f"ARCHIVE_PERIOD không hợp lệ: {cls.ARCHIVE_PERIOD} (month | year)")
+        
+        if cls.ARCHIVE_KEEP_MONTHS < 1 or cls.ARCHIVE_INTERVAL_HOURS <= 0:
+            errors.append(f"ARCHIVE_KEEP_MONTHS/ARCHIVE_INTERVAL_HOURS không hợp lệ: "
+                          f"{cls.ARCHIVE_KEEP_MONTHS}/{cls.ARCHIVE_INTERVAL_HOURS} (>= 1, > 0)")
+        
+        try:
+            cls.get_store_map()
+        except ValueError as e:
+            errors.append(f"DB_STORES không hợp lệ: {e}")
+        
+        try:
+            cls.get_summary_schedule()
+        except ValueError:
+            errors.append(f"SUMMARY_TIME/SUMMARY_DAYS không hợp lệ: {cls.SUMMARY_TIME!r}/{cls.SUMMARY_DAYS!r} "
+                          f"(HH:MM, danh sách 0-6)")
+        
         if not cls.BANK_ACCOUNT:
             logger.warning("BANK_ACCOUNT chưa được cấu hình - QR code có thể không hoạt động")
         
@@ -53,6 +175,36 @@ class Config:
         
         return True
     
+    @classmethod
+    def get_store_map(cls) -> Dict[int, str]:
+        """Parse DB_STORES thành {chat_id: tên store}"""
+        stores: Dict[int, str] = {}
+        for item in filter(None, (part.strip() for part in cls.DB_STORES.split(","))):
+            chat_id, _, store = item.partition(":")
+            store = store.strip()
+            if not re.fullmatch(r"[\w-]+", store):
+                raise ValueError(f"tên store không hợp lệ: {item!r}")
+            stores[int(chat_id)] = store
+        return stores
+    
+    @classmethod
+    def get_summary_schedule(cls) -> Optional[Tuple[time, Tuple[int, ...]]]:
+        """(giờ gửi có timezone, các thứ trong tuần) của tóm tắt định kỳ; None nếu SUMMARY_TIME rỗng"""
+        if not cls.SUMMARY_TIME.strip():
+            return None
+        at = datetime.strptime(cls.SUMMARY_TIME.strip(), "%H:%M").time().replace(tzinfo=cls.get_timezone_info())
+        days = tuple(sorted({int(day) for day in cls.SUMMARY_DAYS.split(",") if day.strip()}))
+        if not days or not all(0 <= day <= 6 for day in days):
+            raise ValueError(cls.SUMMARY_DAYS)
+        return at, days
+    
+    @classmethod
+    def get_archive_dir(cls) -> str:
+        """Thư mục chứa file archive: ARCHIVE_DIR, mặc định <thư mục của DB_NAME>/archive"""
+        if cls.ARCHIVE_DIR.strip():
+            return cls.ARCHIVE_DIR.strip()
+        return os.path.join(os.path.dirname(cls.DB_NAME), "archive")
+
     @classmethod
     def get_timezone_info(cls):
         """Lấy thông tin timezone"""
@@ -0,0 +1,266 @@
+"""
+Customers module - Tra cứu khách quen (SĐT, tên, dịch vụ gần nhất) bằng index prefix trong RAM
+"""
+import asyncio
+import bisect
+import logging
+import sqlite3
+import unicodedata
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from config import Config
+from db import (add_sale_listener, add_write_listener, check_data_version, current_store, fetch_customer_rows,
+                iter_recent_customer_rows, run_read, use_store)
+
+logger = logging.getLogger(__name__)
+
+
+def _fold_table() -> Dict[int, str]:
+    # Chữ Latin có dấu (gồm khối tiếng Việt U+1Exx) -> chữ gốc; dấu rời (tổ hợp) bị xóa
+    table = {ord("đ"): "d", ord("Đ"): "D"}
+    for code in list(range(0xC0, 0x250)) + list(range(0x1E00, 0x1F00)):
+        base = "".join(ch for ch in unicodedata.normalize("NFD", chr(code)) if not unicodedata.combining(ch))
+        if base and base != chr(code):
+            table[code] = base
+    table.update((code, None) for code in range(0x300, 0x370))
+    return table
+
+
+_FOLD = _fold_table()
+
+
+def normalize_name(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d) để "nguyen" khớp "Nguyễn" """
+    return " ".join(text.lower().translate(_FOLD).split())
+
+
+def _name_keys(name: str, phone: str) -> List[str]:
+    """
+    Key theo từng từ của tên: "Nguyễn Thị Lan" -> "nguyen thi lan\0<SĐT>", "thi lan\0<SĐT>", "lan\0<SĐT>"
+    (chuỗi thay vì tuple: sort nhanh hơn, ít RAM hơn)
+    """
+    words = normalize_name(name).split()
+    return [f"{' '.join(words[i:])}\0{phone}" for i in range(len(words))]
+
+
+class Customer:
+    __slots__ = ("phone", "name", "services", "last_seen")
+
+    def __init__(self, phone: str, name: str, last_seen: str):
+        self.phone = phone
+        self.name = name
+        self.services: List[str] = []  # mới nhất trước
+        self.last_seen = last_seen
+
+    def add_service(self, service: str):
+        if service in self.services:
+            self.services.remove(service)
+        self.services.insert(0, service)
+        del self.services[Config.CUSTOMER_LAST_SERVICES:]
+
+
+class CustomerIndex:
+    """
+    Khách có hóa đơn trong CUSTOMER_INDEX_DAYS ngày gần nhất: dict SĐT -> Customer cộng hai list
+    đã sắp xếp (SĐT; "tên không dấu\0SĐT") để tìm theo prefix bằng bisect - O(log n) mỗi lần tìm.
+    Chỉ dùng trên event loop; index đầy đủ được dựng trên thread đọc rồi mới gán vào.
+    """
+
+    def __init__(self, customers: Dict[str, Customer] = None):
+        self._customers = customers or {}
+        self._phones = sorted(self._customers)
+        self._names = sorted(key for c in self._customers.values() for key in _name_keys(c.name, c.phone))
+
+    def __len__(self) -> int:
+        return len(self._customers)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, str, str, str]]) -> "CustomerIndex":
+        """Dựng index từ các dòng (phone, name, service, created_at) theo thứ tự thời gian tăng dần"""
+        customers: Dict[str, Customer] = {}
+        for phone, name, service, created_at in rows:
+            customer = customers.get(phone)
+            if customer is None:
+                customer = customers[phone] = Customer(phone, name, created_at)
+            customer.name = name
+            customer.last_seen = created_at
+            customer.add_service(service)
+        return cls(customers)
+
+    def get(self, phone: str) -> Optional[Customer]:
+        return self._customers.get(phone)
+
+    def _add_name_keys(self, customer: Customer):
+        for key in _name_keys(customer.name, customer.phone):
+            bisect.insort(self._names, key)
+
+    def _remove_name_keys(self, customer: Customer):
+        for key in _name_keys(customer.name, customer.phone):
+            i = bisect.bisect_left(self._names, key)
+            if i < len(self._names) and self._names[i] == key:
+                del self._names[i]
+
+    def remember(self, name: str, phone: str, service: str, seen: str):
+        """Cập nhật ngay sau khi lưu hóa đơn"""
+        customer = self._customers.get(phone)
+        if customer is None:
+            customer = self._customers[phone] = Customer(phone, name, seen)
+            bisect.insort(self._phones, phone)
+            self._add_name_keys(customer)
+        elif customer.name != name:
+            self._remove_name_keys(customer)
+            customer.name = name
+            self._add_name_keys(customer)
+        customer.last_seen = seen
+        customer.add_service(service)
+
+    def _most_recent(self, phones: Iterator[str], limit: int) -> List[Customer]:
+        # Lấy dư rồi chọn khách gần đây nhất
+        found: Dict[str, Customer] = {}
+        for phone in phones:
+            found.setdefault(phone, self._customers[phone])
+            if len(found) >= limit * 4:
+                break
+        return sorted(found.values(), key=lambda c: c.last_seen, reverse=True)[:limit]
+
+    def search_phone(self, prefix: str, limit: int) -> List[Customer]:
+        def matches() -> Iterator[str]:
+            for i in range(bisect.bisect_left(self._phones, prefix), len(self._phones)):
+                if not self._phones[i].startswith(prefix):
+                    return
+                yield self._phones[i]
+        return self._most_recent(matches(), limit)
+
+    def search_name(self, prefix: str, limit: int) -> List[Customer]:
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+
+        def matches() -> Iterator[str]:
+            for i in range(bisect.bisect_left(self._names, prefix), len(self._names)):
+                key = self._names[i]
+                if not key.startswith(prefix):
+                    return
+                yield key.rpartition("\0")[2]
+        return self._most_recent(matches(), limit)
+
+
+def build_customer_index(conn: sqlite3.Connection, since: date) -> CustomerIndex:
+    """Chạy trên thread đọc: dựng index từ các hóa đơn kể từ `since`"""
+    return CustomerIndex.from_rows(iter_recent_customer_rows(conn, since))
+
+
+class CustomerDirectory:
+    """
+    CustomerIndex theo store (LRU, tối đa DB_SHARD_MAX_OPEN store). Index được dựng ở nền
+    lần đầu store được dùng; trong lúc dựng, tra SĐT đi thẳng vào DB (index idx_sales_phone),
+    chưa có gợi ý theo prefix, và hóa đơn mới được giữ lại để thêm vào index khi dựng xong.
+    """
+
+    def __init__(self, max_stores: int):
+        self._max_stores = max(1, max_stores)
+        self._indexes: "OrderedDict[Optional[str], CustomerIndex]" = OrderedDict()
+        self._warming: Dict[Optional[str], asyncio.Task] = {}
+        # Tăng mỗi lần invalidate: index đang dựng dở từ dữ liệu cũ bị bỏ
+        self._generations: Dict[Optional[str], int] = defaultdict(int)
+        self._pending_sales: Dict[Optional[str], List[Tuple[str, str, str, str]]] = {}
+
+    def warm(self, store: Optional[str]) -> asyncio.Task:
+        """Bắt đầu dựng index của store ở nền (nếu chưa có)"""
+        task = self._warming.get(store)
+        if task is None:
+            self._pending_sales[store] = []
+            task = asyncio.create_task(self._build(store, self._generations[store]))
+            self._warming[store] = task
+        return task
+
+    async def _build(self, store: Optional[str], generation: int):
+        since = (datetime.now(Config.get_timezone_info()) - timedelta(days=Config.CUSTOMER_INDEX_DAYS))
+        try:
+            with use_store(store):
+                index = await run_read(build_customer_index, since.date())
+        except Exception as e:
+            logger.error(f"Không dựng được index khách hàng: {e}", exc_info=True)
+            index = None
+        if generation != self._generations[store]:
+            # invalidate() trong lúc dựng: lần dựng mới đã thay chỗ lần này
+            return
+        del self._warming[store]
+        pending = self._pending_sales.pop(store)
+        if index is None:
+            return
+        for sale in pending:
+            index.remember(*sale)
+        self._indexes[store] = index
+        self._indexes.move_to_end(store)
+        while len(self._indexes) > self._max_stores:
+            self._indexes.popitem(last=False)
+        logger.info(f"👥 Index khách hàng{f' ({store})' if store else ''}: {len(index):,} khách")
+
+    def get(self, store: Optional[str]) -> Optional[CustomerIndex]:
+        index = self._indexes.get(store)
+        if index is None:
+            self.warm(store)
+            return None
+        self._indexes.move_to_end(store)
+        return index
+
+    def remember(self, store: Optional[str], name: str, phone: str, service: str, seen: str):
+        """Thêm hóa đơn vừa lưu vào index của store (đang dựng: thêm sau khi dựng xong; chưa dùng: bỏ qua)"""
+        index = self._indexes.get(store)
+        if index is not None:
+            index.remember(name, phone, service, seen)
+        elif store in self._pending_sales:
+            self._pending_sales[store].append((name, phone, service, seen))
+
+    def invalidate(self, store: Optional[str]):
+        """Dữ liệu thay đổi hàng loạt (import): bỏ index, dựng lại khi cần (đang dựng dở thì dựng lại ngay)"""
+        self._generations[store] += 1
+        self._indexes.pop(store, None)
+        if self._warming.pop(store, None) is not None:
+            self.warm(store)
+
+
+customer_directory = CustomerDirectory(Config.DB_SHARD_MAX_OPEN)
+# Import (day=None) có thể thêm khách bất kỳ: dựng lại index của store
+add_write_listener(lambda kind, day: kind == "sales" and day is None and customer_directory.invalidate(current_store()))
+
+
+async def find_customer(phone: str) -> Optional[Customer]:
+    """Khách quen theo SĐT của store hiện tại (None nếu chưa từng có hóa đơn gần đây)"""
+    await check_data_version()
+    index = customer_directory.get(current_store())
+    if index is not None:
+        return index.get(phone)
+    # Index chưa sẵn sàng: tra DB theo idx_sales_phone
+    rows = await run_read(fetch_customer_rows, phone, Config.CUSTOMER_LAST_SERVICES * 4)
+    if not rows:
+        return None
+    name, _, created_at = rows[0]
+    customer = Customer(phone, name, created_at)
+    for _, service, _ in reversed(rows):
+        customer.add_service(service)
+    return customer
+
+
+def suggest_customers(text: str) -> List[Customer]:
+    """Khách quen có SĐT (nếu text là số) hoặc tên bắt đầu bằng text"""
+    index = customer_directory.get(current_store())
+    if index is None:
+        return []
+    digits = text.replace(" ", "")
+    if digits.isdigit():
+        return index.search_phone(digits, Config.CUSTOMER_SUGGESTIONS)
+    return index.search_name(text, Config.CUSTOMER_SUGGESTIONS)
+
+
+def remember_sale(name: str, phone: str, service: str, created_at: str):
+    """
+    Sale listener: cập nhật index sau khi lưu hóa đơn. Ở chế độ WORKERS > 0 worker chuyển hóa đơn
+    cho các worker khác (workers.py) nên khách mới có trong gợi ý ở mọi worker.
+    """
+    customer_directory.remember(current_store(), name, phone, service, created_at)
+
+
+add_sale_listener(remember_sale)
@@ -1,115 +1,1664 @@
 # db.py - Database Management Module
 import sqlite3
+import asyncio
+import functools
+import heapq
+import itertools
+import json
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Generator, Optional, Dict, Any
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Generator, Iterator, Optional, Dict, Any, Callable, List, Tuple, TypeVar
 import logging
 from config import Config
+from metrics import DB_CALL_SECONDS, DB_ERRORS, DB_EXEC_SECONDS, QUEUE_DEPTH
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Mọi truy cập sqlite3 từ handler đều đi qua write queue (1 thread ghi) hoặc
+# thread pool đọc để event loop không bị block.
+_read_executor: Optional[ThreadPoolExecutor] = None
+
+def connect(db_name: str, readonly: bool) -> sqlite3.Connection:
+    """Mở connection SQLite với các pragma từ Config (readonly=True: mode=ro, query_only)"""
+    if readonly:
+        uri = f"{Path(db_name).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+    else:
+        conn = sqlite3.connect(db_name, check_same_thread=False,
+                               timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+        # journal_mode được lưu trong file, chỉ writer cần đặt
+        conn.execute(f"PRAGMA journal_mode={Config.DB_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous={Config.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA cache_size={int(Config.DB_CACHE_SIZE)}")
+    conn.execute(f"PRAGMA mmap_size={int(Config.DB_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+class ConnectionPool:
+    """
+    Pool connection SQLite dùng lâu dài:
+    - 1 writer connection (bật WAL), dùng tuần tự qua lock
+    - N reader connection chỉ đọc, chạy song song với writer nhờ WAL
+    writable=False (worker process): không mở writer, mọi thao tác ghi đi qua process chính.
+    """
+
+    def __init__(self, db_name: str, readers: int, writable: bool = True):
+        self.db_name = db_name
+        self._write_lock = threading.Lock()
+        self._writer = connect(db_name, readonly=False) if writable else None
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._all_readers: List[sqlite3.Connection] = []
+        for _ in range(max(1, readers)):
+            conn = connect(db_name, readonly=True)
+            self._all_readers.append(conn)
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Generator[sqlite3.Connection, None, None]:
+        """Mượn writer connection, tự commit/rollback"""
+        with self._write_lock:
+            conn = self._writer
+            if conn is None:
+                raise RuntimeError(f"{self.db_name} mở ở chế độ chỉ đọc (worker process)")
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Database error: {e}")
+                raise e
+
+    @contextmanager
+    def reader(self) -> Generator[sqlite3.Connection, None, None]:
+        """Mượn một reader connection, trả lại pool sau khi dùng"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            # Kết thúc read transaction (nếu có) để WAL checkpoint không bị giữ lại
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+        for conn in self._all_readers:
+            conn.close()
+
+
+class Database:
+    """Một file SQLite: connection pool + write queue (thread ghi) riêng"""
+
+    def __init__(self, db_name: str, readers: int, name: str = "db-writer", writable: bool = True):
+        self.db_name = db_name
+        self.pool = ConnectionPool(db_name, readers, writable)
+        self.write_queue = (
+            WriteQueue(self.pool, Config.DB_WRITE_BATCH_SIZE, Config.DB_WRITE_BATCH_DELAY_MS, name) if writable else None
+        )
+        # Số thao tác đang dùng database này (shard chỉ được đóng khi = 0)
+        self.active = 0
+
+    def close(self):
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self.pool.close()
+
+
+# ===========================
+# Store sharding
+# ===========================
+# Store của update đang xử lý (OrderedApplication đặt theo chat); None = database chính
+_current_store: ContextVar[Optional[str]] = ContextVar("db_store", default=None)
+
+def current_store() -> Optional[str]:
+    return _current_store.get()
+
+@contextmanager
+def use_store(store: Optional[str]) -> Generator[None, None, None]:
+    """Mọi truy cập DB trong khối (và task tạo trong khối) đi tới file của store này"""
+    token = _current_store.set(store)
+    try:
+        yield
+    finally:
+        _current_store.reset(token)
+
+def store_for_chat(chat_id: Optional[int]) -> Optional[str]:
+    """Store của chat: theo DB_STORES, mặc định chat_<id>; None khi tắt sharding"""
+    if not Config.DB_SHARDING or chat_id is None:
+        return None
+    return _store_map().get(chat_id, f"chat_{chat_id}")
+
+@functools.lru_cache(maxsize=1)
+def _store_map() -> Dict[int, str]:
+    return Config.get_store_map()
+
+def db_path_for(store: Optional[str]) -> str:
+    if store is None:
+        return Config.DB_NAME
+    return str(Path(Config.DB_SHARD_DIR) / f"{store}.db")
+
+
+class StoreRouter:
+    """
+    Database chính (Config.DB_NAME) và LRU tối đa DB_SHARD_MAX_OPEN file store đang mở.
+    Store được tạo (init_db) ở lần truy cập đầu; store ít dùng nhất bị đóng khi vượt giới hạn,
+    trừ khi đang có thao tác dùng nó (khi đó đóng ở lần sau).
+    Trong worker process (writable=False) chỉ mở reader; store mới do process chính tạo.
+    """
+
+    def __init__(self, max_open: int):
+        self.writable = True
+        self._max_open = max(1, max_open)
+        self._main: Optional[Database] = None
+        self._stores: "OrderedDict[str, Database]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_open(self, store: Optional[str]) -> bool:
+        return self._main is not None if store is None else store in self._stores
+
+    def _open(self, store: Optional[str]) -> Database:
+        if store is None:
+            if self._main is None:
+                self._main = Database(Config.DB_NAME, Config.DB_READ_WORKERS, writable=self.writable)
+            return self._main
+        database = self._stores.get(store)
+        if database is not None:
+            self._stores.move_to_end(store)
+            return database
+        if self.writable:
+            Path(Config.DB_SHARD_DIR).mkdir(parents=True, exist_ok=True)
+            database = Database(db_path_for(store), Config.DB_SHARD_READERS, f"db-writer-{store}")
+            init_db(database.pool, store)
+        else:
+            if not Path(db_path_for(store)).exists():
+                submit_write(store, create_schema).result()
+            database = Database(db_path_for(store), Config.DB_SHARD_READERS, writable=False)
+        self._stores[store] = database
+        return database
+
+    def _evict(self, keep: Optional[str] = None):
+        for store in list(self._stores):
+            if len(self._stores) <= self._max_open:
+                break
+            database = self._stores[store]
+            if database.active == 0 and store != keep:
+                del self._stores[store]
+                database.close()
+                logger.info(f"Closed store database {store}")
+
+    def open(self, store: Optional[str]):
+        """Mở sẵn database của store (chạy trên thread riêng để không block event loop)"""
+        with self._lock:
+            self._open(store)
+            self._evict(keep=store)
+
+    def checkout(self, store: Optional[str]) -> Database:
+        """Mượn database của store (phải release); không bị đóng khi đang mượn"""
+        with self._lock:
+            database = self._open(store)
+            database.active += 1
+            self._evict()
+            return database
+
+    def release(self, database: Database):
+        # Không đóng store ở đây: release có thể chạy trên chính thread ghi của store
+        with self._lock:
+            database.active -= 1
+
+    @contextmanager
+    def acquire(self, store: Optional[str]) -> Generator[Database, None, None]:
+        database = self.checkout(store)
+        try:
+            yield database
+        finally:
+            self.release(database)
+
+    def stores(self) -> List[Optional[str]]:
+        """Các store đang mở (None = database chính)"""
+        with self._lock:
+            return ([None] if self._main is not None else []) + list(self._stores)
+
+    def databases(self) -> List[Database]:
+        with self._lock:
+            return ([self._main] if self._main is not None else []) + list(self._stores.values())
+
+    def close(self):
+        with self._lock:
+            for database in ([self._main] if self._main is not None else []) + list(self._stores.values()):
+                database.close()
+            self._main = None
+            self._stores.clear()
+
+
+router = StoreRouter(Config.DB_SHARD_MAX_OPEN)
+
 @contextmanager
 def get_db() -> Generator[sqlite3.Connection, None, None]:
     """
-    Context manager để quản lý database connection an toàn
+    Context manager để quản lý database connection an toàn (writer connection của store hiện tại)
     
     Sử dụng:
         with get_db() as conn:
             c = conn.cursor()
             c.execute(...)
     """
-    conn = sqlite3.connect(Config.DB_NAME)
-    try:
+    with router.acquire(current_store()) as database, database.pool.writer() as conn:
         yield conn
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Database error: {e}")
-        raise e
-    finally:
-        conn.close()
-
-def init_db():
-    """Khởi tạo database với các bảng cần thiết"""
-    with get_db() as conn:
-        c = conn.cursor()
-        
-        # Bảng sales (doanh thu)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                service TEXT NOT NULL,
-                amount INTEGER NOT NULL,
-                note TEXT,
-                created_at TEXT NOT NULL,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Bảng expenses (chi phí)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category TEXT NOT NULL,
-                amount REAL NOT NULL,
-                note TEXT,
-                created_at TEXT NOT NULL,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+
+@contextmanager
+def get_read_db() -> Generator[sqlite3.Connection, None, None]:
+    """Context manager lấy reader connection (chỉ đọc) của store hiện tại"""
+    with router.acquire(current_store()) as database, database.pool.reader() as conn:
+        yield conn
+
+def init_db(pool: Optional[ConnectionPool] = None, store: Optional[str] = None):
+    """
+    Khởi tạo database (mặc định: database của store hiện tại): chạy các migration chưa áp dụng,
+    backfill của chúng được giao cho maintenance chạy nền
+    """
+    if pool is None:
+        store = current_store()
+        with router.acquire(store) as database:
+            return init_db(database.pool, store)
+    with pool.writer() as conn:
+        pending = create_schema(conn)
+        if import_running(conn):
+            logger.warning(f"Database {pool.db_name} có import đang chạy hoặc bị dừng giữa chừng (index/trigger "
+                           f"của sales, expenses đang bị xóa); nếu không còn import nào: python db.py finish-import")
+    if pending:
+        maintenance.schedule(store)
+    logger.info("✅ Database initialized successfully")
+
+# ===========================
+# Migration
+# ===========================
+@dataclass(frozen=True)
+class Migration:
+    """
+    Một phiên bản schema. apply(conn) chạy khi mở database, trong transaction chung với các
+    migration khác nên chỉ nên chứa DDL nhanh; trả về id lớn nhất cần backfill (0 = không cần).
+    backfill(conn, sau id, tới id, số dòng) xử lý một batch và trả về id cuối đã xử lý
+    (trả về `tới id` khi hết dòng) - chạy nền, mỗi batch một transaction, tiến độ lưu trong
+    schema_migrations nên bot dừng giữa chừng thì lần sau chạy tiếp.
+    """
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], Optional[int]]
+    backfill: Optional[Callable[[sqlite3.Connection, int, int, int], int]] = None
+
+def create_schema(conn: sqlite3.Connection) -> bool:
+    """Áp dụng các migration chưa chạy (trong transaction của conn); True nếu còn backfill chưa xong"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL,
+            backfill_cursor INTEGER NOT NULL DEFAULT 0,
+            backfill_target INTEGER NOT NULL DEFAULT 0,
+            completed_at TEXT
+        )
+    """)
+    applied = {version for (version,) in conn.execute("SELECT version FROM schema_migrations")}
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        target = migration.apply(conn) or 0
+        done = migration.backfill is None or target == 0
+        conn.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at, backfill_target, completed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (migration.version, migration.name, now, target, now if done else None)
+        )
+        logger.info(f"Applied migration {migration.version} ({migration.name})"
+                    + ("" if done else f", backfill {target} rows in background"))
+
+    # Chế độ schema theo cấu hình (bật/tắt được), không phải một phiên bản
+    if Config.DB_EPOCH_TIMESTAMPS:
+        for migration in EPOCH_MIGRATIONS:
+            _apply_config_migration(conn, migration, now)
+    if not conn.execute("SELECT 1 FROM stats_counters LIMIT 1").fetchone():
+        rebuild_stats_counters(conn)
+    return bool(pending_backfills(conn))
+
+def _apply_config_migration(conn: sqlite3.Connection, migration: Migration, now: str):
+    """
+    Migration theo cấu hình: apply mỗi lần mở database khi chế độ được bật. Nếu có dòng cần backfill
+    (lần đầu bật, hoặc dòng ghi lúc chế độ bị tắt) thì mở lại backfill nền: đang dở thì giữ tiến độ,
+    đã xong thì chạy lại từ đầu (backfill bỏ qua dòng đã có giá trị).
+    """
+    target = migration.apply(conn) or 0
+    c = conn.execute("""
+        INSERT INTO schema_migrations (version, name, applied_at, backfill_target, completed_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(version) DO UPDATE SET
+            backfill_cursor = CASE WHEN completed_at IS NULL THEN backfill_cursor ELSE 0 END,
+            backfill_target = MAX(backfill_target, excluded.backfill_target),
+            completed_at = NULL
+        WHERE excluded.completed_at IS NULL
+    """, (migration.version, migration.name, now, target, None if target else now))
+    if target and c.rowcount:
+        logger.info(f"Migration {migration.version} ({migration.name}): backfill up to id {target} in background")
+
+def pending_backfills(conn: sqlite3.Connection) -> List[int]:
+    return [version for (version,) in conn.execute(
+        "SELECT version FROM schema_migrations WHERE completed_at IS NULL ORDER BY version"
+    )]
+
+def run_backfill_batch(conn: sqlite3.Connection, version: int, batch_size: int) -> bool:
+    """Một batch backfill của migration `version` (gọi qua write queue); True khi đã backfill xong"""
+    row = conn.execute(
+        "SELECT backfill_cursor, backfill_target FROM schema_migrations WHERE version = ? AND completed_at IS NULL",
+        (version,)
+    ).fetchone()
+    if row is None:
+        return True
+    cursor, target = row
+    cursor = MIGRATIONS_BY_VERSION[version].backfill(conn, cursor, target, batch_size)
+    done = cursor >= target
+    conn.execute(
+        "UPDATE schema_migrations SET backfill_cursor = ?, completed_at = ? WHERE version = ?",
+        (cursor, datetime.now().strftime("%Y-%m-%d %H:%M:%S") if done else None, version)
+    )
+    return done
+
+def _migration_baseline(conn: sqlite3.Connection) -> None:
+    """Schema trước khi có migration (CREATE ... IF NOT EXISTS nên chạy được trên database cũ)"""
+    c = conn.cursor()
+    
+    # Bảng sales (doanh thu)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            service TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Bảng expenses (chi phí)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Tạo index để tăng tốc query
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sales_created_at 
+        ON sales(created_at)
+    """)
+    
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_expenses_created_at 
+        ON expenses(created_at)
+    """)
+
+    # Tra cứu khách quen theo SĐT (customers.py)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_phone ON sales(phone, created_at)")
+
+    # Bảng tổng hợp theo ngày (rollup), cập nhật cùng transaction với mỗi insert
+    rollup_exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_totals'"
+    ).fetchone()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            day TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            label TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, kind, label)
+        ) WITHOUT ROWID
+    """)
+    # Bộ đếm tổng (số bản ghi, tổng tiền) cho get_stats() O(1)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            kind TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount NUMERIC NOT NULL DEFAULT 0
+        )
+    """)
+    # Cache file_id Telegram của ảnh QR đã gửi
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS qr_file_ids (
+            cache_key TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    # Trạng thái ConversationHandler và user_data đang dở (persistence.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            conv_key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (name, conv_key)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+    if not rollup_exists:
+        rebuild_rollups(conn)
+
+def _migration_search_index(table: str) -> Callable[[sqlite3.Connection], int]:
+    def apply(conn: sqlite3.Connection) -> int:
+        # Trigger có từ lúc apply: chỉ các dòng đã có (id <= target) cần backfill
+        if not create_search_table(conn, table):
+            return 0
+        return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    return apply
+
+def _backfill_search_index(table: str) -> Callable[[sqlite3.Connection, int, int, int], int]:
+    return lambda conn, after_id, upto_id, limit: index_search_rows(conn, table, after_id, upto_id, limit)
+
+def _migration_archive_partitions(conn: sqlite3.Connection) -> None:
+    # Danh mục phân vùng archive (archive.py); kind = bảng nguồn
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive_partitions (
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            period_end TEXT NOT NULL,
+            min_id INTEGER NOT NULL DEFAULT 0,
+            max_id INTEGER NOT NULL DEFAULT 0,
+            rows INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (name, kind)
+        ) WITHOUT ROWID
+    """)
+
+def _migration_report_subscriptions(conn: sqlite3.Connection) -> None:
+    # Chat nhận tóm tắt định kỳ (jobs.py); dùng trong database chính như conversations/user_data
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS report_subscriptions (
+            chat_id INTEGER PRIMARY KEY,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+def _migration_import_state(conn: sqlite3.Connection) -> None:
+    # Import đang chạy (begin_import/finish_import): khóa trong chính file database nên mọi process
+    # ghi vào store (bot, worker qua process chính, CLI) đều thấy; lưu cách tạo lại index/trigger
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS import_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            statements TEXT NOT NULL,
+            last_ids TEXT NOT NULL,
+            started_at TEXT NOT NULL
+        )
+    """)
+
+def _migration_import_progress(conn: sqlite3.Connection) -> None:
+    # Tiến độ import theo file (insert_import_batch): dòng CSV cuối đã commit và số dòng đã ghi,
+    # ghi cùng transaction với batch để import lại cùng file chạy tiếp thay vì ghi trùng
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            line INTEGER NOT NULL,
+            sales INTEGER NOT NULL,
+            expenses INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+def _migration_data_version(conn: sqlite3.Connection) -> None:
+    # Tăng mỗi lần dữ liệu đổi hàng loạt (import, rebuild-rollups) - kể cả từ process khác như CLI:
+    # bot so sánh với giá trị đã thấy để xóa cache trong RAM (check_data_version)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+# Thêm migration mới ở cuối danh sách, không sửa/xóa migration đã phát hành
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", _migration_baseline),
+    Migration(2, "sales_fts", _migration_search_index("sales"), _backfill_search_index("sales")),
+    Migration(3, "expenses_fts", _migration_search_index("expenses"), _backfill_search_index("expenses")),
+    Migration(4, "archive_partitions", _migration_archive_partitions),
+    Migration(5, "report_subscriptions", _migration_report_subscriptions),
+    Migration(6, "import_state", _migration_import_state),
+    Migration(7, "import_progress", _migration_import_progress),
+    Migration(8, "data_version", _migration_data_version),
+]
+
+def _migration_epoch_timestamps(table: str) -> Callable[[sqlite3.Connection], int]:
+    def apply(conn: sqlite3.Connection) -> int:
+        # created_ts (epoch giây) + day_key (YYYYMMDD giờ VN); created_at (TEXT) vẫn giữ để hiển thị/xuất CSV
+        columns = _table_columns(conn, table)
+        added = "created_ts" not in columns
+        if added:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN created_ts INTEGER")
+        if "day_key" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN day_key INTEGER")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_created_ts ON {table}(created_ts)")
+        # Dòng chưa có created_ts nằm đầu idx_*_created_ts (NULL), theo id
+        where = "" if added else " WHERE created_ts IS NULL"
+        return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}{where}").fetchone()[0]
+    return apply
+
+def _backfill_epoch_timestamps(table: str) -> Callable[[sqlite3.Connection, int, int, int], int]:
+    def backfill(conn: sqlite3.Connection, after_id: int, upto_id: int, limit: int) -> int:
+        last_id = conn.execute(f"""
+            SELECT MAX(id) FROM (
+                SELECT id FROM {table} WHERE created_ts IS NULL AND id > ? AND id <= ? ORDER BY id LIMIT ?
             )
-        """)
-        
-        # Tạo index để tăng tốc query
-        c.execute("""
-            CREATE INDEX IF NOT EXISTS idx_sales_created_at 
-            ON sales(created_at)
-        """)
-        
-        c.execute("""
-            CREATE INDEX IF NOT EXISTS idx_expenses_created_at 
-            ON expenses(created_at)
-        """)
-        
-        logger.info("✅ Database initialized successfully")
+        """, (after_id, upto_id, limit)).fetchone()[0]
+        if last_id is None:
+            return upto_id
+        # created_at lưu giờ VN nên strftime('%s') (coi là UTC) phải trừ offset
+        conn.execute(f"""
+            UPDATE {table}
+            SET created_ts = CAST(strftime('%s', created_at) AS INTEGER) - ?,
+                day_key = CAST(strftime('%Y%m%d', created_at) AS INTEGER)
+            WHERE created_ts IS NULL AND id > ? AND id <= ?
+        """, (Config.TIMEZONE_OFFSET_HOURS * 3600, after_id, last_id))
+        return last_id
+    return backfill
+
+# Chế độ DB_EPOCH_TIMESTAMPS: version ngoài dãy MIGRATIONS, chỉ áp dụng khi bật (_apply_config_migration)
+EPOCH_MIGRATION_VERSIONS = {"sales": 1001, "expenses": 1002}
+EPOCH_MIGRATIONS: List[Migration] = [
+    Migration(version, f"{table}_epoch_timestamps", _migration_epoch_timestamps(table),
+              _backfill_epoch_timestamps(table))
+    for table, version in EPOCH_MIGRATION_VERSIONS.items()
+]
+MIGRATIONS_BY_VERSION = {migration.version: migration for migration in MIGRATIONS + EPOCH_MIGRATIONS}
+
+# ===========================
+# Rollup theo ngày (daily_totals)
+# ===========================
+# kind -> (bảng nguồn, cột nhãn): sales theo dịch vụ, expenses theo loại chi phí
+ROLLUP_SOURCES = {
+    "sales": ("sales", "service"),
+    "expenses": ("expenses", "category"),
+}
+
+def bump_daily_total(conn: sqlite3.Connection, kind: str, created_at: str, label: str, amount: float):
+    """Cộng một dòng mới vào daily_totals (gọi trong cùng transaction với INSERT)"""
+    conn.execute("""
+        INSERT INTO daily_totals (day, kind, label, count, amount) VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT(day, kind, label) DO UPDATE SET
+            count = count + 1,
+            amount = amount + excluded.amount
+    """, (created_at[:10], kind, label, amount))
+
+def bump_stats_counter(conn: sqlite3.Connection, kind: str, amount: float):
+    """Cộng một dòng mới vào stats_counters (gọi trong cùng transaction với INSERT)"""
+    conn.execute("""
+        INSERT INTO stats_counters (kind, count, amount) VALUES (?, 1, ?)
+        ON CONFLICT(kind) DO UPDATE SET
+            count = count + 1,
+            amount = amount + excluded.amount
+    """, (kind, amount))
+
+def rebuild_stats_counters(conn: sqlite3.Connection):
+    """Seed lại stats_counters từ daily_totals"""
+    conn.execute("DELETE FROM stats_counters")
+    for kind in ROLLUP_SOURCES:
+        conn.execute("""
+            INSERT INTO stats_counters (kind, count, amount)
+            SELECT ?, COALESCE(SUM(count), 0), COALESCE(SUM(amount), 0)
+            FROM daily_totals WHERE kind = ?
+        """, (kind, kind))
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """Tạo lại toàn bộ daily_totals (và stats_counters) từ dữ liệu gốc, gồm cả các phân vùng archive"""
+    conn.execute("DELETE FROM daily_totals")
+    # Migration baseline gọi trước khi có bảng archive_partitions
+    archived = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='archive_partitions'"
+    ).fetchone()
+    for kind, (table, label_column) in ROLLUP_SOURCES.items():
+        conn.execute(f"""
+            INSERT INTO daily_totals (day, kind, label, count, amount)
+            SELECT substr(created_at, 1, 10), ?, {label_column}, COUNT(*), SUM(amount)
+            FROM {table}
+            GROUP BY substr(created_at, 1, 10), {label_column}
+        """, (kind,))
+        # Đang trong transaction ghi nên không ATTACH được: đọc archive bằng connection riêng
+        for partition in (list_partitions(conn, table) if archived else []):
+            archive = connect(archive_path_for(main_db_path(conn), partition.name), readonly=True)
+            try:
+                rows = archive.execute(f"""
+                    SELECT substr(created_at, 1, 10), {label_column}, COUNT(*), SUM(amount)
+                    FROM {table} WHERE id <= ?
+                    GROUP BY substr(created_at, 1, 10), {label_column}
+                """, (partition.max_id,)).fetchall()
+            finally:
+                archive.close()
+            conn.executemany("""
+                INSERT INTO daily_totals (day, kind, label, count, amount) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(day, kind, label) DO UPDATE SET
+                    count = count + excluded.count,
+                    amount = amount + excluded.amount
+            """, ((day, kind, label, count, amount) for day, label, count, amount in rows))
+    rebuild_stats_counters(conn)
+    logger.info("✅ Rebuilt daily_totals rollup")
+
+def fetch_period_summary(conn: sqlite3.Connection, start: date, end: date) -> Dict[str, Any]:
+    """
+    Tổng hợp doanh thu/chi phí trong [start, end) từ daily_totals (O(số ngày)).
+    Trả về count/amount cho từng kind và breakdown theo dịch vụ / loại chi phí.
+    """
+    summary: Dict[str, Any] = {}
+    for kind in ROLLUP_SOURCES:
+        rows = conn.execute("""
+            SELECT label, SUM(count), SUM(amount)
+            FROM daily_totals
+            WHERE kind = ? AND day >= ? AND day < ?
+            GROUP BY label
+            ORDER BY SUM(amount) DESC
+        """, (kind, start.isoformat(), end.isoformat())).fetchall()
+        summary[kind] = {
+            "count": sum(row[1] for row in rows),
+            "amount": sum(row[2] for row in rows),
+            "by_label": [(label, count, amount) for label, count, amount in rows],
+        }
+    return summary
+
+# ===========================
+# Tìm kiếm toàn văn (FTS5, /search)
+# ===========================
+# kind -> (bảng nguồn, bảng FTS5, cột được index). Bảng FTS5 dạng external content (rowid = id
+# của bảng nguồn, không lưu bản sao nội dung), được cập nhật bằng trigger.
+SEARCH_SOURCES = {
+    "sales": ("sales", "sales_fts", ("name", "phone", "service", "note")),
+    "expenses": ("expenses", "expenses_fts", ("category", "note")),
+}
+
+def _search_value(expr: str) -> str:
+    # unicode61 remove_diacritics bỏ dấu thanh/dấu mũ nhưng "đ" là chữ riêng: đổi sang "d" trước khi index.
+    # Trigger xóa phải tính lại đúng giá trị này, nên không dùng lệnh 'rebuild' của FTS5 (đọc thẳng bảng nguồn).
+    return f"replace(replace(coalesce({expr}, ''), 'đ', 'd'), 'Đ', 'D')"
+
+def _search_values(prefix: str, columns: Tuple[str, ...]) -> str:
+    return ", ".join(_search_value(f"{prefix}{column}") for column in columns)
+
+def create_search_table(conn: sqlite3.Connection, table: str) -> bool:
+    """Tạo bảng FTS5 và trigger đồng bộ cho bảng (idempotent); True nếu bảng FTS5 vừa được tạo"""
+    _, fts, columns = SEARCH_SOURCES[table]
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,)).fetchone()
+    column_list = ", ".join(columns)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {_search_values("new.", columns)});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list})
+            VALUES ('delete', old.id, {_search_values("old.", columns)});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list})
+            VALUES ('delete', old.id, {_search_values("old.", columns)});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {_search_values("new.", columns)});
+        END
+    """)
+    return not exists
+
+def index_search_rows(conn: sqlite3.Connection, table: str, after_id: int,
+                      upto_id: Optional[int] = None, limit: Optional[int] = None) -> int:
+    """
+    Thêm vào bảng FTS5 các dòng after_id < id <= upto_id (tối đa limit dòng) - các dòng có trước
+    trigger hoặc ghi lúc trigger tắt. Trả về id cuối đã index (upto_id nếu không còn dòng nào).
+    """
+    _, fts, columns = SEARCH_SOURCES[table]
+    where, params = "id > ?", [after_id]
+    if upto_id is not None:
+        where, params = where + " AND id <= ?", params + [upto_id]
+    if limit is not None:
+        last_id = conn.execute(
+            f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE {where} ORDER BY id LIMIT ?)", (*params, limit)
+        ).fetchone()[0]
+    else:
+        last_id = conn.execute(f"SELECT MAX(id) FROM {table} WHERE {where}", params).fetchone()[0]
+    if last_id is None:
+        return upto_id if upto_id is not None else after_id
+    conn.execute(f"""
+        INSERT INTO {fts} (rowid, {", ".join(columns)})
+        SELECT id, {_search_values("", columns)} FROM {table} WHERE id > ? AND id <= ?
+    """, (after_id, last_id))
+    return last_id
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    """Tạo lại toàn bộ index tìm kiếm từ dữ liệu gốc (backfill FTS5 đang dở coi như xong)"""
+    for table, fts, _ in SEARCH_SOURCES.values():
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('delete-all')")
+        index_search_rows(conn, table, 0)
+        conn.execute(
+            "UPDATE schema_migrations SET backfill_cursor = backfill_target, completed_at = ? "
+            "WHERE name = ? AND completed_at IS NULL",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), fts)
+        )
+    logger.info("✅ Rebuilt search index")
+
+def search_match(text: str) -> Optional[str]:
+    """Chuỗi người dùng nhập -> biểu thức MATCH: mọi từ đều phải có (khớp theo đầu từ), None nếu không có từ nào"""
+    words = re.findall(r"\w+", text.replace("đ", "d").replace("Đ", "D"))
+    return " ".join(f'"{word}"*' for word in words) or None
+
+def _search_rows(conn: sqlite3.Connection, schema: str, table: str, match: str, before: int,
+                 limit: int, max_id: Optional[int] = None) -> List[tuple]:
+    _, fts, _ = SEARCH_SOURCES[table]
+    columns = ", ".join(f"t.{column.strip()}" for column in REPORT_COLUMNS[table].split(","))
+    bound, params = ("f.rowid < ?", (match, before))
+    if max_id is not None:
+        bound, params = bound + " AND f.rowid <= ?", params + (max_id,)
+    return conn.execute(f"""
+        SELECT {columns} FROM {schema}.{fts} AS f JOIN {schema}.{table} AS t ON t.id = f.rowid
+        WHERE f.{fts} MATCH ? AND {bound}
+        ORDER BY f.rowid DESC
+        LIMIT ?
+    """, (*params, limit)).fetchall()
+
+def fetch_search_page(conn: sqlite3.Connection, match: str, before: Dict[str, int],
+                      limit: int) -> Tuple[List[Tuple[str, tuple]], Dict[str, int]]:
+    """
+    Một trang kết quả tìm kiếm trên sales và expenses, dòng nhập sau trước (rowid giảm dần -
+    FTS5 duyệt ngược theo rowid và dừng sau limit dòng, không phải đọc hết kết quả).
+    Phân vùng archive được ATTACH lần lượt theo max_id giảm dần, chỉ khi có thể còn dòng lọt vào trang.
+    before[kind]: chỉ lấy id < giá trị này, 0 = kind đó đã hết.
+    Trả về ([(kind, dòng theo REPORT_COLUMNS)], before của trang sau); dòng hai bảng được trộn theo created_at.
+    """
+    fetched: Dict[str, List[tuple]] = {}
+    for kind, (table, _, _) in SEARCH_SOURCES.items():
+        cursor = before.get(kind, 0)
+        if cursor <= 0:
+            fetched[kind] = []
+            continue
+        rows = _search_rows(conn, "main", table, match, cursor, limit + 1)
+        for partition in sorted(list_partitions(conn, table), key=lambda p: p.max_id, reverse=True):
+            if len(rows) > limit and rows[limit][0] > partition.max_id:
+                break
+            if partition.min_id >= cursor:
+                continue
+            with attach_partition(conn, partition) as schema:
+                rows += _search_rows(conn, schema, table, match, cursor, limit + 1, partition.max_id)
+            rows = sorted(rows, key=lambda row: row[0], reverse=True)[:limit + 1]
+        fetched[kind] = rows
+
+    # heapq.merge chỉ so sánh phần tử đầu của mỗi list nên mỗi kind luôn được lấy theo đúng thứ tự id
+    page = list(itertools.islice(
+        heapq.merge(*([(kind, row) for row in rows] for kind, rows in fetched.items()),
+                    key=lambda item: item[1][-1], reverse=True),
+        limit
+    ))
+    next_before: Dict[str, int] = {}
+    for kind, rows in fetched.items():
+        taken = [row for row_kind, row in page if row_kind == kind]
+        if len(taken) == len(rows):
+            # Trang có tối đa limit dòng nên lấy hết nghĩa là đọc được < limit + 1 dòng: kind đã hết
+            next_before[kind] = 0
+        else:
+            next_before[kind] = taken[-1][0] if taken else before.get(kind, 0)
+    return page, next_before
+
+# ===========================
+# Phân vùng archive
+# ===========================
+# archive.py chuyển dữ liệu các tháng đã đóng sang file archive theo tháng/năm; archive_partitions
+# (trong database chính) ghi khoảng thời gian và khoảng id của mỗi phân vùng. Chỉ dòng có
+# id <= max_id được đọc: dòng đã chép sang archive nhưng chưa xóa khỏi database chính
+# (đang chuyển dở) không bị đọc hai lần.
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    kind: str
+    period_start: str
+    period_end: str
+    min_id: int
+    max_id: int
+
+def archive_path_for(db_path: str, name: str) -> str:
+    """File archive của phân vùng `name` (vd. 2024-01 hoặc 2024) cho database `db_path`"""
+    return str(Path(Config.get_archive_dir()) / f"{Path(db_path).stem}-{name}.db")
+
+def main_db_path(conn: sqlite3.Connection) -> str:
+    return next(path for _, schema, path in conn.execute("PRAGMA database_list") if schema == "main")
+
+def list_partitions(conn: sqlite3.Connection, kind: str, start: Optional[date] = None,
+                    end: Optional[date] = None) -> List[Partition]:
+    """Phân vùng archive (có dữ liệu) của bảng giao với [start, end), mới nhất trước"""
+    return [Partition(*row) for row in conn.execute("""
+        SELECT name, kind, period_start, period_end, min_id, max_id FROM archive_partitions
+        WHERE kind = ? AND max_id > 0 AND period_start < ? AND period_end > ?
+        ORDER BY period_start DESC
+    """, (kind, (end or date.max).isoformat(), (start or date.min).isoformat()))]
+
+@contextmanager
+def attach_partition(conn: sqlite3.Connection, partition: Partition) -> Generator[str, None, None]:
+    """ATTACH (chỉ đọc) file archive của phân vùng vào connection đọc, trả về tên schema"""
+    schema = "archive_" + re.sub(r"\W", "_", partition.name)
+    path = Path(archive_path_for(main_db_path(conn), partition.name)).resolve()
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"{path.as_uri()}?mode=ro",))
+    try:
+        yield schema
+    finally:
+        conn.execute(f"DETACH DATABASE {schema}")
+
+def _period_segments(conn: sqlite3.Connection, table: str, start: date,
+                     end: date) -> Iterator[Tuple[date, date, Optional[Partition]]]:
+    """Chia [start, end) thành các đoạn, mới nhất trước: đoạn trùng một phân vùng archive và đoạn chỉ ở database chính"""
+    segment_end = end
+    for partition in list_partitions(conn, table, start, end):
+        partition_start = max(date.fromisoformat(partition.period_start), start)
+        partition_end = min(date.fromisoformat(partition.period_end), end)
+        if partition_end < segment_end:
+            yield partition_end, segment_end, None
+        yield partition_start, partition_end, partition
+        segment_end = partition_start
+    if start < segment_end:
+        yield start, segment_end, None
+
+def iter_partitioned_rows(conn: sqlite3.Connection, table: str, columns: str, start: date, end: date,
+                          batch_size: int = 1000, descending: bool = True) -> Iterator[List[tuple]]:
+    """
+    Duyệt các dòng [start, end) của bảng theo thời gian, theo từng batch (fetchmany).
+    Phân vùng archive giao với khoảng được ATTACH lần lượt (mỗi lúc một file) và trộn với
+    dòng cùng khoảng còn ở database chính (vd. import sau khi tháng đã được archive).
+    `columns` phải có created_at.
+    """
+    segments = list(_period_segments(conn, table, start, end))
+    for segment_start, segment_end, partition in (segments if descending else reversed(segments)):
+        where_clause, params, order_column = period_clause(conn, table, segment_start, segment_end)
+        direction = "DESC" if descending else "ASC"
+        if partition is None:
+            c = conn.execute(f"SELECT {columns} FROM {table} WHERE {where_clause} ORDER BY {order_column} {direction}",
+                             params)
+            yield from _fetch_batches(c, batch_size)
+            continue
+        # File archive lọc theo created_at (luôn có index, kể cả khi chưa có created_ts);
+        # ORDER BY của UNION ALL phải là cột kết quả: created_at cùng thứ tự với created_ts
+        bounds = (segment_start.isoformat(), segment_end.isoformat(), partition.max_id)
+        with attach_partition(conn, partition) as schema:
+            c = conn.execute(f"""
+                SELECT {columns} FROM main.{table} WHERE {where_clause}
+                UNION ALL
+                SELECT {columns} FROM {schema}.{table} WHERE created_at >= ? AND created_at < ? AND id <= ?
+                ORDER BY created_at {direction}
+            """, params + bounds)
+            try:
+                yield from _fetch_batches(c, batch_size)
+            finally:
+                # Statement còn mở (dừng đọc giữa chừng) thì không DETACH được
+                c.close()
+
+def _fetch_batches(cursor: sqlite3.Cursor, batch_size: int) -> Iterator[List[tuple]]:
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+# ===========================
+# Thời gian & khoảng báo cáo
+# ===========================
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def epoch_ready(conn: sqlite3.Connection, table: str) -> bool:
+    """created_ts dùng được để lọc: DB_EPOCH_TIMESTAMPS bật và backfill của bảng đã xong"""
+    if not Config.DB_EPOCH_TIMESTAMPS:
+        return False
+    row = conn.execute(
+        "SELECT completed_at FROM schema_migrations WHERE version = ?", (EPOCH_MIGRATION_VERSIONS[table],)
+    ).fetchone()
+    return row is not None and row[0] is not None
+
+def time_columns(created_at: str) -> Tuple[int, int]:
+    """Từ chuỗi created_at (giờ VN) tính (created_ts epoch, day_key YYYYMMDD)"""
+    local = datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=Config.get_timezone_info())
+    return int(local.timestamp()), int(local.strftime("%Y%m%d"))
+
+def period_clause(conn: sqlite3.Connection, table: str, start: date, end: date) -> Tuple[str, Tuple[Any, ...], str]:
+    """
+    Điều kiện thời gian half-open [start, end) của bảng, dùng được index trên cột thời gian
+    (created_at khi backfill created_ts chưa xong). Trả về (where_clause, params, cột để ORDER BY).
+    """
+    if epoch_ready(conn, table):
+        tz = Config.get_timezone_info()
+        start_ts = int(datetime.combine(start, datetime.min.time(), tz).timestamp())
+        end_ts = int(datetime.combine(end, datetime.min.time(), tz).timestamp())
+        return "created_ts >= ? AND created_ts < ?", (start_ts, end_ts), "created_ts"
+    # created_at dạng 'YYYY-MM-DD HH:MM:SS' nên so sánh chuỗi với 'YYYY-MM-DD' là đúng thứ tự
+    return "created_at >= ? AND created_at < ?", (start.isoformat(), end.isoformat()), "created_at"
+
+def fetch_stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Đọc thống kê tổng quan từ stats_counters (O(1), không quét bảng gốc)"""
+    totals = {kind: (0, 0) for kind in ROLLUP_SOURCES}
+    for kind, count, amount in conn.execute("SELECT kind, count, amount FROM stats_counters"):
+        totals[kind] = (count, amount)
+    total_sales, sum_sales = totals["sales"]
+    total_expenses, sum_expenses = totals["expenses"]
+    return {
+        "total_sales_count": total_sales,
+        "total_expenses_count": total_expenses,
+        "total_sales_amount": sum_sales,
+        "total_expenses_amount": sum_expenses,
+        "profit": sum_sales - sum_expenses
+    }
 
 def get_stats() -> Optional[Dict[str, Any]]:
     """Lấy thống kê tổng quan từ database"""
     try:
-        with get_db() as conn:
-            c = conn.cursor()
-            
-            # Đếm số bản ghi
-            c.execute("SELECT COUNT(*) FROM sales")
-            total_sales = c.fetchone()[0]
-            
-            c.execute("SELECT COUNT(*) FROM expenses")
-            total_expenses = c.fetchone()[0]
-            
-            # Tổng tiền
-            c.execute("SELECT COALESCE(SUM(amount), 0) FROM sales")
-            sum_sales = c.fetchone()[0]
-            
-            c.execute("SELECT COALESCE(SUM(amount), 0) FROM expenses")
-            sum_expenses = c.fetchone()[0]
-            
-            return {
-                "total_sales_count": total_sales,
-                "total_expenses_count": total_expenses,
-                "total_sales_amount": sum_sales,
-                "total_expenses_amount": sum_expenses,
-                "profit": sum_sales - sum_expenses
-            }
+        with get_read_db() as conn:
+            return fetch_stats(conn)
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return None
 
-if __name__ == "__main__":
-    # Test database
+# ===========================
+# Group-commit write queue
+# ===========================
+_STOP = object()
+
+class WriteQueue:
+    """
+    Thread ghi duy nhất, gom các thao tác ghi đang chờ vào một transaction
+    (group commit): tối đa DB_WRITE_BATCH_SIZE thao tác hoặc DB_WRITE_BATCH_DELAY_MS.
+    Mỗi thao tác chạy trong SAVEPOINT riêng nên lỗi của một dòng không kéo
+    theo cả batch; Future của từng thao tác chỉ resolve sau khi batch đã commit.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_batch: int, max_delay_ms: float, name: str = "db-writer"):
+        self._pool = pool
+        self._max_batch = max(1, max_batch)
+        self._max_delay = max(0.0, max_delay_ms) / 1000
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        """Đưa thao tác fn(conn, *args) vào hàng đợi, trả về Future với kết quả sau commit"""
+        future: "Future[T]" = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self):
+        """Ghi nốt các thao tác còn trong hàng đợi rồi dừng thread"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self._max_delay
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[Any]):
+        done = []
+        try:
+            with self._pool.writer() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for future, fn, args in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT write_item")
+                    try:
+                        with DB_EXEC_SECONDS.time("write", fn.__name__):
+                            result = fn(conn, *args)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_item")
+                        conn.execute("RELEASE write_item")
+                        future.set_exception(e)
+                    else:
+                        conn.execute("RELEASE write_item")
+                        done.append((future, result))
+        except Exception as e:
+            # BEGIN/SAVEPOINT/commit thất bại: không dòng nào trong batch được ghi. Resolve mọi Future
+            # chưa xong (kể cả thao tác đang chạy và các thao tác chưa tới lượt) để run_write không treo
+            logger.error(f"Batch write failed ({len(batch)} items): {e}")
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in done:
+            future.set_result(result)
+
+
+# ===========================
+# Async data-access layer
+# ===========================
+def _get_read_executor() -> ThreadPoolExecutor:
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(max_workers=Config.DB_READ_WORKERS, thread_name_prefix="db-reader")
+    return _read_executor
+
+def _run_with_reader(store: Optional[str], fn: Callable[..., T], *args: Any) -> T:
+    with router.acquire(store) as database, database.pool.reader() as conn, \
+            DB_EXEC_SECONDS.time("read", fn.__name__):
+        return fn(conn, *args)
+
+async def _ensure_open(store: Optional[str]):
+    """Store chưa mở thì mở (init_db) trên thread đọc thay vì trên event loop"""
+    if not router.is_open(store):
+        await asyncio.get_running_loop().run_in_executor(_get_read_executor(), router.open, store)
+
+# Số thao tác đọc đã gửi nhưng chưa xong (đang chạy + đang chờ thread)
+_pending_reads = 0
+
+async def run_read(fn: Callable[..., T], *args: Any) -> T:
+    """Chạy fn(conn, *args) với một reader connection của store hiện tại trên thread pool đọc"""
+    global _pending_reads
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    _pending_reads += 1
+    try:
+        return await loop.run_in_executor(
+            _get_read_executor(), functools.partial(_run_with_reader, current_store(), fn, *args)
+        )
+    except Exception:
+        DB_ERRORS.inc("read", fn.__name__)
+        raise
+    finally:
+        _pending_reads -= 1
+        DB_CALL_SECONDS.observe(time.perf_counter() - start, "read", fn.__name__)
+
+# Worker process (workers.py): gửi thao tác ghi về process chính thay vì ghi local
+_remote_writer: Optional[Callable[[Optional[str], Callable[..., Any], tuple], "Future[Any]"]] = None
+
+def set_remote_writer(submit: Callable[[Optional[str], Callable[..., Any], tuple], "Future[Any]"]):
+    """Chuyển process hiện tại sang chế độ chỉ đọc: mọi thao tác ghi gọi submit(store, fn, args)"""
+    global _remote_writer
+    _remote_writer = submit
+    router.writable = False
+
+def submit_write(store: Optional[str], fn: Callable[..., T], *args: Any) -> "Future[T]":
+    """Đưa fn(conn, *args) vào write queue của store, trả về Future có kết quả sau commit"""
+    if _remote_writer is not None:
+        return _remote_writer(store, fn, args)
+    database = router.checkout(store)
+    try:
+        future = database.write_queue.submit(fn, *args)
+    except Exception:
+        router.release(database)
+        raise
+    future.add_done_callback(lambda _: router.release(database))
+    return future
+
+def read_sync(fn: Callable[..., T], *args: Any) -> T:
+    """Chạy fn(conn, *args) với reader connection của store hiện tại, chặn thread hiện tại (không dùng trên event loop)"""
+    return _run_with_reader(current_store(), fn, *args)
+
+def write_sync(fn: Callable[..., T], *args: Any) -> T:
+    """Như run_write nhưng chặn thread hiện tại (dùng từ thread khác event loop: import, CLI)"""
+    return submit_write(current_store(), fn, *args).result()
+
+async def run_write(fn: Callable[..., T], *args: Any) -> T:
+    """
+    Đưa fn(conn, *args) vào write queue của store hiện tại và chờ tới khi batch chứa nó được commit.
+    Raise exception nếu chính thao tác này (hoặc commit của batch) thất bại.
+    """
+    start = time.perf_counter()
+    try:
+        store = current_store()
+        if _remote_writer is None:
+            await _ensure_open(store)
+        return await asyncio.wrap_future(submit_write(store, fn, *args))
+    except Exception:
+        DB_ERRORS.inc("write", fn.__name__)
+        raise
+    finally:
+        DB_CALL_SECONDS.observe(time.perf_counter() - start, "write", fn.__name__)
+
+QUEUE_DEPTH.set_function(
+    lambda: sum(d.write_queue.qsize() for d in router.databases() if d.write_queue is not None), "db_write"
+)
+QUEUE_DEPTH.set_function(lambda: _pending_reads, "db_read")
+
+class MaintenanceRunner:
+    """
+    Việc bảo trì chạy nền (thread "db-maintenance"), lần lượt từng store: backfill của migration,
+    sau đó archive các tháng đã đóng (ARCHIVE_ENABLED, archive.py). Mỗi batch là một thao tác trên
+    write queue của store (xen kẽ với ghi của bot), nghỉ MIGRATION_BATCH_PAUSE_MS giữa hai batch.
+    Archive được lên lịch lại cho các store đang mở mỗi ARCHIVE_INTERVAL_HOURS.
+    Chỉ chạy sau start() (bot); CLI dùng run().
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._scheduled: set = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, store: Optional[str]):
+        with self._lock:
+            if store in self._scheduled:
+                return
+            self._scheduled.add(store)
+        self._queue.put(store)
+
+    def _schedule_open_stores(self):
+        for store in router.stores():
+            self.schedule(store)
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            if Config.ARCHIVE_ENABLED:
+                self._schedule_open_stores()
+            self._thread = threading.Thread(target=self._serve, name="db-maintenance", daemon=True)
+            self._thread.start()
+
+    def _serve(self):
+        interval = Config.ARCHIVE_INTERVAL_HOURS * 3600 if Config.ARCHIVE_ENABLED else None
+        while True:
+            try:
+                store = self._queue.get(timeout=interval)
+            except queue.Empty:
+                self._schedule_open_stores()
+                continue
+            if self._stopping.is_set():
+                break
+            try:
+                self.run(store, Config.MIGRATION_BATCH_PAUSE_MS / 1000)
+            except Exception as e:
+                logger.error(f"Maintenance failed{f' ({store})' if store else ''}: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._scheduled.discard(store)
+
+    def run(self, store: Optional[str], pause: float = 0, archive: bool = None):
+        """Backfill mọi migration còn dở của store rồi archive (chặn tới khi xong hoặc stop())"""
+        for version in submit_write(store, pending_backfills).result():
+            started = time.perf_counter()
+            while not self._stopping.is_set():
+                if submit_write(store, run_backfill_batch, version, Config.MIGRATION_BATCH_SIZE).result():
+                    logger.info(f"Backfill of migration {version}{f' ({store})' if store else ''} finished "
+                                f"in {time.perf_counter() - started:.1f}s")
+                    break
+                if pause:
+                    self._stopping.wait(pause)
+        if Config.ARCHIVE_ENABLED if archive is None else archive:
+            from archive import archive_closed_periods
+            archive_closed_periods(store, pause, self._stopping)
+
+    def stop(self):
+        """Dừng sau batch đang chạy; tiến độ đã lưu nên lần khởi động sau chạy tiếp"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+maintenance = MaintenanceRunner()
+
+def shutdown():
+    """Dừng việc bảo trì nền, chờ các thao tác đọc, ghi nốt write queue rồi đóng executor và mọi database"""
+    global _read_executor
+    maintenance.stop()
+    if _read_executor is not None:
+        _read_executor.shutdown(wait=True)
+        _read_executor = None
+    router.close()
+
+def insert_sale(conn: sqlite3.Connection, name: str, phone: str, service: str, amount: int,
+                note: str, created_at: str) -> int:
+    """Lưu một hóa đơn, trả về id bản ghi"""
+    if Config.DB_EPOCH_TIMESTAMPS:
+        c = conn.execute(
+            "INSERT INTO sales (name, phone, service, amount, note, created_at, created_ts, day_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, phone, service, amount, note, created_at, *time_columns(created_at))
+        )
+    else:
+        c = conn.execute(
+            "INSERT INTO sales (name, phone, service, amount, note, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, phone, service, amount, note, created_at)
+        )
+    bump_daily_total(conn, "sales", created_at, service, amount)
+    bump_stats_counter(conn, "sales", amount)
+    return c.lastrowid
+
+def insert_expense(conn: sqlite3.Connection, category: str, amount: float, note: str, created_at: str) -> int:
+    """Lưu một khoản chi, trả về id bản ghi"""
+    if Config.DB_EPOCH_TIMESTAMPS:
+        c = conn.execute(
+            "INSERT INTO expenses (category, amount, note, created_at, created_ts, day_key) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (category, amount, note, created_at, *time_columns(created_at))
+        )
+    else:
+        c = conn.execute(
+            "INSERT INTO expenses (category, amount, note, created_at) VALUES (?, ?, ?, ?)",
+            (category, amount, note, created_at)
+        )
+    bump_daily_total(conn, "expenses", created_at, category, amount)
+    bump_stats_counter(conn, "expenses", amount)
+    return c.lastrowid
+
+def insert_sales_rows(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+    """Ghi nhiều hóa đơn (name, phone, service, amount, note, created_at) bằng executemany, không cập nhật rollup"""
+    if Config.DB_EPOCH_TIMESTAMPS:
+        conn.executemany(
+            "INSERT INTO sales (name, phone, service, amount, note, created_at, created_ts, day_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (row + time_columns(row[5]) for row in rows)
+        )
+    else:
+        conn.executemany(
+            "INSERT INTO sales (name, phone, service, amount, note, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+    return len(rows)
+
+def insert_expense_rows(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+    """Ghi nhiều khoản chi (category, amount, note, created_at) bằng executemany, không cập nhật rollup"""
+    if Config.DB_EPOCH_TIMESTAMPS:
+        conn.executemany(
+            "INSERT INTO expenses (category, amount, note, created_at, created_ts, day_key) VALUES (?, ?, ?, ?, ?, ?)",
+            (row + time_columns(row[3]) for row in rows)
+        )
+    else:
+        conn.executemany("INSERT INTO expenses (category, amount, note, created_at) VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+def drop_table_indexes(conn: sqlite3.Connection, tables: Tuple[str, ...], triggers: bool = False) -> List[str]:
+    """
+    Xóa các index (tự tạo) của các bảng - và trigger nếu triggers=True -
+    trả về câu lệnh CREATE INDEX/TRIGGER để tạo lại
+    """
+    placeholders = ", ".join("?" * len(tables))
+    types = ("index", "trigger") if triggers else ("index",)
+    rows = conn.execute(
+        f"SELECT type, name, sql FROM sqlite_master "
+        f"WHERE type IN ({', '.join('?' * len(types))}) AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        types + tables
+    ).fetchall()
+    for kind, name, _ in rows:
+        conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+    return [sql for _, _, sql in rows]
+
+def max_row_ids(conn: sqlite3.Connection, tables: Tuple[str, ...]) -> Dict[str, int]:
+    return {table: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0] for table in tables}
+
+def create_indexes(conn: sqlite3.Connection, statements: List[str]):
+    for sql in statements:
+        conn.execute(sql)
+
+# ===========================
+# Khóa import (import_state)
+# ===========================
+IMPORT_TABLES = ("sales", "expenses")
+
+class ImportInProgress(Exception):
+    """Store đang có import chạy: index và trigger (gồm trigger FTS5) của sales/expenses đang bị xóa"""
+
+def import_running(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM import_state").fetchone() is not None
+
+def begin_import(conn: sqlite3.Connection) -> None:
+    """
+    Chạy trên write queue: nhận khóa import của store, xóa index/trigger của sales/expenses và lưu
+    cách tạo lại cùng id lớn nhất hiện tại. Kiểm tra và ghi trong cùng transaction ghi nên hai import
+    (khác process) không thể cùng chạy; raise ImportInProgress nếu đã có import.
+    """
+    if import_running(conn):
+        raise ImportInProgress("Đang có một import khác chạy")
+    statements = drop_table_indexes(conn, IMPORT_TABLES, triggers=True)
+    conn.execute(
+        "INSERT INTO import_state (id, statements, last_ids, started_at) VALUES (1, ?, ?, ?)",
+        (json.dumps(statements), json.dumps(max_row_ids(conn, IMPORT_TABLES)),
+         datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+
+def finish_import(conn: sqlite3.Connection, source: Optional[str] = None) -> bool:
+    """
+    Chạy trên write queue: tạo lại index/trigger đã lưu, index tìm kiếm các dòng ghi lúc trigger FTS5 tắt,
+    tính lại daily_totals/stats_counters rồi trả khóa. Có source (file đã import hết) thì xóa luôn tiến độ
+    của file đó. False nếu không có import nào đang chạy.
+    """
+    row = conn.execute("SELECT statements, last_ids FROM import_state").fetchone()
+    if row is None:
+        return False
+    if source is not None:
+        conn.execute("DELETE FROM import_progress WHERE source = ?", (source,))
+    create_indexes(conn, json.loads(row[0]))
+    for table, last_id in json.loads(row[1]).items():
+        index_search_rows(conn, table, last_id)
+    rebuild_rollups(conn)
+    bump_data_version(conn)
+    conn.execute("DELETE FROM import_state")
+    return True
+
+def import_progress(conn: sqlite3.Connection, source: str) -> Optional[Tuple[int, int, int]]:
+    """(dòng CSV cuối đã commit, số hóa đơn, số chi phí đã ghi) của lần import dở trước đó của file"""
+    return conn.execute(
+        "SELECT line, sales, expenses FROM import_progress WHERE source = ?", (source,)
+    ).fetchone()
+
+def insert_import_batch(conn: sqlite3.Connection, source: str, line: int,
+                        sales_rows: List[tuple], expense_rows: List[tuple]) -> None:
+    """
+    Chạy trên write queue: ghi một batch import và tiến độ (tới dòng `line` của file) trong cùng
+    transaction - dòng đã commit luôn khớp với tiến độ đã lưu
+    """
+    if sales_rows:
+        insert_sales_rows(conn, sales_rows)
+    if expense_rows:
+        insert_expense_rows(conn, expense_rows)
+    conn.execute(
+        "INSERT INTO import_progress (source, line, sales, expenses, updated_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (source) DO UPDATE SET line = excluded.line, sales = sales + excluded.sales, "
+        "expenses = expenses + excluded.expenses, updated_at = excluded.updated_at",
+        (source, line, len(sales_rows), len(expense_rows), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+
+def fetch_customer_rows(conn: sqlite3.Connection, phone: str, limit: int) -> List[Tuple[str, str, str]]:
+    """(name, service, created_at) các hóa đơn gần nhất của SĐT, mới nhất trước (idx_sales_phone)"""
+    return conn.execute(
+        "SELECT name, service, created_at FROM sales WHERE phone = ? ORDER BY created_at DESC LIMIT ?",
+        (phone, limit)
+    ).fetchall()
+
+def iter_recent_customer_rows(conn: sqlite3.Connection, since: date,
+                              batch_size: int = 5000) -> Iterator[Tuple[str, str, str, str]]:
+    """(phone, name, service, created_at) của hóa đơn từ ngày `since` (gồm phân vùng archive), cũ trước"""
+    for rows in iter_partitioned_rows(conn, "sales", "phone, name, service, created_at", since, date.max,
+                                      batch_size, descending=False):
+        yield from rows
+
+# Cột xuất ra báo cáo chi tiết cho từng bảng
+REPORT_COLUMNS = {
+    "sales": "id, name, phone, service, amount, note, created_at",
+    "expenses": "id, category, amount, note, created_at",
+}
+
+def iter_period_rows(conn: sqlite3.Connection, table: str, start: date, end: date,
+                     batch_size: int = 1000) -> Iterator[List[tuple]]:
+    """Duyệt các dòng của bảng trong khoảng [start, end) (gồm phân vùng archive), mới nhất trước"""
+    return iter_partitioned_rows(conn, table, REPORT_COLUMNS[table], start, end, batch_size)
+
+def fetch_qr_file_id(conn: sqlite3.Connection, cache_key: str, min_created_at: str) -> Optional[str]:
+    row = conn.execute(
+        "SELECT file_id FROM qr_file_ids WHERE cache_key = ? AND created_at >= ?",
+        (cache_key, min_created_at)
+    ).fetchone()
+    return row[0] if row else None
+
+def save_qr_file_id(conn: sqlite3.Connection, cache_key: str, file_id: str, created_at: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO qr_file_ids (cache_key, file_id, created_at) VALUES (?, ?, ?)",
+        (cache_key, file_id, created_at)
+    )
+
+def delete_qr_file_id(conn: sqlite3.Connection, cache_key: str):
+    conn.execute("DELETE FROM qr_file_ids WHERE cache_key = ?", (cache_key,))
+
+def fetch_conversations(conn: sqlite3.Connection, name: str, min_updated_at: str) -> List[Tuple[str, str]]:
+    return conn.execute(
+        "SELECT conv_key, state FROM conversations WHERE name = ? AND updated_at >= ?",
+        (name, min_updated_at)
+    ).fetchall()
+
+def fetch_user_data(conn: sqlite3.Connection, user_id: int) -> Optional[str]:
+    row = conn.execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+def save_persistence_batch(conn: sqlite3.Connection, conversations: Dict[Tuple[str, str], Optional[str]],
+                           user_data: Dict[int, Optional[str]], updated_at: str):
+    """Ghi một lượt thay đổi conversation/user_data; giá trị None = xóa dòng (conversation kết thúc, user_data rỗng)"""
+    conn.executemany(
+        "DELETE FROM conversations WHERE name = ? AND conv_key = ?",
+        [key for key, state in conversations.items() if state is None]
+    )
+    conn.executemany(
+        """INSERT INTO conversations (name, conv_key, state, updated_at) VALUES (?, ?, ?, ?)
+           ON CONFLICT(name, conv_key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at""",
+        [(name, key, state, updated_at) for (name, key), state in conversations.items() if state is not None]
+    )
+    conn.executemany(
+        "DELETE FROM user_data WHERE user_id = ?",
+        [(user_id,) for user_id, data in user_data.items() if data is None]
+    )
+    conn.executemany(
+        """INSERT INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?)
+           ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at""",
+        [(user_id, data, updated_at) for user_id, data in user_data.items() if data is not None]
+    )
+
+def prune_persistence(conn: sqlite3.Connection, min_updated_at: str) -> int:
+    """Xóa conversation/user_data bỏ dở quá lâu"""
+    removed = conn.execute("DELETE FROM conversations WHERE updated_at < ?", (min_updated_at,)).rowcount
+    removed += conn.execute("DELETE FROM user_data WHERE updated_at < ?", (min_updated_at,)).rowcount
+    return removed
+
+def save_subscription(conn: sqlite3.Connection, chat_id: int, created_at: str) -> bool:
+    """Đăng ký nhận tóm tắt định kỳ; False nếu chat đã đăng ký"""
+    return conn.execute(
+        "INSERT OR IGNORE INTO report_subscriptions (chat_id, created_at) VALUES (?, ?)", (chat_id, created_at)
+    ).rowcount > 0
+
+def delete_subscription(conn: sqlite3.Connection, chat_id: int) -> bool:
+    return conn.execute("DELETE FROM report_subscriptions WHERE chat_id = ?", (chat_id,)).rowcount > 0
+
+def fetch_subscriptions(conn: sqlite3.Connection) -> List[int]:
+    return [chat_id for (chat_id,) in conn.execute("SELECT chat_id FROM report_subscriptions ORDER BY chat_id")]
+
+# ===========================
+# Write listeners
+# ===========================
+# Callback (kind, day) được gọi trên event loop sau khi một dòng đã commit;
+# day=None nghĩa là có thể đã thay đổi bất kỳ ngày nào (import, rebuild...)
+_write_listeners: List[Callable[[str, Optional[str]], None]] = []
+
+def add_write_listener(listener: Callable[[str, Optional[str]], None]):
+    _write_listeners.append(listener)
+
+def notify_write(kind: str, day: Optional[str]):
+    for listener in _write_listeners:
+        try:
+            listener(kind, day)
+        except Exception as e:
+            logger.error(f"Write listener failed: {e}", exc_info=True)
+
+def bump_data_version(conn: sqlite3.Connection):
+    """Đánh dấu dữ liệu đã đổi hàng loạt (gọi trong cùng transaction ghi)"""
+    conn.execute("UPDATE data_version SET version = version + 1")
+
+def fetch_data_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT version FROM data_version").fetchone()[0]
+
+# data_version đã thấy theo store trong process này
+_seen_data_versions: Dict[Optional[str], int] = {}
+
+async def check_data_version() -> bool:
+    """
+    Kiểm tra store hiện tại có bị ghi hàng loạt bởi process khác (import/rebuild-rollups từ CLI, worker
+    khác) từ lần kiểm tra trước không; nếu có thì notify_write(kind, None) để xóa report cache và index
+    khách quen. Lần đầu gặp store chỉ ghi nhận version. Trả về True nếu đã invalidate.
+    """
+    store = current_store()
+    version = await run_read(fetch_data_version)
+    previous = _seen_data_versions.get(store)
+    _seen_data_versions[store] = version
+    if previous is None or previous == version:
+        return False
+    logger.info(f"🔄 Dữ liệu{f' ({store})' if store else ''} đã đổi ở process khác: xóa cache")
+    notify_write("sales", None)
+    notify_write("expenses", None)
+    return True
+
+# Callback (name, phone, service, created_at) sau khi một hóa đơn đã commit (index khách quen)
+_sale_listeners: List[Callable[[str, str, str, str], None]] = []
+
+def add_sale_listener(listener: Callable[[str, str, str, str], None]):
+    _sale_listeners.append(listener)
+
+def notify_sale(name: str, phone: str, service: str, created_at: str):
+    for listener in _sale_listeners:
+        try:
+            listener(name, phone, service, created_at)
+        except Exception as e:
+            logger.error(f"Sale listener failed: {e}", exc_info=True)
+
+async def add_sale(name: str, phone: str, service: str, amount: int, note: str, created_at: str) -> int:
+    row_id = await run_write(insert_sale, name, phone, service, amount, note, created_at)
+    notify_write("sales", created_at[:10])
+    notify_sale(name, phone, service, created_at)
+    return row_id
+
+async def add_expense(category: str, amount: float, note: str, created_at: str) -> int:
+    row_id = await run_write(insert_expense, category, amount, note, created_at)
+    notify_write("expenses", created_at[:10])
+    return row_id
+
+async def get_qr_file_id(cache_key: str) -> Optional[str]:
+    """file_id ảnh QR đã gửi cho key này, bỏ qua bản ghi cũ hơn QR_FILE_ID_TTL_DAYS"""
+    now = datetime.now(Config.get_timezone_info())
+    min_created_at = (now - timedelta(days=Config.QR_FILE_ID_TTL_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    return await run_read(fetch_qr_file_id, cache_key, min_created_at)
+
+async def remember_qr_file_id(cache_key: str, file_id: str, created_at: str):
+    await run_write(save_qr_file_id, cache_key, file_id, created_at)
+
+async def forget_qr_file_id(cache_key: str):
+    await run_write(delete_qr_file_id, cache_key)
+
+async def query_stats() -> Dict[str, Any]:
+    return await run_read(fetch_stats)
+
+async def query_period_summary(start: date, end: date) -> Dict[str, Any]:
+    return await run_read(fetch_period_summary, start, end)
+
+def main():
+    """
+    CLI: `python db.py` in thống kê, `python db.py rebuild-rollups` tạo lại daily_totals và stats_counters,
+    `python db.py rebuild-search` tạo lại index tìm kiếm FTS5,
+    `python db.py migrate` chạy migration và backfill tới khi xong (không cần chờ bot chạy nền),
+    `python db.py archive` chuyển các tháng đã đóng sang file archive (kể cả khi ARCHIVE_ENABLED tắt),
+    `python db.py import file.csv [...] [--dry-run]` import lịch sử hóa đơn/chi phí,
+    `python db.py finish-import` hoàn tất import bị dừng giữa chừng (tạo lại index/trigger, trả khóa import).
+    `--store <tên>` chạy lệnh trên file của store đó (DB_SHARDING).
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Database tools")
+    parser.add_argument("command", nargs="?", default="stats",
+                        choices=["stats", "migrate", "archive", "rebuild-rollups", "rebuild-search", "import",
+                                 "finish-import"])
+    parser.add_argument("files", nargs="*", help="File CSV (hoặc .csv.gz) cho lệnh import")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ kiểm tra file, không ghi vào database")
+    parser.add_argument("--store", help="Tên store (file DB_SHARD_DIR/<store>.db), mặc định database chính")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
+    if args.command == "import":
+        if not args.files:
+            parser.error("import cần ít nhất một file CSV")
+        # Dùng module `db` (không phải __main__) để importer và CLI chung write queue/connection
+        import db as db_module
+        from importer import run_import_cli
+        with db_module.use_store(args.store):
+            raise SystemExit(run_import_cli(args.files, args.dry_run))
+    if args.command == "archive":
+        # Như import: archive.py dùng module `db`, không phải __main__
+        import db as db_module
+        with db_module.use_store(args.store):
+            db_module.init_db()
+            try:
+                db_module.maintenance.run(args.store, archive=True)
+                with db_module.get_read_db() as conn:
+                    for name, kind, period_start, period_end, rows in conn.execute(
+                        "SELECT name, kind, period_start, period_end, rows FROM archive_partitions "
+                        "ORDER BY period_start, kind"
+                    ):
+                        print(f"  {name:<8} {kind:<9} {period_start} → {period_end}: {rows:,} rows")
+            finally:
+                db_module.shutdown()
+        return
+
+    _current_store.set(args.store)
     init_db()
+    if args.command == "rebuild-rollups":
+        with get_db() as conn:
+            rebuild_rollups(conn)
+            bump_data_version(conn)
+    elif args.command == "rebuild-search":
+        with get_db() as conn:
+            rebuild_search_index(conn)
+    elif args.command == "finish-import":
+        with get_db() as conn:
+            print("✅ Đã hoàn tất import dở" if finish_import(conn) else "Không có import nào đang chạy")
+    elif args.command == "migrate":
+        maintenance.run(args.store, archive=False)
+        with get_read_db() as conn:
+            for version, name, applied_at, completed_at in conn.execute(
+                "SELECT version, name, applied_at, completed_at FROM schema_migrations ORDER BY version"
+            ):
+                print(f"  {version:>3} {name:<20} applied {applied_at}, {'done ' + completed_at if completed_at else 'pending'}")
+
     stats = get_stats()
     if stats:
         print("\n📊 Database Statistics:")
         print(f"  Sales: {stats['total_sales_count']} bills, {stats['total_sales_amount']:,}đ")
         print(f"  Expenses: {stats['total_expenses_count']} items, {stats['total_expenses_amount']:,}đ")
         print(f"  Profit: {stats['profit']:,}đ")
+    shutdown()
+
+if __name__ == "__main__":
+    main()
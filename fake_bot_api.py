@@ -0,0 +1,182 @@
+"""
+Fake Bot API module - Server Telegram Bot API giả lập chạy local (dùng cho load test)
+
+Hỗ trợ getMe, getUpdates (long polling), sendMessage, editMessageText, sendPhoto,
+sendDocument, answerCallbackQuery; các method khác trả về True.
+Bot kết nối bằng BOT_API_BASE_URL=http://host:port/bot
+"""
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from http_server import Request, start_server
+
+logger = logging.getLogger(__name__)
+
+# Tham số gửi dưới dạng JSON (PTB gửi chuỗi thô cho str, json.dumps cho kiểu khác)
+JSON_PARAMS = {"chat_id", "message_id", "reply_markup", "offset", "limit", "timeout",
+               "allowed_updates", "reply_to_message_id", "show_alert", "cache_time"}
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+
+
+def _parse_params(request: Request) -> Dict[str, Any]:
+    content_type = request.headers.get("content-type", "")
+    params: Dict[str, Any] = {}
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + request.body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                params[name] = {"filename": part.get_filename(), "size": len(payload)}
+            else:
+                params[name] = payload.decode("utf-8")
+    elif content_type.startswith("application/json"):
+        return json.loads(request.body or b"{}")
+    else:
+        params = {k: v[-1] for k, v in parse_qs(request.body.decode("utf-8"), keep_blank_values=True).items()}
+    for key in JSON_PARAMS & params.keys():
+        if isinstance(params[key], str):
+            try:
+                params[key] = json.loads(params[key])
+            except ValueError:
+                pass
+    return params
+
+
+class FakeBotAPI:
+    """
+    Giả lập Bot API: driver đưa update vào bằng push_update(), bot lấy qua getUpdates;
+    mọi tin bot gửi đi được ghi vào outbox(chat_id) để driver chờ phản hồi.
+    """
+
+    def __init__(self):
+        self._updates: List[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._new_update = asyncio.Event()
+        self._outboxes: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    # ===========================
+    # Phía driver
+    # ===========================
+    def push_update(self, update: dict) -> int:
+        update_id = next(self._update_ids)
+        update["update_id"] = update_id
+        self._updates.append(update)
+        self._new_update.set()
+        return update_id
+
+    def outbox(self, chat_id: int) -> asyncio.Queue:
+        """Hàng đợi (method, params, result) bot đã gửi tới chat này"""
+        return self._outboxes[chat_id]
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    # ===========================
+    # Phía bot
+    # ===========================
+    def _message(self, chat_id: int, **fields) -> dict:
+        return {
+            "message_id": fields.pop("message_id", None) or self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def _file(self, prefix: str) -> Tuple[str, str]:
+        n = next(self._file_ids)
+        return f"{prefix}-{n}", f"u{prefix}{n}"
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            # Các update có id < offset đã được bot xác nhận
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _record(self, chat_id: Any, method: str, params: Dict[str, Any], result: Any) -> Any:
+        try:
+            self._outboxes[int(chat_id)].put_nowait((method, params, result))
+        except (TypeError, ValueError):
+            pass
+        return result
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Any:
+        self.calls[method] += 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        chat_id = params.get("chat_id")
+        if method == "sendMessage":
+            result = self._message(chat_id, text=params.get("text", ""),
+                                   **({"reply_markup": params["reply_markup"]} if "reply_markup" in params else {}))
+            return self._record(chat_id, method, params, result)
+        if method == "editMessageText":
+            result = self._message(chat_id, message_id=params.get("message_id"), text=params.get("text", ""))
+            return self._record(chat_id, method, params, result)
+        if method == "sendPhoto":
+            file_id, unique_id = self._file("photo")
+            result = self._message(chat_id, caption=params.get("caption", ""), photo=[
+                {"file_id": file_id, "file_unique_id": unique_id, "width": 512, "height": 512}
+            ])
+            return self._record(chat_id, method, params, result)
+        if method == "sendDocument":
+            file_id, unique_id = self._file("document")
+            document = params.get("document")
+            file_name = document.get("filename") if isinstance(document, dict) else None
+            result = self._message(chat_id, caption=params.get("caption", ""), document={
+                "file_id": file_id, "file_unique_id": unique_id, "file_name": file_name or "file",
+            })
+            return self._record(chat_id, method, params, result)
+        # answerCallbackQuery, deleteWebhook, setMyCommands...
+        return True
+
+    async def handle(self, request: Request):
+        # Đường dẫn: /bot<token>/<method>
+        parts = request.path.strip("/").split("/")
+        if len(parts) != 2 or not parts[0].startswith("bot"):
+            return 404, {}, b""
+        try:
+            result = await self.call(parts[1], _parse_params(request))
+            status, body = 200, {"ok": True, "result": result}
+        except Exception as e:
+            logger.error(f"Fake Bot API error in {parts[1]}: {e}", exc_info=True)
+            status, body = 400, {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+        return status, {"Content-Type": "application/json"}, json.dumps(body).encode("utf-8")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Mở server, trả về cổng đang lắng nghe"""
+        self.server = await start_server(host, port, self.handle)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Trả lời ngay các getUpdates đang long polling để task của chúng kết thúc gọn
+        self._new_update.set()
+        await asyncio.sleep(0.1)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
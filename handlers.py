@@ -1,5 +1,6 @@
 # handlers.py - Fixed & Improved Version
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     ContextTypes,
     ConversationHandler,
@@ -8,15 +9,58 @@ from telegram.ext import (
     CommandHandler,
     filters
 )
-from db import get_db
-from utils import generate_qr
+from db import (
+    add_sale,
+    add_expense,
+    check_data_version,
+    current_store,
+    delete_subscription,
+    fetch_search_page,
+    forget_qr_file_id,
+    get_qr_file_id,
+    ImportInProgress,
+    import_running,
+    notify_write,
+    query_period_summary,
+    query_stats,
+    remember_qr_file_id,
+    run_read,
+    run_write,
+    save_subscription,
+    search_match,
+    use_store
+)
+from customers import Customer, find_customer, suggest_customers
+from importer import ImportInterrupted, ImportResult, format_interrupted, format_result, import_csv
+from reports import (
+    CachedReport,
+    ReportTooLarge,
+    build_report_file,
+    format_summary,
+    read_upload,
+    report_cache,
+    report_workers,
+    resolve_period
+)
+from utils import (
+    amount_error,
+    generate_qr,
+    generate_qr_image,
+    is_valid_label,
+    is_valid_phone,
+    local_qr_available,
+    parse_amount,
+    qr_cache_key
+)
 from config import Config
-import csv
-import os
+import asyncio
 import logging
-import re
+import os
+import sys
+import tempfile
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -36,6 +80,8 @@ NAME, PHONE, SERVICE, AMOUNT, NOTE, CONFIRM = range(6)
 REPORT_CHOICE, REPORT_CUSTOM = range(2)
 # /expense
 EXP_CATEGORY, EXP_AMOUNT, EXP_NOTE, EXP_CONFIRM = range(4)
+# /import
+IMPORT_FILE = 0
 
 # ===========================
 # /start
@@ -58,10 +104,35 @@ async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "/inbill - Thu tiền\n"
             "/expense - Chi phí\n"
             "/report - Báo cáo\n"
+            "/stats - Thống kê tổng quan\n"
+            "/search - Tìm hóa đơn/chi phí\n"
+            "/subscribe - Nhận tóm tắt mỗi sáng\n"
             "/cancel - Để hủy thao tác hiện tại."
         )
         await send_main_menu(update, context)
 
+# ===========================
+# /stats
+# ===========================
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Thống kê tổng quan toàn bộ dữ liệu (đọc từ bộ đếm, O(1))"""
+    try:
+        stats = await query_stats()
+    except Exception as e:
+        logger.error(f"Error getting stats: {e}", exc_info=True)
+        await update.message.reply_text("❌ Không lấy được thống kê. Vui lòng thử lại sau.")
+        return
+
+    profit = stats["profit"]
+    profit_text = f"+{profit:,}" if profit >= 0 else f"{profit:,}"
+    await update.message.reply_text(
+        f"📊 *THỐNG KÊ TỔNG QUAN*\n\n"
+        f"💵 Hóa đơn: `{stats['total_sales_count']}` - `{stats['total_sales_amount']:,}đ`\n"
+        f"💸 Chi phí: `{stats['total_expenses_count']}` - `{stats['total_expenses_amount']:,}đ`\n"
+        f"{'📈' if profit >= 0 else '📉'} *Lãi/Lỗ*: `{profit_text}đ`",
+        parse_mode="Markdown"
+    )
+
 # ====================
 # Gửi menu thao tác
 # ====================
@@ -90,7 +161,7 @@ async def menu_callback_inbill(update: Update, context: ContextTypes.DEFAULT_TYP
     """Callback để vào flow inbill từ menu"""
     query = update.callback_query
     await query.answer()
-    await query.message.reply_text("💵 *NHẬP HÓA ĐƠN*\n\nNhập tên khách hàng:", parse_mode="Markdown")
+    await query.message.reply_text("💵 *NHẬP HÓA ĐƠN*\n\nNhập tên khách hàng (hoặc SĐT khách quen):", parse_mode="Markdown")
     return NAME
 
 async def menu_callback_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -124,19 +195,64 @@ async def menu_callback_report(update: Update, context: ContextTypes.DEFAULT_TYP
 # ===========================
 async def start_bill(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Bắt đầu flow nhập hóa đơn"""
-    await update.message.reply_text("💵 *NHẬP HÓA ĐƠN*\n\nNhập tên khách hàng:", parse_mode="Markdown")
+    await update.message.reply_text("💵 *NHẬP HÓA ĐƠN*\n\nNhập tên khách hàng (hoặc SĐT khách quen):", parse_mode="Markdown")
     return NAME
 
+def _customer_keyboard(customers) -> Optional[InlineKeyboardMarkup]:
+    """Nút chọn nhanh khách quen (callback cust:<SĐT>)"""
+    if not customers:
+        return None
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"👤 {c.name} - {c.phone}", callback_data=f"cust:{c.phone}")] for c in customers
+    ])
+
+async def _service_prompt(message, context: ContextTypes.DEFAULT_TYPE, customer: Optional[Customer]):
+    """Hỏi dịch vụ; khách quen có thêm nút các dịch vụ gần nhất (callback svc:<vị trí>)"""
+    services = customer.services if customer else []
+    context.user_data["service_choices"] = list(services)
+    if not services:
+        await message.reply_text("💇 Nhập tên dịch vụ:")
+        return
+    keyboard = [[InlineKeyboardButton(f"💇 {service}", callback_data=f"svc:{i}")] for i, service in enumerate(services)]
+    await message.reply_text(
+        "💇 Chọn dịch vụ lần trước hoặc nhập tên dịch vụ:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def _use_customer(message, context: ContextTypes.DEFAULT_TYPE, customer: Customer):
+    context.user_data["name"] = customer.name
+    context.user_data["phone"] = customer.phone
+    await message.reply_text(f"👤 Khách quen: {customer.name} - {customer.phone}")
+    await _service_prompt(message, context, customer)
+    return SERVICE
+
 async def name_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Nhập tên khách hàng"""
+    """Nhập tên khách hàng, hoặc SĐT/đầu số của khách quen"""
     name = update.message.text.strip()
+    digits = name.replace(" ", "")
+
+    if digits.isdigit():
+        if is_valid_phone(digits):
+            customer = await find_customer(digits)
+            if customer:
+                return await _use_customer(update.message, context, customer)
+        matches = suggest_customers(digits) if len(digits) >= 3 else []
+        if matches:
+            await update.message.reply_text("🔎 Chọn khách quen hoặc nhập tên khách hàng:",
+                                            reply_markup=_customer_keyboard(matches))
+        else:
+            await update.message.reply_text("❌ Không tìm thấy khách quen với số này. Vui lòng nhập tên khách hàng:")
+        return NAME
     
-    if len(name) < 2:
+    if not is_valid_label(name):
         await update.message.reply_text("❌ Tên quá ngắn. Vui lòng nhập lại:")
         return NAME
     
     context.user_data["name"] = name
-    await update.message.reply_text("📞 Nhập số điện thoại (10 chữ số, bắt đầu bằng 0):")
+    await update.message.reply_text(
+        "📞 Nhập số điện thoại (10 chữ số, bắt đầu bằng 0):",
+        reply_markup=_customer_keyboard(suggest_customers(name))
+    )
     return PHONE
 
 async def phone_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -144,7 +260,7 @@ async def phone_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     phone = update.message.text.strip()
     
     # Validate SĐT Việt Nam: 10 số, bắt đầu bằng 0
-    if not re.match(r'^0\d{9}$', phone):
+    if not is_valid_phone(phone):
         await update.message.reply_text(
             "❌ Số điện thoại không hợp lệ!\n"
             "Vui lòng nhập 10 chữ số, bắt đầu bằng 0.\n"
@@ -153,14 +269,39 @@ async def phone_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return PHONE
     
     context.user_data["phone"] = phone
-    await update.message.reply_text("💇 Nhập tên dịch vụ:")
+    await _service_prompt(update.message, context, await find_customer(phone))
     return SERVICE
 
+async def pick_customer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Chọn khách quen từ nút gợi ý"""
+    query = update.callback_query
+    await query.answer()
+    customer = await find_customer(query.data.split(":", 1)[1])
+    if customer is None:
+        await query.message.reply_text("❌ Không tìm thấy khách hàng. Vui lòng nhập tên khách hàng:")
+        return NAME
+    await query.edit_message_reply_markup(reply_markup=None)
+    return await _use_customer(query.message, context, customer)
+
+async def pick_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Chọn dịch vụ lần trước của khách quen"""
+    query = update.callback_query
+    await query.answer()
+    choices = context.user_data.get("service_choices") or []
+    index = int(query.data.split(":", 1)[1])
+    if index >= len(choices):
+        await query.message.reply_text("💇 Nhập tên dịch vụ:")
+        return SERVICE
+    context.user_data["service"] = choices[index]
+    await query.edit_message_text(f"💇 Dịch vụ: {choices[index]}")
+    await query.message.reply_text("💰 Nhập số tiền (VNĐ):")
+    return AMOUNT
+
 async def service_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Nhập tên dịch vụ"""
     service = update.message.text.strip()
     
-    if len(service) < 2:
+    if not is_valid_label(service):
         await update.message.reply_text("❌ Tên dịch vụ quá ngắn. Vui lòng nhập lại:")
         return SERVICE
     
@@ -172,15 +313,11 @@ async def amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Nhập và validate số tiền"""
     try:
         # Loại bỏ dấu phẩy, dấu chấm nếu có
-        amount_str = update.message.text.strip().replace(",", "").replace(".", "")
-        amount = int(amount_str)
-        
-        if amount <= 0:
-            await update.message.reply_text("❌ Số tiền phải lớn hơn 0. Vui lòng nhập lại:")
-            return AMOUNT
+        amount = parse_amount(update.message.text)
         
-        if amount > 1000000000:  # 1 tỷ
-            await update.message.reply_text("❌ Số tiền quá lớn. Vui lòng kiểm tra lại:")
+        error = amount_error(amount)
+        if error:
+            await update.message.reply_text(f"❌ {error}. Vui lòng nhập lại:")
             return AMOUNT
         
         context.user_data["amount"] = amount
@@ -222,6 +359,37 @@ async def note_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return CONFIRM
 
+async def send_payment_qr(message, amount: int, phone: str, service: str):
+    """
+    Gửi ảnh QR thanh toán. Nếu QR y hệt (số tiền, SĐT, dịch vụ, tài khoản) đã
+    từng gửi thì dùng lại file_id Telegram; file_id hỏng sẽ bị xóa và gửi lại ảnh.
+    """
+    caption = f"💳 Quét mã QR để thanh toán {amount:,}đ"
+    cache_key = qr_cache_key(amount, phone, service)
+
+    file_id = await get_qr_file_id(cache_key)
+    if file_id:
+        try:
+            return await message.reply_photo(file_id, caption=caption)
+        except BadRequest as e:
+            logger.warning(f"Cached QR file_id rejected, sending new image: {e}")
+            await forget_qr_file_id(cache_key)
+
+    # Ưu tiên render PNG local, fallback sang URL img.vietqr.io
+    if local_qr_available():
+        loop = asyncio.get_running_loop()
+        qr_photo = await loop.run_in_executor(None, generate_qr_image, amount, phone, service)
+    else:
+        qr_photo = generate_qr(amount, phone, service)
+
+    sent = await message.reply_photo(qr_photo, caption=caption)
+    if sent.photo:
+        try:
+            await remember_qr_file_id(cache_key, sent.photo[-1].file_id, get_vn_time())
+        except Exception as e:
+            logger.warning(f"Cannot cache QR file_id: {e}")
+    return sent
+
 async def confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Xử lý xác nhận hóa đơn"""
     query = update.callback_query
@@ -232,18 +400,15 @@ async def confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         try:
             # Lưu vào database
-            with get_db() as conn:
-                c = conn.cursor()
-                c.execute(
-                    "INSERT INTO sales (name, phone, service, amount, note, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                    (data["name"], data["phone"], data["service"], data["amount"], data["note"], get_vn_time())
-                )
+            created_at = get_vn_time()
+            await add_sale(data["name"], data["phone"], data["service"], data["amount"], data["note"], created_at)
             
             logger.info(f"Saved bill for {data['name']} - {data['service']} - {data['amount']:,}đ")
             
-            # Tạo QR thanh toán
+            # Tạo QR thanh toán (raise ValueError nếu chưa cấu hình BANK_ACCOUNT)
             try:
-                qr_link = generate_qr(data["amount"], data["phone"], data["service"])
+                if not Config.BANK_ACCOUNT:
+                    raise ValueError("BANK_ACCOUNT chưa được cấu hình trong file .env")
                 
                 # Gửi thông báo thành công
                 await query.edit_message_text(
@@ -257,10 +422,7 @@ async def confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 
                 # Gửi QR code
-                await query.message.reply_photo(
-                    qr_link,
-                    caption=f"💳 Quét mã QR để thanh toán {data['amount']:,}đ"
-                )
+                await send_payment_qr(query.message, data["amount"], data["phone"], data["service"])
                 
             except ValueError as e:
                 # BANK_ACCOUNT chưa được cấu hình
@@ -320,14 +482,25 @@ def get_inbill_handler():
             CallbackQueryHandler(menu_callback_inbill, pattern="^goto_inbill$")
         ],
         states={
-            NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, name_input)],
-            PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, phone_input)],
-            SERVICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, service_input)],
+            NAME: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, name_input),
+                CallbackQueryHandler(pick_customer, pattern="^cust:")
+            ],
+            PHONE: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, phone_input),
+                CallbackQueryHandler(pick_customer, pattern="^cust:")
+            ],
+            SERVICE: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, service_input),
+                CallbackQueryHandler(pick_service, pattern="^svc:")
+            ],
             AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, amount_input)],
             NOTE: [MessageHandler(filters.TEXT & ~filters.COMMAND, note_input)],
             CONFIRM: [CallbackQueryHandler(confirm_callback, pattern="^confirm_bill_")],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="inbill",
+        persistent=Config.PERSISTENCE_ENABLED,
     )
 
 # ===========================
@@ -347,7 +520,7 @@ async def expense_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Nhập loại chi phí"""
     category = update.message.text.strip()
     
-    if len(category) < 2:
+    if not is_valid_label(category):
         await update.message.reply_text("❌ Loại chi phí quá ngắn. Vui lòng nhập lại:")
         return EXP_CATEGORY
     
@@ -358,15 +531,11 @@ async def expense_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def expense_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Nhập và validate số tiền chi"""
     try:
-        amount_str = update.message.text.strip().replace(",", "").replace(".", "")
-        amount = float(amount_str)
-        
-        if amount <= 0:
-            await update.message.reply_text("❌ Số tiền phải lớn hơn 0. Vui lòng nhập lại:")
-            return EXP_AMOUNT
+        amount = parse_amount(update.message.text, float)
         
-        if amount > 1000000000:
-            await update.message.reply_text("❌ Số tiền quá lớn. Vui lòng kiểm tra lại:")
+        error = amount_error(amount)
+        if error:
+            await update.message.reply_text(f"❌ {error}. Vui lòng nhập lại:")
             return EXP_AMOUNT
         
         context.user_data["amount"] = amount
@@ -416,12 +585,7 @@ async def confirm_expense_callback(update: Update, context: ContextTypes.DEFAULT
 
         try:
             # Lưu vào database
-            with get_db() as conn:
-                c = conn.cursor()
-                c.execute(
-                    "INSERT INTO expenses (category, amount, note, created_at) VALUES (?, ?, ?, ?)",
-                    (category, amount, note, get_vn_time()),
-                )
+            await add_expense(category, amount, note, get_vn_time())
             
             logger.info(f"Saved expense: {category} - {amount:,.0f}đ")
             
@@ -467,6 +631,8 @@ def get_expense_handler():
             EXP_CONFIRM: [CallbackQueryHandler(confirm_expense_callback, pattern="^confirm_exp_")],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="expense",
+        persistent=Config.PERSISTENCE_ENABLED,
     )
 
 # ===========================
@@ -493,13 +659,15 @@ async def report_choice_callback(update: Update, context: ContextTypes.DEFAULT_T
 
     if query.data == "month_current":
         await query.edit_message_text("⏳ Đang tạo báo cáo tháng hiện tại...")
-        await generate_report(update, context, report_type="current", message=query.message)
+        await generate_report(update, context, report_type="current", message=query.message,
+                              status_message=query.message)
         await send_main_menu(update, context)
         return ConversationHandler.END
         
     elif query.data == "month_previous":
         await query.edit_message_text("⏳ Đang tạo báo cáo tháng trước...")
-        await generate_report(update, context, report_type="previous", message=query.message)
+        await generate_report(update, context, report_type="previous", message=query.message,
+                              status_message=query.message)
         await send_main_menu(update, context)
         return ConversationHandler.END
         
@@ -541,8 +709,9 @@ async def report_custom_date(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return REPORT_CUSTOM
         
-        await update.message.reply_text("⏳ Đang tạo báo cáo...")
-        await generate_report(update, context, start_date, end_date, message=update.message)
+        status_message = await update.message.reply_text("⏳ Đang tạo báo cáo...")
+        await generate_report(update, context, start_date, end_date, message=update.message,
+                              status_message=status_message)
         
     except ValueError:
         await update.message.reply_text(
@@ -557,113 +726,122 @@ async def report_custom_date(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await send_main_menu(update, context)
     return ConversationHandler.END
 
-async def generate_report(update, context, start_date=None, end_date=None, report_type=None, message=None):
+def _read_and_remove(path: str) -> bytes:
+    """Đọc file báo cáo tạm do process con tạo (read_upload) rồi xóa"""
+    try:
+        with open(path, "rb") as f:
+            return read_upload(f)
+    finally:
+        os.remove(path)
+
+def _progress_editor(status_message, label: str = "⏳ Đang tạo báo cáo..."):
+    """Tạo callback cập nhật % tiến độ vào tin nhắn trạng thái (tối đa 1 lần / 2 giây)"""
+    last = {"time": 0.0, "percent": -1}
+
+    def on_progress(done: int, total: int):
+        if status_message is None or total <= 0:
+            return
+        percent = min(100, done * 100 // total)
+        now = time.monotonic()
+        if percent == last["percent"] or now - last["time"] < 2:
+            return
+        last.update(time=now, percent=percent)
+        task = asyncio.ensure_future(status_message.edit_text(f"{label} {percent}%"))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    return on_progress
+
+async def load_report(report_type=None, start_date=None, end_date=None):
+    """
+    Summary báo cáo của store hiện tại, lấy từ report cache hoặc tính từ daily_totals rồi lưu cache.
+    Trả về (cache_key, CachedReport, period_start, period_end).
+    """
+    period_start, period_end, period_text = resolve_period(report_type, start_date, end_date)
+    cache_key = (current_store(), report_type or "custom", period_start, period_end)
+    # Import/rebuild-rollups từ process khác (CLI) không qua write listener của bot
+    await check_data_version()
+
+    entry = report_cache.get(cache_key)
+    if entry is None:
+        cache_version = report_cache.version
+        # Tổng hợp từ bảng rollup daily_totals (chạy trên thread DB, không block event loop)
+        summary = await query_period_summary(period_start, period_end)
+        text_report, profit_text = format_summary(summary, period_text)
+        entry = CachedReport(summary=summary, text=text_report, profit_text=profit_text)
+        report_cache.put(cache_key, entry, cache_version)
+    return cache_key, entry, period_start, period_end
+
+async def send_report_document(send_document, cache_key, entry, period_start, period_end, user_id=None,
+                               status_message=None) -> bool:
+    """
+    Gửi file CSV chi tiết bằng send_document(document, filename=..., caption=...) và lưu file_id vào cache.
+    False nếu user đang có báo cáo lớn khác đang tạo (chưa gửi gì); raise ReportTooLarge nếu file vượt
+    REPORT_UPLOAD_MAX_MB.
+    """
+    # File đã upload trước đó: gửi lại bằng file_id, không query/upload lại
+    if entry.file_id:
+        try:
+            await send_document(entry.file_id, caption="📄 File báo cáo chi tiết")
+            return True
+        except BadRequest as e:
+            logger.warning(f"Cached report file_id rejected, re-uploading: {e}")
+            report_cache.forget_file(cache_key)
+
+    cache_version = report_cache.version
+    row_count = entry.summary["sales"]["count"] + entry.summary["expenses"]["count"]
+    if row_count >= Config.REPORT_PROCESS_MIN_ROWS:
+        # Báo cáo lớn: tạo trong process pool để không chiếm CPU của bot
+        if not report_workers.try_acquire(user_id):
+            return False
+        try:
+            path, filename = await report_workers.build(
+                period_start, period_end, entry.summary, entry.profit_text,
+                on_progress=_progress_editor(status_message)
+            )
+        finally:
+            report_workers.release(user_id)
+        content = await asyncio.get_running_loop().run_in_executor(None, _read_and_remove, path)
+    else:
+        # Ghi CSV streaming vào buffer tạm (RAM/đĩa) trên thread DB
+        report_file, filename = await run_read(
+            build_report_file, period_start, period_end, entry.summary, entry.profit_text
+        )
+        try:
+            content = await asyncio.get_running_loop().run_in_executor(None, read_upload, report_file)
+        finally:
+            report_file.close()
+    sent = await send_document(content, filename=filename, caption="📄 File báo cáo chi tiết")
+    if sent.document and cache_version == report_cache.version:
+        entry.file_id = sent.document.file_id
+    return True
+
+async def generate_report(update, context, start_date=None, end_date=None, report_type=None, message=None,
+                          status_message=None):
     """Tạo báo cáo doanh thu và chi phí"""
     if message is None:
         message = update.message
 
     try:
-        with get_db() as conn:
-            c = conn.cursor()
-            
-            # Xác định khoảng thời gian
-            vn_timezone = Config.get_timezone_info()
-            
-            if report_type == "current":
-                now = datetime.now(vn_timezone)
-                year, month = now.year, now.month
-                where_clause = "strftime('%Y', created_at)=? AND strftime('%m', created_at)=?"
-                params = (str(year), f"{month:02d}")
-                period_text = f"tháng {month}/{year}"
-                
-            elif report_type == "previous":
-                now = datetime.now(vn_timezone)
-                if now.month == 1:
-                    year, month = now.year - 1, 12
-                else:
-                    year, month = now.year, now.month - 1
-                where_clause = "strftime('%Y', created_at)=? AND strftime('%m', created_at)=?"
-                params = (str(year), f"{month:02d}")
-                period_text = f"tháng {month}/{year}"
-                
-            else:  # Custom date range
-                where_clause = "date(created_at) BETWEEN ? AND ?"
-                params = (str(start_date), str(end_date))
-                period_text = f"{start_date} đến {end_date}"
-            
-            # Lấy dữ liệu sales
-            c.execute(f"""
-                SELECT id, name, phone, service, amount, note, created_at
-                FROM sales
-                WHERE {where_clause}
-                ORDER BY created_at DESC
-            """, params)
-            sales_rows = c.fetchall()
-            
-            # Lấy dữ liệu expenses
-            c.execute(f"""
-                SELECT id, category, amount, note, created_at
-                FROM expenses
-                WHERE {where_clause}
-                ORDER BY created_at DESC
-            """, params)
-            expense_rows = c.fetchall()
-
-        # Tính toán
-        total_sales = sum(row[4] for row in sales_rows)
-        total_expenses = sum(row[2] for row in expense_rows)
-        profit = total_sales - total_expenses
-        
-        # Tạo text báo cáo
-        profit_emoji = "📈" if profit >= 0 else "📉"
-        profit_text = f"+{profit:,}" if profit >= 0 else f"{profit:,}"
-        
-        text_report = (
-            f"📊 *BÁO CÁO TỔNG HỢP*\n"
-            f"Kỳ: _{period_text}_\n\n"
-            f"💵 *Doanh thu*\n"
-            f"• Số hóa đơn: `{len(sales_rows)}`\n"
-            f"• Tổng thu: `{total_sales:,}đ`\n\n"
-            f"💸 *Chi phí*\n"
-            f"• Số khoản chi: `{len(expense_rows)}`\n"
-            f"• Tổng chi: `{total_expenses:,}đ`\n\n"
-            f"{profit_emoji} *Lãi/Lỗ*: `{profit_text}đ`"
-        )
+        cache_key, entry, period_start, period_end = await load_report(report_type, start_date, end_date)
         
-        await message.reply_text(text_report, parse_mode="Markdown")
+        await message.reply_text(entry.text, parse_mode="Markdown")
         
-        # Tạo CSV nếu có dữ liệu
-        if sales_rows or expense_rows:
-            os.makedirs("report", exist_ok=True)
-            vn_timezone = Config.get_timezone_info()
-            csv_filename = f"report/report_{datetime.now(vn_timezone).strftime('%Y%m%d_%H%M%S')}.csv"
-            
-            with open(csv_filename, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.writer(f)
-                
-                # Sheet 1: Sales
-                writer.writerow(["=== DOANH THU ==="])
-                writer.writerow(["ID", "Tên khách hàng", "SĐT", "Dịch vụ", "Số tiền", "Ghi chú", "Ngày tạo"])
-                for row in sales_rows:
-                    writer.writerow(row)
-                
-                writer.writerow([])
-                
-                # Sheet 2: Expenses
-                writer.writerow(["=== CHI PHÍ ==="])
-                writer.writerow(["ID", "Loại chi phí", "Số tiền", "Ghi chú", "Ngày tạo"])
-                for row in expense_rows:
-                    writer.writerow(row)
-                
-                writer.writerow([])
-                writer.writerow(["=== TỔNG KẾT ==="])
-                writer.writerow(["Tổng doanh thu", f"{total_sales:,}đ"])
-                writer.writerow(["Tổng chi phí", f"{total_expenses:,}đ"])
-                writer.writerow(["Lãi/Lỗ", f"{profit_text}đ"])
-
-            with open(csv_filename, "rb") as f:
-                await message.reply_document(f, caption="📄 File báo cáo chi tiết")
+        # Tạo CSV nếu có dữ liệu (chỉ lúc này mới đọc dữ liệu chi tiết)
+        if entry.has_detail:
+            user_id = update.effective_user.id if update and update.effective_user else None
+            if not await send_report_document(message.reply_document, cache_key, entry, period_start, period_end,
+                                              user_id, status_message):
+                await message.reply_text(
+                    "⚠️ Bạn đang có một báo cáo lớn đang được tạo.\n"
+                    "Vui lòng đợi báo cáo đó hoàn tất rồi thử lại."
+                )
                 
+    except ReportTooLarge as e:
+        await message.reply_text(
+            f"⚠️ File báo cáo chi tiết quá lớn để gửi ({e.size / 1024 / 1024:.1f}MB, "
+            f"tối đa {Config.REPORT_UPLOAD_MAX_MB}MB).\n"
+            "Vui lòng chọn khoảng thời gian ngắn hơn."
+        )
     except Exception as e:
         logger.error(f"Error generating report: {e}", exc_info=True)
         await message.reply_text(
@@ -684,4 +862,205 @@ def get_report_handler():
             REPORT_CUSTOM: [MessageHandler(filters.TEXT & ~filters.COMMAND, report_custom_date)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="report",
+        persistent=Config.PERSISTENCE_ENABLED,
+    )
+
+# ===========================
+# /import ConversationHandler
+# ===========================
+async def start_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bắt đầu flow import CSV"""
+    await update.message.reply_text(
+        "📥 *Import dữ liệu*\n\n"
+        "Gửi file CSV (hoặc .csv.gz) theo định dạng file báo cáo chi tiết:\n"
+        "• Section `=== DOANH THU ===` / `=== CHI PHÍ ===` với dòng tiêu đề như file báo cáo\n"
+        "• Ngày tạo dạng `yyyy-mm-dd HH:MM:SS`\n\n"
+        f"Dung lượng tối đa {Config.IMPORT_MAX_FILE_MB}MB. Gõ /cancel để hủy.",
+        parse_mode="Markdown"
+    )
+    return IMPORT_FILE
+
+IMPORT_BUSY_TEXT = "⚠️ Đang có một import khác chạy. Vui lòng thử lại sau."
+
+def _run_import(store: Optional[str], path: str, on_progress) -> ImportResult:
+    """Chạy trên thread riêng: import_csv chặn tới khi từng batch được commit"""
+    with use_store(store):
+        return import_csv(path, progress=on_progress)
+
+async def import_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Nhận file, import trên thread riêng và báo kết quả"""
+    document = update.message.document
+    if document.file_size and document.file_size > Config.IMPORT_MAX_FILE_MB * 1024 * 1024:
+        await update.message.reply_text(
+            f"❌ File quá lớn (tối đa {Config.IMPORT_MAX_FILE_MB}MB). Vui lòng gửi file khác:"
+        )
+        return IMPORT_FILE
+    if await run_read(import_running):
+        await update.message.reply_text(IMPORT_BUSY_TEXT)
+        return ConversationHandler.END
+
+    status_message = await update.message.reply_text("⏳ Đang import...")
+    fd, path = tempfile.mkstemp(prefix="import_", suffix=".csv")
+    os.close(fd)
+    try:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+
+        loop = asyncio.get_running_loop()
+        editor = _progress_editor(status_message, "⏳ Đang import...")
+        on_progress = lambda done, total: loop.call_soon_threadsafe(editor, done, total)
+        result = await loop.run_in_executor(None, _run_import, current_store(), path, on_progress)
+        # Dữ liệu có thể thuộc bất kỳ ngày nào: xóa toàn bộ cache báo cáo
+        notify_write("sales", None)
+        notify_write("expenses", None)
+        await status_message.edit_text(format_result(result))
+    except ImportInProgress:
+        # Import khác (worker/process khác) nhận khóa trong lúc tải file
+        await status_message.edit_text(IMPORT_BUSY_TEXT)
+    except ImportInterrupted as e:
+        logger.error(f"Error importing CSV: {e.error}", exc_info=e.error)
+        if e.result.sales or e.result.expenses:
+            # Các batch đã commit vẫn nằm trong database
+            notify_write("sales", None)
+            notify_write("expenses", None)
+            await status_message.edit_text(f"❌ Import {format_interrupted(e)}")
+        elif isinstance(e.error, UnicodeDecodeError):
+            await status_message.edit_text("❌ File không phải CSV UTF-8. Vui lòng kiểm tra lại file.")
+        else:
+            await status_message.edit_text(f"❌ Có lỗi xảy ra khi import.\n\nChi tiết lỗi: {str(e.error)}")
+    except Exception as e:
+        logger.error(f"Error importing CSV: {e}", exc_info=True)
+        await status_message.edit_text(f"❌ Có lỗi xảy ra khi import.\n\nChi tiết lỗi: {str(e)}")
+    finally:
+        os.remove(path)
+
+    await send_main_menu(update, context)
+    return ConversationHandler.END
+
+async def import_not_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("❌ Vui lòng gửi file CSV (dạng tài liệu) hoặc gõ /cancel để hủy:")
+    return IMPORT_FILE
+
+def get_import_handler():
+    """Tạo ConversationHandler cho /import"""
+    return ConversationHandler(
+        entry_points=[CommandHandler("import", start_import)],
+        states={
+            IMPORT_FILE: [
+                MessageHandler(filters.Document.ALL, import_file),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, import_not_file),
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="import",
+        persistent=Config.PERSISTENCE_ENABLED,
+    )
+
+# ===========================
+# /search
+# ===========================
+SEARCH_PREFIX = "🔎 Tìm: "
+SEARCH_MAX_QUERY = 100
+
+def _search_cursor(before: dict) -> str:
+    return f"{before['sales']}:{before['expenses']}"
+
+def _format_search_row(kind: str, row: tuple) -> str:
+    if kind == "sales":
+        _, name, phone, service, amount, note, created_at = row
+        text = f"💵 {created_at[:16]} · {name} · {phone} · {service} · {amount:,.0f}đ"
+    else:
+        _, category, amount, note, created_at = row
+        text = f"💸 {created_at[:16]} · {category} · {amount:,.0f}đ"
+    if not note:
+        return text
+    return f"{text}\n    📝 {note if len(note) <= 100 else note[:100] + '…'}"
+
+async def _search_page(text: str, before: dict, page: int):
+    """Nội dung và bàn phím của một trang kết quả (câu tìm kiếm nằm ở dòng đầu để nút trang sau đọc lại)"""
+    rows, next_before = await run_read(fetch_search_page, search_match(text), before, Config.SEARCH_PAGE_SIZE)
+    header = f"{SEARCH_PREFIX}{text}"
+    if not rows:
+        return f"{header}\n\n{'Không tìm thấy kết quả nào.' if page == 1 else 'Không còn kết quả.'}", None
+    lines = [f"{header}\n📄 Trang {page}\n"] + [_format_search_row(kind, row) for kind, row in rows]
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton("⏮ Trang đầu", callback_data="search:1:0:0"))
+    if any(next_before.values()):
+        buttons.append(InlineKeyboardButton(
+            "Trang sau ➡️", callback_data=f"search:{page + 1}:{_search_cursor(next_before)}"
+        ))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/search <từ khóa>: tìm theo tên, SĐT, dịch vụ, loại chi phí, ghi chú (FTS5)"""
+    text = " ".join(context.args or [])[:SEARCH_MAX_QUERY].strip()
+    if not search_match(text):
+        await update.message.reply_text(
+            "🔎 Cách dùng: /search <từ khóa>\n"
+            "Tìm theo tên khách, SĐT, dịch vụ, loại chi phí hoặc ghi chú (không cần gõ dấu).\n"
+            "Ví dụ: /search nguyen lan, /search 0901, /search nhuom"
+        )
+        return
+    try:
+        content, markup = await _search_page(text, {"sales": sys.maxsize, "expenses": sys.maxsize}, 1)
+    except Exception as e:
+        logger.error(f"Error searching: {e}", exc_info=True)
+        await update.message.reply_text("❌ Không tìm được. Vui lòng thử lại sau.")
+        return
+    await update.message.reply_text(content, reply_markup=markup)
+
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Nút chuyển trang: search:<trang>:<id sales>:<id expenses> (0:0 ở trang 1 = từ đầu)"""
+    query = update.callback_query
+    await query.answer()
+    header = (query.message.text or "").split("\n", 1)[0]
+    if not header.startswith(SEARCH_PREFIX):
+        return
+    _, page, sales_before, expenses_before = query.data.split(":")
+    page = int(page)
+    before = {"sales": int(sales_before), "expenses": int(expenses_before)}
+    if page == 1:
+        before = {"sales": sys.maxsize, "expenses": sys.maxsize}
+    try:
+        content, markup = await _search_page(header[len(SEARCH_PREFIX):], before, page)
+        await query.edit_message_text(content, reply_markup=markup)
+    except BadRequest as e:
+        # Bấm lại đúng trang đang xem: nội dung không đổi
+        if "not modified" not in str(e).lower():
+            raise
+
+# ===========================
+# /subscribe - tóm tắt định kỳ
+# ===========================
+# Thứ trong tuần theo SUMMARY_DAYS (0 = Chủ nhật, như JobQueue.run_daily)
+WEEKDAY_NAMES = {0: "Chủ nhật", 1: "thứ 2", 2: "thứ 3", 3: "thứ 4", 4: "thứ 5", 5: "thứ 6", 6: "thứ 7"}
+
+def format_summary_days(days: Tuple[int, ...]) -> str:
+    """"mỗi ngày" hoặc danh sách thứ theo thứ tự thứ 2 -> Chủ nhật"""
+    if len(set(days)) == len(WEEKDAY_NAMES):
+        return "mỗi ngày"
+    return "vào " + ", ".join(WEEKDAY_NAMES[day] for day in sorted(days, key=lambda day: (day + 6) % 7))
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Chat này nhận tóm tắt hôm qua và tháng này vào các ngày SUMMARY_DAYS (jobs.py)"""
+    schedule = Config.get_summary_schedule()
+    if schedule is None:
+        await update.message.reply_text("⚠️ Tóm tắt định kỳ đang tắt (SUMMARY_TIME chưa cấu hình).")
+        return
+    # Danh sách đăng ký nằm trong database chính (như conversations/user_data)
+    with use_store(None):
+        added = await run_write(save_subscription, update.effective_chat.id, get_vn_time())
+    await update.message.reply_text(
+        f"{'✅ Đã đăng ký' if added else 'ℹ️ Chat này đã đăng ký'} nhận tóm tắt doanh thu/chi phí "
+        f"lúc {schedule[0]:%H:%M} {format_summary_days(schedule[1])}.\n"
+        "Dùng /unsubscribe để hủy."
+    )
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    with use_store(None):
+        removed = await run_write(delete_subscription, update.effective_chat.id)
+    await update.message.reply_text(
+        "✅ Đã hủy nhận tóm tắt định kỳ." if removed else "ℹ️ Chat này chưa đăng ký nhận tóm tắt."
     )
@@ -0,0 +1,86 @@
+"""
+HTTP server module - HTTP/1.1 server tối giản chạy trên asyncio
+(dùng cho webhook và các endpoint nội bộ, không cần thêm dependency)
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Tuple
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn kích thước body để tránh bị gửi request quá lớn
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, list]
+    headers: Dict[str, str] = field(default_factory=dict)  # key viết thường
+    body: bytes = b""
+
+
+Response = Tuple[int, Dict[str, str], bytes]
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str],
+                    body: bytes, keep_alive: bool):
+    reason = HTTPStatus(status).phrase
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    headers = {"Content-Length": str(len(body)), **headers}
+    headers.setdefault("Connection", "keep-alive" if keep_alive else "close")
+    lines.extend(f"{key}: {value}" for key, value in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: Handler):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, version = request_line.decode("latin-1").split()
+            headers: Dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY_BYTES:
+                _write_response(writer, 413, {}, b"", keep_alive=False)
+                await writer.drain()
+                break
+            body = await reader.readexactly(length) if length else b""
+
+            path, _, query_string = target.partition("?")
+            request = Request(method.upper(), path, parse_qs(query_string), headers, body)
+            try:
+                status, response_headers, response_body = await handler(request)
+            except Exception as e:
+                logger.error(f"HTTP handler error on {method} {path}: {e}", exc_info=True)
+                status, response_headers, response_body = 500, {}, b""
+
+            _write_response(writer, status, response_headers, response_body, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host: str, port: int, handler: Handler) -> asyncio.AbstractServer:
+    """Mở HTTP server; mỗi connection được xử lý trong task riêng nên các request chạy song song"""
+    return await asyncio.start_server(
+        lambda reader, writer: _handle_connection(reader, writer, handler), host, port
+    )
@@ -0,0 +1,282 @@
+"""
+Importer module - Import lịch sử hóa đơn/chi phí từ file CSV (cùng định dạng file báo cáo)
+"""
+import csv
+import gzip
+import hashlib
+import io
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+from config import Config
+import db
+from reports import EXPENSES_HEADER, SALES_HEADER
+from utils import amount_error, is_valid_label, is_valid_phone, parse_amount
+
+logger = logging.getLogger(__name__)
+
+# Số lỗi tối đa giữ lại để hiển thị
+MAX_REPORTED_ERRORS = 20
+
+SECTION_KINDS = {"=== DOANH THU ===": "sales", "=== CHI PHÍ ===": "expenses"}
+HEADER_KINDS = {tuple(SALES_HEADER): "sales", tuple(EXPENSES_HEADER): "expenses"}
+DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+_DECIMAL_AMOUNT = re.compile(r"^\d+\.\d{1,2}$")  # số thực xuất từ cột REAL, vd. 150000.0
+
+
+@dataclass
+class ImportResult:
+    sales: int = 0
+    expenses: int = 0
+    skipped: int = 0
+    errors: List[str] = field(default_factory=list)
+    # Dòng CSV cuối đã ghi ở lần import dở trước của cùng file (0 = import từ đầu)
+    resumed_from: int = 0
+
+    def add_error(self, line: int, reason: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Dòng {line}: {reason}")
+
+class ImportInterrupted(Exception):
+    """
+    Import dừng giữa chừng (lỗi đọc file, lỗi database...): các batch trước đó đã commit.
+    result đếm số dòng đã ghi của file (kể cả lần import dở trước), line là dòng CSV cuối đã commit;
+    import lại cùng file sẽ chạy tiếp sau dòng đó.
+    """
+
+    def __init__(self, result: ImportResult, line: int, error: Exception):
+        super().__init__(str(error))
+        self.result = result
+        self.line = line
+        self.error = error
+
+
+
+# ===========================
+# Đọc và validate CSV
+# ===========================
+def _csv_amount(text: str, number_type=int):
+    text = text.strip()
+    if _DECIMAL_AMOUNT.match(text):
+        value = float(text)
+        if number_type is int and not value.is_integer():
+            raise ValueError("số tiền hóa đơn phải là số nguyên")
+        amount = number_type(value)
+    else:
+        try:
+            amount = parse_amount(text, number_type)
+        except ValueError:
+            raise ValueError(f"số tiền không hợp lệ: {text!r}")
+    error = amount_error(amount)
+    if error:
+        raise ValueError(error.lower())
+    return amount
+
+
+def _created_at(text: str) -> str:
+    text = text.strip()
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"ngày tạo không hợp lệ: {text!r} (yyyy-mm-dd HH:MM:SS)")
+
+
+def validate_sale_row(row: List[str]) -> tuple:
+    """[ID, tên, SĐT, dịch vụ, số tiền, ghi chú, ngày tạo] -> tuple để insert (bỏ ID)"""
+    if len(row) != len(SALES_HEADER):
+        raise ValueError(f"cần {len(SALES_HEADER)} cột, có {len(row)}")
+    _, name, phone, service, amount, note, created_at = row
+    if not is_valid_label(name):
+        raise ValueError("tên khách hàng quá ngắn")
+    if not is_valid_phone(phone):
+        raise ValueError(f"số điện thoại không hợp lệ: {phone!r}")
+    if not is_valid_label(service):
+        raise ValueError("tên dịch vụ quá ngắn")
+    return (name.strip(), phone.strip(), service.strip(), _csv_amount(amount, int), note.strip(),
+            _created_at(created_at))
+
+
+def validate_expense_row(row: List[str]) -> tuple:
+    """[ID, loại chi phí, số tiền, ghi chú, ngày tạo] -> tuple để insert (bỏ ID)"""
+    if len(row) != len(EXPENSES_HEADER):
+        raise ValueError(f"cần {len(EXPENSES_HEADER)} cột, có {len(row)}")
+    _, category, amount, note, created_at = row
+    if not is_valid_label(category):
+        raise ValueError("loại chi phí quá ngắn")
+    return (category.strip(), _csv_amount(amount, float), note.strip(), _created_at(created_at))
+
+
+VALIDATORS = {"sales": validate_sale_row, "expenses": validate_expense_row}
+
+
+def iter_import_rows(reader: Iterator[List[str]]) -> Iterator[Tuple[int, str, List[str]]]:
+    """
+    Duyệt CSV theo từng section của file báo cáo, trả về (số dòng, "sales"/"expenses", row).
+    Section tổng kết/thống kê được bỏ qua; file chỉ có một bảng (header + dữ liệu) cũng được.
+    """
+    kind: Optional[str] = None
+    for line, row in enumerate(reader, start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        first = row[0].strip()
+        if first.startswith("===") and first.endswith("==="):
+            kind = SECTION_KINDS.get(first)
+            continue
+        header_kind = HEADER_KINDS.get(tuple(cell.strip() for cell in row))
+        if header_kind:
+            kind = header_kind
+            continue
+        if kind:
+            yield line, kind, row
+
+
+def _open_binary(path: str) -> Tuple[IO[bytes], IO[bytes]]:
+    """Trả về (file gốc để đo tiến độ, stream đã giải nén nếu là gzip)"""
+    raw = open(path, "rb")
+    if raw.read(2) == b"\x1f\x8b":
+        raw.seek(0)
+        return raw, gzip.GzipFile(fileobj=raw)
+    raw.seek(0)
+    return raw, raw
+
+
+def file_fingerprint(path: str) -> str:
+    """Định danh nội dung file để nhận ra lần import lại của cùng file (tên file tạm thay đổi mỗi lần tải)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+# ===========================
+# Import
+# ===========================
+def import_csv(path: str, execute: Callable = None, batch_size: int = None, dry_run: bool = False,
+               progress: Optional[Callable[[int, int], None]] = None) -> ImportResult:
+    """
+    Import file CSV (có thể nén gzip) theo định dạng file báo cáo.
+    Dòng không hợp lệ bị bỏ qua và ghi lại lý do. Dữ liệu được ghi bằng executemany theo batch
+    IMPORT_BATCH_SIZE dòng (mỗi batch một transaction qua write queue); index và trigger của
+    sales/expenses được xóa trước và tạo lại cùng index tìm kiếm, daily_totals/stats_counters một lần ở cuối.
+    Mỗi store chỉ chạy một import tại một thời điểm (khóa import_state trong database, dùng chung giữa
+    các process): raise db.ImportInProgress nếu đã có import khác.
+    Mỗi batch ghi kèm tiến độ (dòng CSV cuối đã commit) của file trong cùng transaction: nếu import dừng
+    giữa chừng thì raise ImportInterrupted với số dòng đã ghi, import lại cùng file sẽ bỏ qua các dòng
+    đã commit thay vì ghi trùng.
+    progress(số byte đã đọc, tổng số byte) được gọi sau mỗi batch nếu có.
+    Chặn thread hiện tại - không gọi trực tiếp từ event loop.
+    """
+    execute = execute or db.write_sync
+    batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+    result = ImportResult()
+    total_bytes = os.path.getsize(path)
+    source = None if dry_run else file_fingerprint(path)
+    raw, binary = _open_binary(path)
+    batches: Dict[str, List[tuple]] = {"sales": [], "expenses": []}
+    committed_line = 0
+
+    def flush(line: int):
+        # Ghi cả hai bảng cùng lúc: mọi dòng hợp lệ tới `line` đều đã commit khi lưu tiến độ
+        nonlocal committed_line
+        if not dry_run:
+            execute(db.insert_import_batch, source, line, batches["sales"], batches["expenses"])
+        result.sales += len(batches["sales"])
+        result.expenses += len(batches["expenses"])
+        batches["sales"], batches["expenses"] = [], []
+        committed_line = line
+        if progress:
+            progress(raw.tell(), total_bytes)
+
+    with raw, io.TextIOWrapper(binary, encoding="utf-8-sig", newline="") as text:
+        if not dry_run:
+            execute(db.begin_import)
+        completed = False
+        try:
+            resumed = None if dry_run else execute(db.import_progress, source)
+            if resumed:
+                result.resumed_from, result.sales, result.expenses = resumed
+                committed_line = result.resumed_from
+                logger.info(f"📥 Import {os.path.basename(path)}: chạy tiếp sau dòng {result.resumed_from}")
+            line = committed_line
+            for line, kind, row in iter_import_rows(csv.reader(text)):
+                if line <= result.resumed_from:
+                    continue
+                try:
+                    batches[kind].append(VALIDATORS[kind](row))
+                except ValueError as e:
+                    result.add_error(line, str(e))
+                    continue
+                if len(batches[kind]) >= batch_size:
+                    flush(line)
+            if batches["sales"] or batches["expenses"]:
+                flush(line)
+            completed = True
+        except Exception as e:
+            if dry_run:
+                raise
+            logger.warning(f"⚠️ Import {os.path.basename(path)} dừng sau dòng {committed_line}: đã ghi "
+                           f"{result.sales} hóa đơn, {result.expenses} chi phí")
+            raise ImportInterrupted(result, committed_line, e) from e
+        finally:
+            if not dry_run:
+                execute(db.finish_import, source if completed else None)
+
+    logger.info(f"📥 Import {os.path.basename(path)}: {result.sales} hóa đơn, {result.expenses} chi phí, "
+                f"bỏ qua {result.skipped} dòng")
+    return result
+
+
+def format_result(result: ImportResult, dry_run: bool = False) -> str:
+    lines = [
+        f"{'🔍 Kiểm tra' if dry_run else '✅ Đã import'}: {result.sales:,} hóa đơn, {result.expenses:,} chi phí",
+    ]
+    if result.resumed_from:
+        lines.append(f"↪️ Chạy tiếp lần import dở trước (đã ghi tới dòng {result.resumed_from:,})")
+    if result.skipped:
+        lines.append(f"⚠️ Bỏ qua {result.skipped:,} dòng không hợp lệ:")
+        lines.extend(f"  • {error}" for error in result.errors)
+        if result.skipped > len(result.errors):
+            lines.append(f"  • ... và {result.skipped - len(result.errors):,} dòng khác")
+    return "\n".join(lines)
+
+
+def format_interrupted(error: ImportInterrupted) -> str:
+    result = error.result
+    return (f"import dừng sau dòng {error.line:,} - đã ghi {result.sales:,} hóa đơn, {result.expenses:,} chi phí. "
+            f"Import lại cùng file để chạy tiếp từ dòng tiếp theo.\nChi tiết lỗi: {error.error}")
+
+
+def run_import_cli(paths: List[str], dry_run: bool = False) -> int:
+    """`python db.py import file.csv [...]`: import lần lượt từng file, trả về exit code"""
+    db.init_db()
+    exit_code = 0
+    try:
+        for path in paths:
+            if not os.path.isfile(path):
+                print(f"\n❌ Không tìm thấy file: {path}")
+                exit_code = 1
+                continue
+            try:
+                result = import_csv(path, dry_run=dry_run)
+            except db.ImportInProgress:
+                print(f"\n❌ {path}: đang có một import khác chạy trên database này")
+                exit_code = 1
+                continue
+            except ImportInterrupted as e:
+                print(f"\n❌ {path}: {format_interrupted(e)}")
+                exit_code = 1
+                continue
+            print(f"\n📄 {path}")
+            print(format_result(result, dry_run))
+            if result.skipped:
+                exit_code = 1
+    finally:
+        db.shutdown()
+    return exit_code
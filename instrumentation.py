@@ -0,0 +1,85 @@
+"""
+Instrumentation module - Đo thời gian handler, Telegram API và độ dài hàng đợi của bot
+"""
+import functools
+import logging
+import time
+from telegram.ext import Application, BaseHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+from metrics import (HANDLER_ERRORS, HANDLER_SECONDS, QUEUE_DEPTH, TELEGRAM_API_ERRORS,
+                     TELEGRAM_API_SECONDS, start_metrics_server)
+from reports import report_workers
+
+logger = logging.getLogger(__name__)
+
+_metrics_server = None
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest ghi lại thời gian/lỗi của từng method Bot API (sendMessage, sendPhoto...)"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            TELEGRAM_API_ERRORS.inc(api_method)
+            raise
+        finally:
+            TELEGRAM_API_SECONDS.observe(time.perf_counter() - start, api_method)
+
+
+def _timed_callback(callback, conversation: str):
+    name = getattr(callback, "__name__", type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(conversation, name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, conversation, name)
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_handler(handler: BaseHandler, conversation: str = ""):
+    """Bọc callback của handler (và mọi bước của ConversationHandler) để đo latency"""
+    if isinstance(handler, ConversationHandler):
+        steps = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            steps.extend(state_handlers)
+        for step in steps:
+            instrument_handler(step, handler.name or conversation)
+        return
+    if not getattr(handler.callback, "_instrumented", False):
+        handler.callback = _timed_callback(handler.callback, conversation)
+
+
+def instrument_application(app: Application):
+    """Bọc toàn bộ handler đã đăng ký và đăng ký gauge hàng đợi của app"""
+    for group in app.handlers.values():
+        for handler in group:
+            instrument_handler(handler)
+    QUEUE_DEPTH.set_function(app.update_queue.qsize, "updates")
+    QUEUE_DEPTH.set_function(lambda: report_workers.pending, "report_jobs")
+
+
+async def start_metrics(app: Application):
+    """post_init: mở endpoint /metrics (METRICS_PORT=0 thì bỏ qua)"""
+    global _metrics_server
+    _metrics_server = await start_metrics_server()
+
+
+async def stop_metrics(app: Application):
+    """post_shutdown: đóng endpoint /metrics"""
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.close()
+        await _metrics_server.wait_closed()
+        _metrics_server = None
@@ -0,0 +1,104 @@
+"""
+Jobs module - Tóm tắt định kỳ bằng JobQueue của python-telegram-bot (cần extra [job-queue])
+
+Lúc SUMMARY_TIME (nên đặt ngoài giờ cao điểm) job tính sẵn báo cáo hôm qua và tháng này (ngày 1: trọn
+tháng trước) giống /report, gửi cho các chat đã /subscribe kèm file CSV chi tiết, và giữ kết quả trong
+report cache: sáng ra mở /report nhận ngay summary và file_id đã upload, không query/tạo file lại.
+Ở chế độ WORKERS > 0 mỗi worker làm nóng cache của chính nó; chat đăng ký được chia theo
+chat_id % WORKERS (cùng cách chia update của chat riêng) để mỗi chat chỉ nhận một lần.
+"""
+import functools
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from telegram import Bot
+from telegram.error import Forbidden
+from telegram.ext import Application, ContextTypes
+from config import Config
+from db import delete_subscription, fetch_subscriptions, router, run_read, run_write, store_for_chat, use_store
+from handlers import load_report, send_report_document
+from reports import ReportTooLarge
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_JOB = "summaries"
+
+
+def summary_report_types(today: date) -> Tuple[str, str]:
+    """Loại báo cáo được tính sẵn: hôm qua và tháng này (ngày 1 tháng này chưa có gì: tháng trước)"""
+    return "yesterday", "previous" if today.day == 1 else "current"
+
+
+async def _load_summaries(store: Optional[str], today: date) -> List[tuple]:
+    with use_store(store):
+        return [await load_report(report_type) for report_type in summary_report_types(today)]
+
+
+async def _push_summaries(bot: Bot, chat_id: int, store: Optional[str], reports: List[tuple]):
+    await bot.send_message(
+        chat_id, "🌅 *TÓM TẮT ĐỊNH KỲ*\n\n" + "\n\n".join(entry.text for _, entry, _, _ in reports),
+        parse_mode="Markdown"
+    )
+    # File chi tiết của kỳ tháng; file_id được lưu vào cache cho các lần /report sau
+    cache_key, entry, period_start, period_end = reports[-1]
+    if entry.has_detail:
+        with use_store(store):
+            try:
+                await send_report_document(functools.partial(bot.send_document, chat_id), cache_key, entry,
+                                           period_start, period_end)
+            except ReportTooLarge as e:
+                logger.warning(f"Summary file not sent to chat {chat_id}: {e}")
+
+
+async def send_summaries(context: ContextTypes.DEFAULT_TYPE):
+    """Job hằng ngày: làm nóng report cache của các store đang mở và gửi tóm tắt cho chat đã đăng ký"""
+    worker: Optional[Tuple[int, int]] = context.job.data
+    with use_store(None):
+        chats = await run_read(fetch_subscriptions)
+    if worker is not None:
+        index, count = worker
+        chats = [chat_id for chat_id in chats if chat_id % count == index]
+
+    stores = {store_for_chat(chat_id) for chat_id in chats}
+    if Config.DB_SHARDING:
+        stores.update(store for store in router.stores() if store is not None)
+    else:
+        stores.add(None)
+
+    today = datetime.now(Config.get_timezone_info()).date()
+    summaries: Dict[Optional[str], List[tuple]] = {}
+    for store in stores:
+        try:
+            summaries[store] = await _load_summaries(store, today)
+        except Exception as e:
+            logger.error(f"Cannot precompute summaries{f' ({store})' if store else ''}: {e}", exc_info=True)
+
+    sent = 0
+    for chat_id in chats:
+        store = store_for_chat(chat_id)
+        if store not in summaries:
+            continue
+        try:
+            await _push_summaries(context.bot, chat_id, store, summaries[store])
+            sent += 1
+        except Forbidden:
+            # Bot bị chặn hoặc bị xóa khỏi nhóm: không gửi nữa
+            logger.info(f"Chat {chat_id} blocked the bot - unsubscribing")
+            with use_store(None):
+                await run_write(delete_subscription, chat_id)
+        except Exception as e:
+            logger.error(f"Cannot send summary to chat {chat_id}: {e}", exc_info=True)
+    logger.info(f"🌅 Precomputed summaries for {len(summaries)} store(s), sent to {sent}/{len(chats)} chat(s)")
+
+
+def schedule_summaries(app: Application, worker: Optional[Tuple[int, int]] = None):
+    """Đăng ký job hằng ngày lúc SUMMARY_TIME; worker=(index, số worker) trong worker process"""
+    schedule = Config.get_summary_schedule()
+    if schedule is None:
+        return
+    if app.job_queue is None:
+        logger.warning("SUMMARY_TIME được cấu hình nhưng chưa cài python-telegram-bot[job-queue] - "
+                       "tắt tóm tắt định kỳ")
+        return
+    at, days = schedule
+    app.job_queue.run_daily(send_summaries, at, days=days, data=worker, name=SUMMARY_JOB)
@@ -0,0 +1,339 @@
+"""
+Load test - Chạy bot.py thật với Bot API giả lập (fake_bot_api.py) và mô phỏng
+nhiều nhân viên cùng chạy /inbill, /expense, /report
+
+    python loadtest.py --users 200 --flows 5
+    python loadtest.py --users 500 --env UPDATE_CONCURRENCY=64 --env DB_WRITE_BATCH_SIZE=500
+
+In ra throughput, latency từng bước (p50/p95/p99) và thời gian chờ DB (từ /metrics của bot).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import signal
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+from fake_bot_api import FakeBotAPI
+
+REPLY_METHODS = ("sendMessage", "sendPhoto", "sendDocument")
+SERVICES = ["Cắt tóc", "Gội đầu", "Nhuộm tóc", "Uốn tóc", "Massage"]
+CATEGORIES = ["Mua nguyên liệu", "Điện nước", "Lương", "Tiền nhà"]
+
+Outgoing = Tuple[str, dict, dict]  # (method, params, message)
+
+
+class StepTimeout(Exception):
+    pass
+
+
+def is_reply(item: Outgoing) -> bool:
+    return item[0] in REPLY_METHODS
+
+
+def is_main_menu(item: Outgoing) -> bool:
+    return item[0] == "sendMessage" and "goto_inbill" in json.dumps(item[1].get("reply_markup") or {})
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class SimulatedUser:
+    """Một nhân viên gửi update qua FakeBotAPI và chờ phản hồi của bot cho từng bước"""
+
+    _callback_ids = itertools.count(1)
+
+    def __init__(self, api: FakeBotAPI, user_id: int, stats: "Stats", step_timeout: float,
+                 think_time: float, rng: random.Random):
+        self.api = api
+        self.user_id = user_id
+        self.stats = stats
+        self.step_timeout = step_timeout
+        self.think_time = think_time
+        self.rng = rng
+        self.outbox = api.outbox(user_id)
+
+    def _user(self) -> dict:
+        return {"id": self.user_id, "is_bot": False, "first_name": f"Staff{self.user_id}"}
+
+    def _send_text(self, text: str):
+        message = {
+            "message_id": self.api.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._user(),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.api.push_update({"message": message})
+
+    def _press(self, message: dict, data: str):
+        self.api.push_update({"callback_query": {
+            "id": str(next(self._callback_ids)),
+            "from": self._user(),
+            "chat_instance": str(self.user_id),
+            "data": data,
+            "message": message,
+        }})
+
+    async def _expect(self, predicate: Callable[[Outgoing], bool]) -> Outgoing:
+        deadline = time.monotonic() + self.step_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise StepTimeout()
+            try:
+                item = await asyncio.wait_for(self.outbox.get(), remaining)
+            except asyncio.TimeoutError:
+                raise StepTimeout()
+            if predicate(item):
+                return item
+
+    async def step(self, name: str, action: Callable[[], None],
+                   predicate: Callable[[Outgoing], bool] = is_reply) -> Outgoing:
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+        # Bỏ các tin cũ còn sót (vd. cập nhật tiến độ báo cáo)
+        while not self.outbox.empty():
+            self.outbox.get_nowait()
+        start = time.perf_counter()
+        action()
+        self.stats.updates += 1
+        try:
+            item = await self._expect(predicate)
+        except StepTimeout:
+            self.stats.timeouts[name] += 1
+            raise
+        self.stats.latencies[name].append(time.perf_counter() - start)
+        return item
+
+    # ===========================
+    # Các flow
+    # ===========================
+    async def inbill(self):
+        await self.step("inbill.start", lambda: self._send_text("/inbill"))
+        await self.step("inbill.name", lambda: self._send_text(f"Khách {self.rng.randint(1, 10 ** 6)}"))
+        await self.step("inbill.phone", lambda: self._send_text("09" + "".join(self.rng.choices("0123456789", k=8))))
+        await self.step("inbill.service", lambda: self._send_text(self.rng.choice(SERVICES)))
+        await self.step("inbill.amount", lambda: self._send_text(str(self.rng.randint(5, 500) * 1000)))
+        _, _, confirm = await self.step("inbill.note", lambda: self._send_text("-"))
+        await self.step("inbill.confirm", lambda: self._press(confirm, "confirm_bill_ok"), is_main_menu)
+
+    async def expense(self):
+        await self.step("expense.start", lambda: self._send_text("/expense"))
+        await self.step("expense.category", lambda: self._send_text(self.rng.choice(CATEGORIES)))
+        await self.step("expense.amount", lambda: self._send_text(str(self.rng.randint(10, 2000) * 1000)))
+        _, _, confirm = await self.step("expense.note", lambda: self._send_text("-"))
+        await self.step("expense.confirm", lambda: self._press(confirm, "confirm_exp_ok"), is_main_menu)
+
+    async def report(self):
+        _, _, menu = await self.step("report.start", lambda: self._send_text("/report"))
+        await self.step("report.month", lambda: self._press(menu, "month_current"), is_main_menu)
+
+    async def run(self, flows: int, weights: Dict[str, int]):
+        names = list(weights)
+        for _ in range(flows):
+            flow = self.rng.choices(names, weights=[weights[n] for n in names])[0]
+            try:
+                await getattr(self, flow)()
+                self.stats.flows_ok[flow] += 1
+            except StepTimeout:
+                self.stats.flows_failed[flow] += 1
+                # Thoát conversation đang dở trước khi chạy flow tiếp theo
+                self._send_text("/cancel")
+                await asyncio.sleep(0.5)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+        self.flows_ok: Dict[str, int] = defaultdict(int)
+        self.flows_failed: Dict[str, int] = defaultdict(int)
+        self.updates = 0
+        self.max_queue_depth: Dict[str, float] = defaultdict(float)
+
+
+# ===========================
+# Metrics của bot
+# ===========================
+_SAMPLE_RE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+
+def scrape_metrics(port: int) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode("utf-8")
+    samples = {}
+    for line in body.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if match:
+            labels = tuple(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+
+async def sample_queue_depths(port: int, stats: Stats, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        try:
+            samples = await loop.run_in_executor(None, scrape_metrics, port)
+            for (name, labels), value in samples.items():
+                if name == "bot_queue_depth":
+                    queue = dict(labels)["queue"]
+                    stats.max_queue_depth[queue] = max(stats.max_queue_depth[queue], value)
+        except OSError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+def print_report(stats: Stats, elapsed: float, samples: Dict, api: FakeBotAPI):
+    flows_ok = sum(stats.flows_ok.values())
+    flows_failed = sum(stats.flows_failed.values())
+    print("\n" + "=" * 72)
+    print(f"⏱️  Thời gian chạy: {elapsed:.1f}s")
+    print(f"✅ Flow thành công: {flows_ok}  ❌ thất bại (timeout): {flows_failed}  "
+          f"({', '.join(f'{k}={v}' for k, v in sorted(stats.flows_ok.items()))})")
+    print(f"🚀 Throughput: {flows_ok / elapsed:.1f} flow/s, {stats.updates / elapsed:.1f} update/s")
+    print(f"📡 Bot API calls: {', '.join(f'{k}={v}' for k, v in sorted(api.calls.items()))}")
+
+    print("\nLatency từng bước (ms):")
+    print(f"{'step':<20}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'timeout':>9}")
+    for name in sorted(stats.latencies.keys() | stats.timeouts.keys()):
+        values = stats.latencies.get(name, [])
+        print(f"{name:<20}{len(values):>7}"
+              + "".join(f"{percentile(values, q) * 1000:>9.1f}" for q in (0.5, 0.95, 0.99))
+              + f"{max(values, default=0) * 1000:>9.1f}{stats.timeouts.get(name, 0):>9}")
+
+    print("\nDB (trung bình ms/lần; chờ = tổng - thực thi SQLite):")
+    print(f"{'mode':<7}{'fn':<28}{'n':>7}{'total':>9}{'exec':>9}{'wait':>9}")
+    calls = {labels: value for (name, labels), value in samples.items() if name == "bot_db_call_seconds_count"}
+    for labels, count in sorted(calls.items()):
+        if not count:
+            continue
+        total = samples.get(("bot_db_call_seconds_sum", labels), 0) / count * 1000
+        exec_count = samples.get(("bot_db_exec_seconds_count", labels), 0)
+        exec_ms = samples.get(("bot_db_exec_seconds_sum", labels), 0) / exec_count * 1000 if exec_count else 0
+        label = dict(labels)
+        print(f"{label['mode']:<7}{label['fn']:<28}{int(count):>7}{total:>9.2f}{exec_ms:>9.2f}{total - exec_ms:>9.2f}")
+    errors = {dict(labels)["fn"]: v for (name, labels), v in samples.items() if name == "bot_db_errors_total"}
+    if errors:
+        print(f"DB errors: {errors}")
+    handler_errors = {dict(labels)["handler"]: v for (name, labels), v in samples.items()
+                      if name == "bot_handler_errors_total"}
+    if handler_errors:
+        print(f"Handler errors: {handler_errors}")
+    print(f"Hàng đợi lớn nhất: {dict(stats.max_queue_depth)}")
+    print("=" * 72)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(args):
+    api = FakeBotAPI()
+    api_port = await api.start()
+    metrics_port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123456:LOADTEST",
+        "BOT_API_BASE_URL": f"http://127.0.0.1:{api_port}/bot",
+        "BOT_API_BASE_FILE_URL": f"http://127.0.0.1:{api_port}/file/bot",
+        "RUN_MODE": "polling",
+        "DB_NAME": args.db or os.path.join(workdir, "loadtest.db"),
+        "LOG_FILE": os.path.join(workdir, "bot.log"),
+        "LOG_LEVEL": "WARNING",
+        "BANK_ACCOUNT": env.get("BANK_ACCOUNT") or "0123456789",
+        "METRICS_LISTEN": "127.0.0.1",
+        "METRICS_PORT": str(metrics_port),
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    bot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+    process = await asyncio.create_subprocess_exec(sys.executable, bot_path, env=env, cwd=workdir)
+    print(f"🤖 bot.py pid={process.pid}, Bot API giả lập: {env['BOT_API_BASE_URL']}, dữ liệu: {workdir}")
+
+    try:
+        # Chờ bot bắt đầu long polling
+        deadline = time.monotonic() + 60
+        while not api.calls["getUpdates"]:
+            if process.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError("bot.py không khởi động được, xem log trong " + env["LOG_FILE"])
+            await asyncio.sleep(0.1)
+
+        stats = Stats()
+        rng = random.Random(args.seed)
+        weights = {"inbill": args.inbill_weight, "expense": args.expense_weight, "report": args.report_weight}
+        users = [
+            SimulatedUser(api, 10_000 + i, stats, args.step_timeout, args.think_ms / 1000, random.Random(rng.random()))
+            for i in range(args.users)
+        ]
+        stop_sampling = asyncio.Event()
+        sampler = asyncio.create_task(sample_queue_depths(metrics_port, stats, stop_sampling))
+
+        print(f"👥 {args.users} user × {args.flows} flow (inbill:expense:report = "
+              f"{args.inbill_weight}:{args.expense_weight}:{args.report_weight})...")
+        start = time.perf_counter()
+
+        async def start_user(index: int, user: SimulatedUser):
+            if args.ramp_s:
+                await asyncio.sleep(args.ramp_s * index / len(users))
+            await user.run(args.flows, weights)
+
+        await asyncio.gather(*(start_user(i, u) for i, u in enumerate(users)))
+        elapsed = time.perf_counter() - start
+
+        stop_sampling.set()
+        await sampler
+        samples = await asyncio.get_running_loop().run_in_executor(None, scrape_metrics, metrics_port)
+        print_report(stats, elapsed, samples, api)
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 60)
+            except asyncio.TimeoutError:
+                process.kill()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test bot.py với Bot API giả lập")
+    parser.add_argument("--users", type=int, default=200, help="Số nhân viên mô phỏng")
+    parser.add_argument("--flows", type=int, default=3, help="Số flow mỗi nhân viên chạy")
+    parser.add_argument("--inbill-weight", type=int, default=6)
+    parser.add_argument("--expense-weight", type=int, default=3)
+    parser.add_argument("--report-weight", type=int, default=1)
+    parser.add_argument("--think-ms", type=float, default=0, help="Thời gian suy nghĩ trung bình giữa các bước")
+    parser.add_argument("--ramp-s", type=float, default=0, help="Rải thời điểm bắt đầu của các user trong N giây")
+    parser.add_argument("--step-timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="File database (mặc định: file tạm mới)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Biến môi trường thêm cho bot.py (vd. UPDATE_CONCURRENCY=64)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Metrics module - Histogram/Counter/Gauge tối giản và endpoint Prometheus text format
+(không phụ thuộc prometheus_client; an toàn khi gọi từ nhiều thread)
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from config import Config
+from http_server import Request, start_server
+
+logger = logging.getLogger(__name__)
+
+# Bucket (giây) đủ dày quanh 10ms-1s để ước lượng p50/p99 bằng histogram_quantile
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge đọc giá trị lúc scrape (vd. độ dài hàng đợi)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set_function(self, fn: Callable[[], float], *labels: str):
+        with self._lock:
+            self._functions[labels] = fn
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._functions.items())
+        lines = self._header()
+        for labels, fn in items:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [số lần rơi vào từng bucket (+Inf ở cuối), tổng, số lần]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = self._header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ===========================
+# Metric dùng chung
+# ===========================
+HANDLER_SECONDS = registry.histogram(
+    "bot_handler_seconds", "Thời gian chạy handler callback", ("conversation", "handler"))
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Số lần handler callback raise exception", ("conversation", "handler"))
+TELEGRAM_API_SECONDS = registry.histogram(
+    "bot_telegram_api_seconds", "Thời gian gọi Telegram Bot API", ("method",))
+TELEGRAM_API_ERRORS = registry.counter(
+    "bot_telegram_api_errors_total", "Số lần gọi Telegram Bot API lỗi", ("method",))
+DB_CALL_SECONDS = registry.histogram(
+    "bot_db_call_seconds", "Thời gian một thao tác DB tính cả chờ hàng đợi", ("mode", "fn"))
+DB_EXEC_SECONDS = registry.histogram(
+    "bot_db_exec_seconds", "Thời gian thực thi SQLite của một thao tác DB", ("mode", "fn"))
+DB_ERRORS = registry.counter(
+    "bot_db_errors_total", "Số thao tác DB lỗi", ("mode", "fn"))
+QUEUE_DEPTH = registry.gauge(
+    "bot_queue_depth", "Số phần tử đang chờ trong hàng đợi", ("queue",))
+
+
+# ===========================
+# HTTP endpoint
+# ===========================
+async def _handle_metrics(request: Request):
+    if request.path != "/metrics":
+        return 404, {}, b""
+    if request.method != "GET":
+        return 405, {"Allow": "GET"}, b""
+    body = registry.render().encode("utf-8")
+    return 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, body
+
+
+async def start_metrics_server(host: str = None, port: int = None):
+    """Mở endpoint /metrics; trả về server (None nếu METRICS_PORT=0)"""
+    host = host or Config.METRICS_LISTEN
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = await start_server(host, port, _handle_metrics)
+    logger.info(f"📈 Metrics tại http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,151 @@
+"""
+Persistence module - Lưu trạng thái ConversationHandler và user_data vào SQLite
+để khởi động lại bot không làm mất bill/chi phí đang nhập dở
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+from config import Config
+from db import (fetch_conversations, fetch_user_data, prune_persistence, run_read, run_write, save_persistence_batch,
+                use_store)
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(Config.get_timezone_info())
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    BasePersistence lưu vào database hiện có (bảng conversations, user_data).
+
+    - Application gọi update_* mỗi PERSISTENCE_FLUSH_INTERVAL giây cho các key đã thay đổi;
+      các thay đổi được gom lại và ghi trong một lần run_write.
+    - Conversation kết thúc và user_data rỗng bị xóa khỏi bảng, nên dữ liệu chỉ gồm các thao tác đang dở.
+    - user_data được nạp lười qua refresh_user_data khi user gửi update đầu tiên sau khi khởi động,
+      conversations chỉ nạp các dòng còn hạn - thời gian khởi động không tăng theo số user.
+    - Luôn ghi vào database chính (DB_NAME), kể cả khi bật DB_SHARDING.
+    """
+
+    def __init__(self, update_interval: float = None, ttl_hours: int = None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval if update_interval is not None else Config.PERSISTENCE_FLUSH_INTERVAL,
+        )
+        self._ttl = timedelta(hours=ttl_hours if ttl_hours is not None else Config.PERSISTENCE_TTL_HOURS)
+        self._pending_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        self._pending_user_data: Dict[int, Optional[str]] = {}
+        self._loaded_users: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._pruned = False
+
+    def _min_updated_at(self) -> str:
+        return _timestamp(_now() - self._ttl)
+
+    # ===========================
+    # Nạp dữ liệu
+    # ===========================
+    async def get_user_data(self) -> Dict[int, dict]:
+        # Nạp lười từng user trong refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        if not self._pruned:
+            self._pruned = True
+            with use_store(None):
+                removed = await run_write(prune_persistence, self._min_updated_at())
+            if removed:
+                logger.info(f"🧹 Đã xóa {removed} conversation/user_data bỏ dở quá {self._ttl}")
+        with use_store(None):
+            rows = await run_read(fetch_conversations, name, self._min_updated_at())
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        with use_store(None):
+            stored = await run_read(fetch_user_data, user_id)
+        self._loaded_users.add(user_id)
+        if stored:
+            for key, value in json.loads(stored).items():
+                user_data.setdefault(key, value)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # ===========================
+    # Ghi dữ liệu (gom batch)
+    # ===========================
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        state = None if new_state is None else json.dumps(new_state)
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._loaded_users.add(user_id)
+        self._pending_user_data[user_id] = json.dumps(data, ensure_ascii=False) if data else None
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.add(user_id)
+        self._pending_user_data[user_id] = None
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    def _schedule_flush(self):
+        # Application gọi các update_* cùng lúc (asyncio.gather) - task ghi chạy sau tất cả
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        # Lặp lại nếu có thay đổi mới đến trong lúc đang ghi
+        while self._pending_conversations or self._pending_user_data:
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            try:
+                with use_store(None):
+                    await run_write(save_persistence_batch, conversations, user_data, _timestamp(_now()))
+            except Exception as e:
+                logger.error(f"Lỗi khi lưu persistence: {e}", exc_info=True)
+                # Giữ lại để ghi ở lượt sau (không ghi đè thay đổi mới hơn)
+                for key, value in conversations.items():
+                    self._pending_conversations.setdefault(key, value)
+                for key, value in user_data.items():
+                    self._pending_user_data.setdefault(key, value)
+                return
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_pending()
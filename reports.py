@@ -0,0 +1,427 @@
+"""
+Reports module - Tổng hợp, cache và xuất file báo cáo (CSV streaming)
+"""
+import asyncio
+import codecs
+import csv
+import gzip
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import IO, Any, Callable, Dict, Optional, Tuple
+
+from config import Config
+from db import add_write_listener, connect, current_store, db_path_for, iter_period_rows
+
+logger = logging.getLogger(__name__)
+
+SALES_HEADER = ["ID", "Tên khách hàng", "SĐT", "Dịch vụ", "Số tiền", "Ghi chú", "Ngày tạo"]
+EXPENSES_HEADER = ["ID", "Loại chi phí", "Số tiền", "Ghi chú", "Ngày tạo"]
+
+
+class _EncodedWriter:
+    """Nhận str từ csv.writer, encode rồi ghi xuống file nhị phân"""
+
+    def __init__(self, raw: IO[bytes], encoding: str = "utf-8"):
+        self._raw = raw
+        self._encoding = encoding
+
+    def write(self, text: str) -> int:
+        return self._raw.write(text.encode(self._encoding))
+
+
+def resolve_period(report_type: Optional[str], start_date: Optional[date] = None,
+                   end_date: Optional[date] = None) -> Tuple[date, date, str]:
+    """
+    Xác định khoảng thời gian half-open [start, end) và nhãn hiển thị.
+    report_type: "current" (tháng hiện tại), "previous" (tháng trước), "yesterday" (hôm qua) hoặc None (tùy chỉnh).
+    """
+    if report_type == "yesterday":
+        today = datetime.now(Config.get_timezone_info()).date()
+        return today - timedelta(days=1), today, f"ngày {today - timedelta(days=1):%d/%m/%Y}"
+    if report_type in ("current", "previous"):
+        now = datetime.now(Config.get_timezone_info())
+        year, month = now.year, now.month
+        if report_type == "previous":
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return start, end, f"tháng {month}/{year}"
+    return start_date, end_date + timedelta(days=1), f"{start_date} đến {end_date}"
+
+
+def format_summary(summary: Dict[str, Any], period_text: str) -> Tuple[str, str]:
+    """Tạo text báo cáo (Markdown) từ summary, trả về (text, profit_text)"""
+    total_sales = summary["sales"]["amount"]
+    total_expenses = summary["expenses"]["amount"]
+    profit = total_sales - total_expenses
+
+    profit_emoji = "📈" if profit >= 0 else "📉"
+    profit_text = f"+{profit:,}" if profit >= 0 else f"{profit:,}"
+
+    text_report = (
+        f"📊 *BÁO CÁO TỔNG HỢP*\n"
+        f"Kỳ: _{period_text}_\n\n"
+        f"💵 *Doanh thu*\n"
+        f"• Số hóa đơn: `{summary['sales']['count']}`\n"
+        f"• Tổng thu: `{total_sales:,}đ`\n\n"
+        f"💸 *Chi phí*\n"
+        f"• Số khoản chi: `{summary['expenses']['count']}`\n"
+        f"• Tổng chi: `{total_expenses:,}đ`\n\n"
+        f"{profit_emoji} *Lãi/Lỗ*: `{profit_text}đ`"
+    )
+    return text_report, profit_text
+
+
+# ===========================
+# Report cache
+# ===========================
+@dataclass
+class CachedReport:
+    """Kết quả báo cáo đã tính: summary, text và file_id Telegram của file CSV (nếu đã upload)"""
+    summary: Dict[str, Any]
+    text: str
+    profit_text: str
+    file_id: Optional[str] = None
+
+    @property
+    def has_detail(self) -> bool:
+        return bool(self.summary["sales"]["count"] or self.summary["expenses"]["count"])
+
+
+ReportKey = Tuple[Optional[str], str, date, date]
+
+
+class ReportCache:
+    """
+    LRU cache báo cáo theo key (store, report_type, start, end) với [start, end) là ngày.
+    Entry bị xóa khi có dòng mới rơi vào khoảng của nó. `version` tăng mỗi lần
+    invalidate để báo cáo đang tính dở (đọc snapshot cũ) không được ghi vào cache.
+    Chỉ dùng trên event loop nên không cần lock.
+    """
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[ReportKey, CachedReport]" = OrderedDict()
+        self.version = 0
+
+    def get(self, key: ReportKey) -> Optional[CachedReport]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: ReportKey, entry: CachedReport, version: int):
+        """Lưu entry nếu không có invalidate nào xảy ra kể từ `version`"""
+        if self._max_entries <= 0 or version != self.version:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, day: Optional[str] = None, store: Optional[str] = None):
+        """Xóa các entry của store chứa ngày `day` (YYYY-MM-DD); day=None xóa toàn bộ entry của store"""
+        self.version += 1
+        changed = date.fromisoformat(day) if day is not None else None
+        for key in [k for k in self._entries if k[0] == store and (changed is None or k[2] <= changed < k[3])]:
+            del self._entries[key]
+
+    def forget_file(self, key: ReportKey):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.file_id = None
+
+
+report_cache = ReportCache(Config.REPORT_CACHE_SIZE)
+add_write_listener(lambda kind, day: report_cache.invalidate(day, current_store()))
+
+
+def report_filename() -> str:
+    """Tên file báo cáo theo thời gian hiện tại (giờ VN)"""
+    now = datetime.now(Config.get_timezone_info())
+    suffix = ".csv.gz" if Config.REPORT_GZIP else ".csv"
+    return f"report_{now.strftime('%Y%m%d_%H%M%S')}{suffix}"
+
+
+def write_report_csv(out: IO[bytes], conn: sqlite3.Connection, start: date, end: date,
+                     summary: Dict[str, Any], profit_text: str,
+                     progress: Optional[Callable[[int], None]] = None):
+    """
+    Ghi báo cáo CSV vào file nhị phân `out`, đọc dữ liệu chi tiết theo từng
+    batch (fetchmany) nên bộ nhớ không phụ thuộc số dòng trong kỳ.
+    `progress(số dòng đã ghi)` được gọi sau mỗi batch nếu có.
+    """
+    out.write(codecs.BOM_UTF8)  # utf-8-sig để Excel hiển thị đúng tiếng Việt
+    writer = csv.writer(_EncodedWriter(out))
+    written = 0
+
+    # Sheet 1: Sales
+    writer.writerow(["=== DOANH THU ==="])
+    writer.writerow(SALES_HEADER)
+    for rows in iter_period_rows(conn, "sales", start, end, Config.REPORT_FETCH_SIZE):
+        writer.writerows(rows)
+        written += len(rows)
+        if progress:
+            progress(written)
+
+    writer.writerow([])
+
+    # Sheet 2: Expenses
+    writer.writerow(["=== CHI PHÍ ==="])
+    writer.writerow(EXPENSES_HEADER)
+    for rows in iter_period_rows(conn, "expenses", start, end, Config.REPORT_FETCH_SIZE):
+        writer.writerows(rows)
+        written += len(rows)
+        if progress:
+            progress(written)
+
+    writer.writerow([])
+    writer.writerow(["=== TỔNG KẾT ==="])
+    writer.writerow(["Tổng doanh thu", f"{summary['sales']['amount']:,}đ"])
+    writer.writerow(["Tổng chi phí", f"{summary['expenses']['amount']:,}đ"])
+    writer.writerow(["Lãi/Lỗ", f"{profit_text}đ"])
+
+    writer.writerow([])
+    writer.writerow(["=== THEO DỊCH VỤ ==="])
+    writer.writerow(["Dịch vụ", "Số hóa đơn", "Số tiền"])
+    for label, count, amount in summary["sales"]["by_label"]:
+        writer.writerow([label, count, amount])
+
+    writer.writerow([])
+    writer.writerow(["=== THEO LOẠI CHI PHÍ ==="])
+    writer.writerow(["Loại chi phí", "Số khoản chi", "Số tiền"])
+    for label, count, amount in summary["expenses"]["by_label"]:
+        writer.writerow([label, count, amount])
+
+
+def _write_report(out: IO[bytes], filename: str, conn: sqlite3.Connection, start: date, end: date,
+                  summary: Dict[str, Any], profit_text: str,
+                  progress: Optional[Callable[[int], None]] = None):
+    """Ghi báo cáo vào `out`, nén gzip nếu tên file kết thúc bằng .gz"""
+    if filename.endswith(".gz"):
+        with gzip.GzipFile(filename=filename[:-3], mode="wb", fileobj=out) as gz:
+            write_report_csv(gz, conn, start, end, summary, profit_text, progress)
+    else:
+        write_report_csv(out, conn, start, end, summary, profit_text, progress)
+
+
+def build_report_file(conn: sqlite3.Connection, start: date, end: date,
+                      summary: Dict[str, Any], profit_text: str) -> Tuple[IO[bytes], str]:
+    """
+    Tạo file báo cáo trong SpooledTemporaryFile (giữ trong RAM tới
+    REPORT_SPOOL_MAX_BYTES rồi tự chuyển sang file tạm), nén gzip nếu bật
+    REPORT_GZIP. Trả về (file đã seek về đầu, tên file); người gọi phải close().
+    Chạy trên thread DB (db.run_read) vì vừa đọc DB vừa ghi đĩa.
+    """
+    filename = report_filename()
+    buffer = tempfile.SpooledTemporaryFile(max_size=Config.REPORT_SPOOL_MAX_BYTES)
+    try:
+        _write_report(buffer, filename, conn, start, end, summary, profit_text)
+        keep_report_copy(buffer, filename)
+        buffer.seek(0)
+    except Exception:
+        buffer.close()
+        raise
+    return buffer, filename
+
+
+class ReportTooLarge(Exception):
+    """File báo cáo vượt REPORT_UPLOAD_MAX_MB, không gửi qua Telegram"""
+
+    def __init__(self, size: int):
+        super().__init__(f"File báo cáo {size / 1024 / 1024:.1f}MB vượt giới hạn {Config.REPORT_UPLOAD_MAX_MB}MB")
+        self.size = size
+
+
+def read_upload(report_file: IO[bytes]) -> bytes:
+    """
+    Đọc file báo cáo để upload: InputFile của PTB 20.3 luôn đọc toàn bộ file (kể cả khi truyền file object)
+    nên đọc trước trên thread riêng, sau khi kiểm tra dung lượng (raise ReportTooLarge nếu quá lớn).
+    """
+    size = report_file.seek(0, os.SEEK_END)
+    if size > Config.REPORT_UPLOAD_MAX_MB * 1024 * 1024:
+        raise ReportTooLarge(size)
+    report_file.seek(0)
+    return report_file.read()
+
+
+def keep_report_copy(buffer: IO[bytes], filename: str):
+    """
+    Lưu bản sao báo cáo vào REPORT_DIR nếu REPORT_RETENTION_DAYS > 0,
+    đồng thời xóa các file cũ hơn số ngày cấu hình.
+    """
+    if Config.REPORT_RETENTION_DAYS <= 0:
+        return
+    os.makedirs(Config.REPORT_DIR, exist_ok=True)
+    buffer.seek(0)
+    with open(os.path.join(Config.REPORT_DIR, filename), "wb") as f:
+        shutil.copyfileobj(buffer, f)
+    prune_reports()
+
+
+def prune_reports():
+    """Xóa các file báo cáo trong REPORT_DIR cũ hơn REPORT_RETENTION_DAYS"""
+    cutoff = time.time() - Config.REPORT_RETENTION_DAYS * 86400
+    try:
+        entries = list(os.scandir(Config.REPORT_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_file() and entry.name.startswith("report_") and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"Cannot remove old report {entry.path}: {e}")
+
+
+# ===========================
+# Process pool cho báo cáo lớn
+# ===========================
+# Queue tiến độ của process con, được truyền qua initializer (kế thừa khi tạo process)
+_worker_progress_queue: Optional[Any] = None
+# Thời gian tối đa chờ tiến độ còn lại của job sau khi đã có kết quả
+PROGRESS_DRAIN_SECONDS = 2
+
+
+def _init_report_worker(progress_queue: Any):
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+
+def _build_report_in_worker(job_id: int, db_name: str, start: date, end: date,
+                            summary: Dict[str, Any], profit_text: str) -> Tuple[str, str]:
+    """
+    Chạy trong process con: tự mở connection chỉ đọc, ghi báo cáo ra file tạm
+    và trả về (đường dẫn file tạm, tên file). Tiến độ gửi về qua progress queue.
+    """
+    total = summary["sales"]["count"] + summary["expenses"]["count"]
+
+    def progress(done: int):
+        if _worker_progress_queue is not None:
+            _worker_progress_queue.put((job_id, done, total))
+
+    filename = report_filename()
+    conn = connect(db_name, readonly=True)
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w+b") as out:
+            _write_report(out, filename, conn, start, end, summary, profit_text, progress)
+            keep_report_copy(out, filename)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+        # Dấu kết thúc job (done=None): mọi tiến độ trước đó đã nằm trong queue
+        if _worker_progress_queue is not None:
+            _worker_progress_queue.put((job_id, None, total))
+    return path, filename
+
+
+class ReportWorkerPool:
+    """
+    ProcessPoolExecutor giới hạn (REPORT_WORKERS process) cho báo cáo lớn.
+    Job vượt quá số process sẽ xếp hàng trong pool; mỗi user chỉ được chạy
+    tối đa REPORT_MAX_PER_USER báo cáo lớn cùng lúc để không chiếm hết worker.
+    """
+
+    def __init__(self, workers: int, max_per_user: int):
+        self._workers = max(1, workers)
+        self._max_per_user = max_per_user
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress_queue: Optional[Any] = None
+        self._listener: Optional[threading.Thread] = None
+        self._callbacks: Dict[int, Tuple[asyncio.AbstractEventLoop, Callable[[int, int], None], asyncio.Event]] = {}
+        self._active: Dict[Any, int] = {}
+        self._job_ids = itertools.count(1)
+
+    def _ensure_started(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn thay vì fork: process cha đang có thread DB giữ lock
+            ctx = multiprocessing.get_context("spawn")
+            self._progress_queue = ctx.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers, mp_context=ctx,
+                initializer=_init_report_worker, initargs=(self._progress_queue,)
+            )
+            self._listener = threading.Thread(target=self._listen_progress, name="report-progress", daemon=True)
+            self._listener.start()
+        return self._executor
+
+    def _listen_progress(self):
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                break
+            job_id, done, total = item
+            callback = self._callbacks.get(job_id)
+            if callback is None:
+                continue
+            loop, fn, finished = callback
+            if done is None:
+                loop.call_soon_threadsafe(finished.set)
+            else:
+                loop.call_soon_threadsafe(fn, done, total)
+
+    def try_acquire(self, user_id: Any) -> bool:
+        """Giữ một slot báo cáo lớn cho user; False nếu user đã đạt giới hạn"""
+        if user_id is not None and self._active.get(user_id, 0) >= self._max_per_user:
+            return False
+        self._active[user_id] = self._active.get(user_id, 0) + 1
+        return True
+
+    def release(self, user_id: Any):
+        count = self._active.get(user_id, 0) - 1
+        if count > 0:
+            self._active[user_id] = count
+        else:
+            self._active.pop(user_id, None)
+
+    @property
+    def pending(self) -> int:
+        """Số báo cáo lớn đang chạy hoặc đang chờ"""
+        return sum(self._active.values())
+
+    async def build(self, start: date, end: date, summary: Dict[str, Any], profit_text: str,
+                    on_progress: Optional[Callable[[int, int], None]] = None) -> Tuple[str, str]:
+        """Tạo báo cáo trong process con, trả về (đường dẫn file tạm, tên file)"""
+        executor = self._ensure_started()
+        job_id = next(self._job_ids)
+        finished = asyncio.Event()
+        if on_progress is not None:
+            self._callbacks[job_id] = (asyncio.get_running_loop(), on_progress, finished)
+        try:
+            future = executor.submit(
+                _build_report_in_worker, job_id, db_path_for(current_store()), start, end, summary, profit_text
+            )
+            result = await asyncio.wrap_future(future)
+            if on_progress is not None:
+                # Tiến độ đi qua queue riêng nên có thể tới sau kết quả: chờ dấu kết thúc của job
+                try:
+                    await asyncio.wait_for(finished.wait(), PROGRESS_DRAIN_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            return result
+        finally:
+            self._callbacks.pop(job_id, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._progress_queue.put(None)
+            self._listener.join()
+            self._executor = None
+
+
+report_workers = ReportWorkerPool(Config.REPORT_WORKERS, Config.REPORT_MAX_PER_USER)
@@ -0,0 +1,24 @@
+"""
+Fixture dùng chung: chạy test trên database tạm (mỗi test một file riêng)
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+from config import Config  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Database chính tạm trong tmp_path (đã chạy migration); đóng mọi connection sau test"""
+    monkeypatch.setattr(Config, "DB_NAME", str(tmp_path / "sales.db"))
+    monkeypatch.setattr(Config, "DB_SHARD_DIR", str(tmp_path / "stores"))
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(Config, "DB_SHARDING", False)
+    db.init_db()
+    yield db
+    db.router.close()
@@ -0,0 +1,94 @@
+"""
+Test xử lý update song song giữ thứ tự theo chat/user (application.py)
+"""
+import asyncio
+import json
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import ApplicationBuilder, TypeHandler
+from telegram.request import BaseRequest
+
+from application import OrderedApplication
+
+
+class GetMeRequest(BaseRequest):
+    """Request giả: chỉ trả lời getMe (Application.initialize), không gọi mạng"""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        me = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "test_bot"}
+        return 200, json.dumps({"ok": True, "result": me}).encode()
+
+
+def make_update(update_id: int, chat_id: int, user_id: int) -> Update:
+    message = Message(update_id, datetime.now(), Chat(chat_id, Chat.PRIVATE), from_user=User(user_id, "Lan", False),
+                      text="hi")
+    return Update(update_id, message=message)
+
+
+def build_app(callback) -> OrderedApplication:
+    app = (ApplicationBuilder().token("1:test").request(GetMeRequest()).get_updates_request(GetMeRequest())
+           .updater(None).application_class(OrderedApplication, kwargs={"max_concurrent_updates": 4}).build())
+    app.add_handler(TypeHandler(Update, callback))
+    return app
+
+
+def test_same_key_in_order_other_keys_overlap():
+    events = []
+
+    async def scenario():
+        other_started = asyncio.Event()
+
+        async def callback(update, context):
+            events.append(("start", update.update_id))
+            if update.update_id == 1:
+                # Chỉ qua được nếu update của chat khác chạy song song với update này
+                await asyncio.wait_for(other_started.wait(), 2)
+            elif update.update_id == 4:
+                other_started.set()
+            await asyncio.sleep(0.01)
+            events.append(("end", update.update_id))
+
+        app = build_app(callback)
+        await app.initialize()
+        await app.start()
+        for update_id, chat_id in ((1, 10), (2, 10), (3, 10), (4, 20)):
+            await app.update_queue.put(make_update(update_id, chat_id, chat_id))
+        await app.stop()
+        await app.shutdown()
+
+    asyncio.run(scenario())
+    same_key = [event for event in events if event[1] != 4]
+    assert same_key == [("start", 1), ("end", 1), ("start", 2), ("end", 2), ("start", 3), ("end", 3)]
+    # Update 4 (chat khác) bắt đầu trong lúc update 1 còn chạy
+    assert events.index(("start", 4)) < events.index(("end", 1))
+
+
+def test_stop_waits_for_running_handlers():
+    finished = []
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def callback(update, context):
+            started.set()
+            await asyncio.sleep(0.1)
+            finished.append(update.update_id)
+
+        app = build_app(callback)
+        await app.initialize()
+        await app.start()
+        await app.update_queue.put(make_update(1, 10, 10))
+        await started.wait()
+        await app.stop()
+        stopped_with = list(finished)
+        await app.shutdown()
+        return stopped_with
+
+    assert asyncio.run(scenario()) == [1]
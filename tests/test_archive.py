@@ -0,0 +1,46 @@
+"""
+Test archive các tháng đã đóng (archive.py)
+"""
+from pathlib import Path
+
+from archive import archive_closed_periods
+from config import Config
+
+
+def add_sales(db, rows):
+    return [db.write_sync(db.insert_sale, name, "0901234567", "Cắt tóc", 100000, "", created_at)
+            for name, created_at in rows]
+
+
+def count_rows(db, table="sales"):
+    return db.read_sync(lambda conn: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+
+
+def test_archive_waits_for_running_import(database):
+    add_sales(database, [("Lan", "2020-01-05 10:00:00"), ("Mai", "2020-02-05 10:00:00")])
+    database.write_sync(database.begin_import)
+    try:
+        assert archive_closed_periods(None) == 0
+        assert count_rows(database) == 2
+    finally:
+        database.write_sync(database.finish_import)
+
+    assert archive_closed_periods(None) == 2
+    assert count_rows(database) == 0
+    # Trigger FTS5 hoạt động lại khi archive: không còn dòng tìm kiếm trỏ tới dòng đã chuyển đi
+    assert database.read_sync(lambda conn: conn.execute(
+        "SELECT rowid FROM sales_fts WHERE sales_fts MATCH ?", (database.search_match("lan"),)
+    ).fetchall()) == []
+
+
+def test_archive_files_live_under_archive_dir(database, tmp_path, monkeypatch):
+    add_sales(database, [("Lan", "2020-01-05 10:00:00")])
+    assert archive_closed_periods(None) == 1
+    path = database.archive_path_for(Config.DB_NAME, "2020-01")
+    assert Path(path).parent == tmp_path / "archive"
+    assert Path(path).is_file()
+
+    # Không cấu hình: thư mục archive/ cạnh DB_NAME (cùng volume với database)
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", "")
+    monkeypatch.setattr(Config, "DB_NAME", "/app/sqlite3/sales.db")
+    assert database.archive_path_for(Config.DB_NAME, "2020") == "/app/sqlite3/archive/sales-2020.db"
@@ -0,0 +1,46 @@
+"""
+Test index khách quen (customers.py)
+"""
+import asyncio
+
+from customers import CustomerDirectory
+
+
+def add_sale(db, name, phone, created_at="2099-01-01 10:00:00"):
+    db.write_sync(db.insert_sale, name, phone, "Cắt tóc", 100000, "", created_at)
+
+
+def test_invalidate_discards_index_being_built(database):
+    add_sale(database, "Lan", "0901111111")
+
+    async def scenario():
+        directory = CustomerDirectory(4)
+        first = directory.warm(None)
+        # Import xong trong lúc đang dựng: kết quả của lần dựng đầu (đọc trước import) bị bỏ
+        add_sale(database, "Mai", "0902222222")
+        directory.invalidate(None)
+        second = directory.warm(None)
+        assert second is not first
+        await asyncio.gather(first, second)
+        return directory.get(None)
+
+    index = asyncio.run(scenario())
+    assert index is not None
+    assert {c.phone for c in index.search_phone("090", 10)} == {"0901111111", "0902222222"}
+
+
+def test_sales_during_build_are_kept(database):
+    async def scenario():
+        directory = CustomerDirectory(4)
+        task = directory.warm(None)
+        # Hóa đơn lưu sau khi bắt đầu dựng, không nằm trong dữ liệu đã đọc
+        directory.remember(None, "Đức Anh", "0903333333", "Gội đầu", "2099-01-01 11:00:00")
+        directory.remember("other", "Hoa", "0904444444", "Gội đầu", "2099-01-01 11:00:00")
+        await task
+        return directory
+
+    directory = asyncio.run(scenario())
+    index = directory.get(None)
+    assert [c.phone for c in index.search_name("duc", 10)] == ["0903333333"]
+    assert index.get("0903333333").services == ["Gội đầu"]
+    assert index.get("0904444444") is None
@@ -0,0 +1,139 @@
+"""
+Test lớp truy cập database (db.py)
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from config import Config
+
+
+def test_reads_and_writes_run_off_the_event_loop(database):
+    loop_thread = threading.get_ident()
+
+    def slow_read(conn):
+        time.sleep(0.2)
+        return threading.get_ident(), conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+
+    def write(conn):
+        return threading.get_ident(), database.insert_sale(conn, "Lan", "0901234567", "Gội đầu", 50000, "",
+                                                          "2024-03-01 09:00:00")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        (read_thread, count), (write_thread, row_id) = await asyncio.gather(
+            database.run_read(slow_read), database.run_write(write)
+        )
+        task.cancel()
+        return read_thread, count, write_thread, row_id, ticks
+
+    read_thread, count, write_thread, row_id, ticks = asyncio.run(scenario())
+    assert loop_thread not in (read_thread, write_thread)
+    # Event loop vẫn chạy trong lúc truy vấn chậm đang chờ
+    assert ticks >= 5
+    assert count in (0, 1) and row_id == 1
+
+
+def test_add_sale_notifies_after_commit(database, monkeypatch):
+    seen = []
+    monkeypatch.setattr(database, "_write_listeners", [lambda kind, day: seen.append(
+        (kind, day, database.read_sync(lambda conn: conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]))
+    )])
+
+    row_id = asyncio.run(database.add_sale("Lan", "0901234567", "Gội đầu", 50000, "", "2024-03-01 09:00:00"))
+
+    assert row_id == 1
+    # Listener chạy sau commit: dòng mới đã đọc được từ reader connection
+    assert seen == [("sales", "2024-03-01", 1)]
+
+
+def pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_pool_reuses_tuned_connections(database, tmp_path):
+    pool = database.ConnectionPool(str(tmp_path / "pool.db"), readers=2)
+    try:
+        with pool.writer() as conn:
+            writer = conn
+            conn.execute("CREATE TABLE t (x INTEGER)")
+        assert pragma(writer, "journal_mode") == Config.DB_JOURNAL_MODE.lower() == "wal"
+        assert pragma(writer, "synchronous") == 1  # NORMAL
+        assert pragma(writer, "cache_size") == Config.DB_CACHE_SIZE
+
+        with pool.reader() as first, pool.reader() as second:
+            readers = {first, second}
+            assert pragma(first, "query_only") == 1
+            assert pragma(first, "mmap_size") == Config.DB_MMAP_SIZE
+            with pytest.raises(sqlite3.OperationalError, match="readonly"):
+                first.execute("INSERT INTO t VALUES (1)")
+        # Connection được trả về pool và dùng lại, không mở mới
+        with pool.reader() as again:
+            assert again in readers
+        with pool.writer() as conn:
+            assert conn is writer
+    finally:
+        pool.close()
+
+
+def test_readers_do_not_wait_for_open_write_transaction(database, tmp_path):
+    pool = database.ConnectionPool(str(tmp_path / "pool.db"), readers=1)
+    try:
+        with pool.writer() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+            conn.execute("INSERT INTO t VALUES (1)")
+        with pytest.raises(RuntimeError):
+            with pool.writer() as conn:
+                conn.execute("INSERT INTO t VALUES (2)")
+                # WAL: reader đọc snapshot đã commit trong lúc writer đang giữ transaction ghi
+                with pool.reader() as reader:
+                    assert reader.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+                raise RuntimeError("rollback")
+        with pool.reader() as reader:
+            assert reader.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+    finally:
+        pool.close()
+
+
+def sale_names(db):
+    return db.read_sync(lambda conn: [row[0] for row in conn.execute("SELECT name FROM sales ORDER BY id")])
+
+
+def test_each_chat_writes_to_its_own_store_file(database, monkeypatch):
+    monkeypatch.setattr(Config, "DB_SHARDING", True)
+    monkeypatch.setattr(Config, "DB_STORES", "103:salon_q1,104:salon_q1")
+    database._store_map.cache_clear()
+    try:
+        stores = {chat_id: database.store_for_chat(chat_id) for chat_id in (101, 102, 103, 104)}
+        assert stores == {101: "chat_101", 102: "chat_102", 103: "salon_q1", 104: "salon_q1"}
+        for chat_id, name in ((101, "Lan"), (102, "Mai"), (103, "Hoa"), (104, "Đức")):
+            with database.use_store(stores[chat_id]):
+                database.write_sync(database.insert_sale, name, "0901234567", "Cắt tóc", 100000, "",
+                                    "2024-03-01 09:00:00")
+
+        paths = {database.db_path_for(store) for store in stores.values()}
+        assert len(paths) == 3 and Config.DB_NAME not in paths
+        for store, names in (("chat_101", ["Lan"]), ("chat_102", ["Mai"]), ("salon_q1", ["Hoa", "Đức"])):
+            # Đọc trực tiếp từ file: dòng nằm đúng trong file của store
+            conn = sqlite3.connect(database.db_path_for(store))
+            try:
+                assert [row[0] for row in conn.execute("SELECT name FROM sales ORDER BY id")] == names
+            finally:
+                conn.close()
+            with database.use_store(store):
+                assert sale_names(database) == names
+        # Database chính không nhận dòng nào
+        assert sale_names(database) == []
+    finally:
+        database._store_map.cache_clear()
@@ -0,0 +1,119 @@
+"""
+Test các hàm của handlers.py
+"""
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+import handlers
+from config import Config
+from customers import customer_directory
+from handlers import format_summary_days, load_report, send_payment_qr, send_report_document
+from importer import import_csv
+from reports import ReportTooLarge, report_cache
+from test_importer import write_csv
+
+
+def test_format_summary_days():
+    assert format_summary_days((0, 1, 2, 3, 4, 5, 6)) == "mỗi ngày"
+    assert format_summary_days((0, 1, 3, 5)) == "vào thứ 2, thứ 4, thứ 6, Chủ nhật"
+    assert format_summary_days((6,)) == "vào thứ 7"
+
+
+def test_report_cache_sees_import_from_other_process(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "_seen_data_versions", {})
+    report_cache.invalidate(None)
+    path = write_csv(tmp_path / "history.csv",
+                     sales=[["", "Lan", "0901234567", "Gội đầu", "50000", "", "2024-03-01 09:00:00"]])
+
+    async def report_count():
+        _, entry, _, _ = await load_report(None, date(2024, 3, 1), date(2024, 3, 31))
+        return entry.summary["sales"]["count"]
+
+    async def scenario():
+        counts = [await report_count()]
+        await customer_directory.warm(None)
+        # Như `python db.py import`: ghi thẳng vào database, không gọi write listener của bot
+        await asyncio.get_running_loop().run_in_executor(None, import_csv, path)
+        counts.append(await report_count())
+        index = customer_directory.get(None)
+        await customer_directory.warm(None)
+        return counts, index
+
+    counts, index = asyncio.run(scenario())
+    assert counts == [0, 1]
+    # Index khách quen cũng bị bỏ và dựng lại
+    assert index is None
+
+
+def test_report_upload_is_capped(database, monkeypatch):
+    monkeypatch.setattr(database, "_seen_data_versions", {})
+    report_cache.invalidate(None)
+    database.write_sync(database.insert_sale, "Lan", "0901234567", "Gội đầu", 50000, "", "2024-03-01 09:00:00")
+    uploads = []
+
+    async def send_document(document, filename=None, caption=None):
+        uploads.append((document, filename))
+        return SimpleNamespace(document=SimpleNamespace(file_id="file-1"))
+
+    async def send():
+        cache_key, entry, start, end = await load_report(None, date(2024, 3, 1), date(2024, 3, 31))
+        assert await send_report_document(send_document, cache_key, entry, start, end)
+        return entry
+
+    entry = asyncio.run(send())
+    assert entry.file_id == "file-1"
+    assert "Lan" in uploads[0][0].decode("utf-8-sig")
+
+    # Vượt giới hạn: không upload, không đọc file vào RAM
+    monkeypatch.setattr(Config, "REPORT_UPLOAD_MAX_MB", 0)
+    entry.file_id = None
+    with pytest.raises(ReportTooLarge):
+        asyncio.run(send())
+    assert len(uploads) == 1
+
+
+class PhotoMessage:
+    """Message giả: reply_photo trả về file_id mới cho ảnh mới, từ chối file_id trong `rejected`"""
+
+    def __init__(self):
+        self.sent = []
+        self.rejected = set()
+
+    async def reply_photo(self, photo, caption=None):
+        self.sent.append(photo)
+        if photo in self.rejected:
+            raise BadRequest("Wrong file identifier/http url specified")
+        file_id = photo if photo.startswith("photo-") else f"photo-{len(self.sent)}"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+def test_qr_file_id_cache_hit_and_miss(database, monkeypatch):
+    monkeypatch.setattr(handlers, "local_qr_available", lambda: False)
+    monkeypatch.setattr(handlers, "generate_qr", lambda amount, phone, service: f"https://qr/{amount}/{phone}")
+    message = PhotoMessage()
+
+    async def send(amount=150000):
+        await send_payment_qr(message, amount, "0901234567", "Cắt tóc")
+
+    asyncio.run(send())
+    asyncio.run(send())
+    assert message.sent == ["https://qr/150000/0901234567", "photo-1"]
+    # Số tiền khác: key khác, gửi ảnh mới
+    asyncio.run(send(200000))
+    assert message.sent[-1] == "https://qr/200000/0901234567"
+
+    # file_id bị Telegram từ chối: xóa khỏi cache, gửi lại ảnh và lưu file_id mới
+    message.rejected.add("photo-1")
+    asyncio.run(send())
+    assert message.sent[-2:] == ["photo-1", "https://qr/150000/0901234567"]
+    asyncio.run(send())
+    assert message.sent[-1] == "photo-5"
+
+    # Bản ghi cũ hơn QR_FILE_ID_TTL_DAYS không được dùng
+    database.write_sync(lambda conn: conn.execute("UPDATE qr_file_ids SET created_at = '2000-01-01 00:00:00'"))
+    asyncio.run(send())
+    assert message.sent[-1] == "https://qr/150000/0901234567"
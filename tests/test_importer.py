@@ -0,0 +1,137 @@
+"""
+Test import CSV (importer.py)
+"""
+import csv
+
+import pytest
+
+from importer import (ImportInterrupted, file_fingerprint, import_csv, iter_import_rows, validate_expense_row,
+                      validate_sale_row)
+from reports import EXPENSES_HEADER, SALES_HEADER
+
+
+def write_csv(path, sales=(), expenses=()):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["=== DOANH THU ==="])
+        writer.writerow(SALES_HEADER)
+        writer.writerows(sales)
+        writer.writerow(["=== CHI PHÍ ==="])
+        writer.writerow(EXPENSES_HEADER)
+        writer.writerows(expenses)
+    return str(path)
+
+
+def search_ids(db, table, text):
+    return [row[0] for row in db.read_sync(
+        lambda conn: conn.execute(f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?",
+                                  (db.search_match(text),)).fetchall()
+    )]
+
+
+def schema_objects(db):
+    return db.read_sync(lambda conn: sorted(conn.execute(
+        "SELECT type, name FROM sqlite_master WHERE tbl_name IN ('sales', 'expenses') AND sql IS NOT NULL"
+    ).fetchall()))
+
+
+def test_import_restores_indexes_and_search(database, tmp_path):
+    objects = schema_objects(database)
+    path = write_csv(tmp_path / "history.csv",
+                     sales=[["", "Đức Anh", "0901234567", "Cắt tóc", "150000", "", "2024-03-01 09:00:00"]],
+                     expenses=[["", "Điện nước", "500000.0", "", "2024-03-02"]])
+
+    result = import_csv(path)
+
+    assert (result.sales, result.expenses, result.skipped) == (1, 1, 0)
+    assert schema_objects(database) == objects
+    assert not database.read_sync(database.import_running)
+    assert len(search_ids(database, "sales", "duc")) == 1
+    assert len(search_ids(database, "expenses", "dien")) == 1
+
+
+def test_only_one_import_per_database(database, tmp_path):
+    path = write_csv(tmp_path / "history.csv",
+                     sales=[["", "Lan", "0901234567", "Gội đầu", "50000", "", "2024-03-01 09:00:00"]])
+    database.write_sync(database.begin_import)
+    try:
+        assert database.read_sync(database.import_running)
+        with pytest.raises(database.ImportInProgress):
+            database.write_sync(database.begin_import)
+        with pytest.raises(database.ImportInProgress):
+            import_csv(path)
+    finally:
+        assert database.write_sync(database.finish_import)
+
+    assert not database.write_sync(database.finish_import)
+    assert import_csv(path).sales == 1
+
+
+def test_interrupted_import_resumes_without_duplicates(database, tmp_path):
+    sales = [["", f"Khách {i}", "0901234567", "Cắt tóc", "100000", "", f"2024-03-0{i} 09:00:00"] for i in range(1, 6)]
+    path = write_csv(tmp_path / "history.csv", sales=sales, expenses=[["", "Điện nước", "500000", "", "2024-03-02"]])
+    calls = []
+
+    def flaky_execute(fn, *args):
+        if fn is database.insert_import_batch:
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disk I/O error")
+        return database.write_sync(fn, *args)
+
+    with pytest.raises(ImportInterrupted) as info:
+        import_csv(path, execute=flaky_execute, batch_size=2)
+    # Batch đầu (dòng 3-4) đã commit, khóa import đã trả
+    assert (info.value.result.sales, info.value.result.expenses, info.value.line) == (2, 0, 4)
+    assert not database.read_sync(database.import_running)
+
+    result = import_csv(path, batch_size=2)
+    assert (result.resumed_from, result.sales, result.expenses) == (4, 5, 1)
+    names = database.read_sync(lambda conn: [row[0] for row in conn.execute("SELECT name FROM sales ORDER BY id")])
+    assert names == [f"Khách {i}" for i in range(1, 6)]
+    assert database.read_sync(database.import_progress, file_fingerprint(path)) is None
+    assert len(search_ids(database, "sales", "khach")) == 5
+
+
+def test_validate_sale_row():
+    row = ["17", " Đức Anh ", "0901234567", "Cắt tóc", "150,000", " VIP ", "2024-03-01 09:00:00"]
+    assert validate_sale_row(row) == ("Đức Anh", "0901234567", "Cắt tóc", 150000, "VIP", "2024-03-01 09:00:00")
+    # Số thực xuất từ cột REAL và ngày không có giờ
+    assert validate_sale_row(row[:4] + ["150000.0", "", "2024-03-01"])[3:] == (150000, "", "2024-03-01 00:00:00")
+
+
+@pytest.mark.parametrize("index, value, reason", [
+    (1, "A", "tên khách hàng"),
+    (2, "901234567", "số điện thoại"),
+    (3, " ", "dịch vụ"),
+    (4, "0", "lớn hơn 0"),
+    (4, "150000.5", "số nguyên"),
+    (4, "abc", "số tiền không hợp lệ"),
+    (4, "2000000000", "quá lớn"),
+    (6, "01/03/2024", "ngày tạo"),
+])
+def test_validate_sale_row_rejects(index, value, reason):
+    row = ["", "Lan", "0901234567", "Gội đầu", "50000", "", "2024-03-01 09:00:00"]
+    row[index] = value
+    with pytest.raises(ValueError, match=reason):
+        validate_sale_row(row)
+    with pytest.raises(ValueError, match="cần 7 cột"):
+        validate_sale_row(row[:-1])
+
+
+def test_validate_expense_row():
+    assert validate_expense_row(["", "Điện nước", "500000.5", "", "2024-03-02"]) == \
+        ("Điện nước", 500000.5, "", "2024-03-02 00:00:00")
+    with pytest.raises(ValueError, match="loại chi phí"):
+        validate_expense_row(["", "Đ", "500000", "", "2024-03-02"])
+    with pytest.raises(ValueError, match="lớn hơn 0"):
+        validate_expense_row(["", "Điện nước", "-5", "", "2024-03-02"])
+
+
+def test_iter_import_rows_follows_sections():
+    rows = [
+        ["=== DOANH THU ==="], SALES_HEADER, ["1", "Lan"], [],
+        ["=== TỔNG KẾT ==="], ["Tổng doanh thu", "100"],
+        ["=== CHI PHÍ ==="], EXPENSES_HEADER, ["2", "Điện"],
+    ]
+    assert list(iter_import_rows(iter(rows))) == [(3, "sales", ["1", "Lan"]), (9, "expenses", ["2", "Điện"])]
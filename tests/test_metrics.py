@@ -0,0 +1,115 @@
+"""
+Test metrics Prometheus (metrics.py, instrumentation.py)
+"""
+import asyncio
+
+import pytest
+from telegram.ext import CommandHandler
+
+import metrics
+from http_server import start_server
+from instrumentation import instrument_handler
+from metrics import DB_CALL_SECONDS, DB_ERRORS, HANDLER_ERRORS, HANDLER_SECONDS, Registry
+
+
+def sample(text: str, line_prefix: str) -> float:
+    """Giá trị của dòng sample bắt đầu bằng line_prefix (0 nếu chưa có)"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+def test_histogram_and_counter_text_format():
+    registry = Registry()
+    histogram = registry.histogram("t_seconds", "Thời gian", ("fn",), buckets=(0.1, 1))
+    counter = registry.counter("t_total", "Số lần", ("fn",))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, 'a"b')
+    counter.inc("x")
+    counter.inc("x", amount=2)
+
+    assert registry.render().splitlines() == [
+        "# HELP t_seconds Thời gian",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{fn="a\\"b",le="0.1"} 1',
+        't_seconds_bucket{fn="a\\"b",le="1.0"} 2',
+        't_seconds_bucket{fn="a\\"b",le="+Inf"} 3',
+        't_seconds_sum{fn="a\\"b"} 5.55',
+        't_seconds_count{fn="a\\"b"} 3',
+        "# HELP t_total Số lần",
+        "# TYPE t_total counter",
+        't_total{fn="x"} 3',
+    ]
+    # Cùng tên trả về cùng metric
+    assert registry.counter("t_total", "Số lần", ("fn",)) is counter
+
+
+def test_instrumented_handler_records_latency_and_errors():
+    async def failing_command(update, context):
+        raise RuntimeError("boom")
+
+    handler = CommandHandler("fail", failing_command)
+    instrument_handler(handler, "test")
+    instrument_handler(handler, "test")  # Bọc hai lần không đo trùng
+    labels = '{conversation="test",handler="failing_command"}'
+    before = metrics.registry.render()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(handler.callback(None, None))
+
+    after = metrics.registry.render()
+    assert sample(after, f"{HANDLER_SECONDS.name}_count{labels}") == sample(
+        before, f"{HANDLER_SECONDS.name}_count{labels}") + 1
+    assert sample(after, f"{HANDLER_ERRORS.name}{labels}") == sample(before, f"{HANDLER_ERRORS.name}{labels}") + 1
+
+
+def test_db_calls_recorded(database):
+    def count_sales(conn):
+        return conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+
+    def broken_query(conn):
+        return conn.execute("SELECT missing FROM sales").fetchone()
+
+    read_count = f'{DB_CALL_SECONDS.name}_count{{mode="read",fn="count_sales"}}'
+    error_count = f'{DB_ERRORS.name}{{mode="read",fn="broken_query"}}'
+    before = metrics.registry.render()
+
+    assert asyncio.run(database.run_read(count_sales)) == 0
+    with pytest.raises(Exception):
+        asyncio.run(database.run_read(broken_query))
+
+    after = metrics.registry.render()
+    assert sample(after, read_count) == sample(before, read_count) + 1
+    assert sample(after, error_count) == sample(before, error_count) + 1
+
+
+async def fetch(port: int, method: str, path: str):
+    """Gửi một request HTTP/1.1, trả về (status, body)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body.decode("utf-8")
+
+
+def test_metrics_endpoint():
+    async def scenario():
+        server = await start_server("127.0.0.1", 0, metrics._handle_metrics)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await fetch(port, method, path)
+                    for method, path in (("GET", "/metrics"), ("POST", "/metrics"), ("GET", "/other"))]
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    (status, body), (post_status, _), (other_status, _) = asyncio.run(scenario())
+    assert status == 200
+    assert f"# TYPE {HANDLER_SECONDS.name} histogram" in body
+    assert (post_status, other_status) == (405, 404)
+    # METRICS_PORT=0: không mở endpoint
+    assert asyncio.run(metrics.start_metrics_server(port=0)) is None
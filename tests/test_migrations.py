@@ -0,0 +1,58 @@
+"""
+Test migration và backfill nền (db.py)
+"""
+from datetime import date
+
+from config import Config
+
+
+def add_sales(db, created_ats):
+    return [db.write_sync(db.insert_sale, "Lan", "0901234567", "Cắt tóc", 100000, "", created_at)
+            for created_at in created_ats]
+
+
+def backfill_state(db, version):
+    return db.read_sync(lambda conn: conn.execute(
+        "SELECT backfill_cursor, backfill_target, completed_at IS NOT NULL FROM schema_migrations WHERE version = ?",
+        (version,)
+    ).fetchone())
+
+
+def test_epoch_timestamps_backfill_in_batches(database, monkeypatch):
+    ids = add_sales(database, [f"2024-03-0{day} 10:00:00" for day in range(1, 6)])
+    monkeypatch.setattr(Config, "DB_EPOCH_TIMESTAMPS", True)
+    version = database.EPOCH_MIGRATION_VERSIONS["sales"]
+
+    assert database.write_sync(database.create_schema)
+    assert backfill_state(database, version) == (0, ids[-1], False)
+    # Chưa backfill xong: báo cáo vẫn lọc theo created_at
+    assert database.read_sync(database.period_clause, "sales", date(2024, 3, 1), date(2024, 4, 1))[2] == "created_at"
+
+    assert not database.write_sync(database.run_backfill_batch, version, 2)
+    assert backfill_state(database, version) == (ids[1], ids[-1], False)
+    # Dòng mới ghi trong lúc backfill đã có created_ts, không nằm trong target
+    add_sales(database, ["2024-03-06 10:00:00"])
+    while not database.write_sync(database.run_backfill_batch, version, 2):
+        pass
+
+    assert database.read_sync(database.period_clause, "sales", date(2024, 3, 1), date(2024, 4, 1))[2] == "created_ts"
+    rows = database.read_sync(lambda conn: conn.execute("SELECT created_at, created_ts, day_key FROM sales").fetchall())
+    assert [(ts, day_key) for _, ts, day_key in rows] == [database.time_columns(created_at) for created_at, _, _ in rows]
+
+
+def test_epoch_timestamps_reopen_after_mode_was_off(database, monkeypatch):
+    monkeypatch.setattr(Config, "DB_EPOCH_TIMESTAMPS", True)
+    database.write_sync(database.create_schema)
+    version = database.EPOCH_MIGRATION_VERSIONS["sales"]
+    assert backfill_state(database, version)[2]
+
+    # Dòng ghi lúc tắt chế độ không có created_ts: bật lại thì backfill được mở lại
+    monkeypatch.setattr(Config, "DB_EPOCH_TIMESTAMPS", False)
+    ids = add_sales(database, ["2024-03-01 10:00:00", "2024-03-02 10:00:00"])
+    monkeypatch.setattr(Config, "DB_EPOCH_TIMESTAMPS", True)
+    assert database.write_sync(database.create_schema)
+    assert backfill_state(database, version) == (0, ids[-1], False)
+    assert database.write_sync(database.run_backfill_batch, version, 10)
+    assert database.read_sync(
+        lambda conn: conn.execute("SELECT COUNT(*) FROM sales WHERE created_ts IS NULL").fetchone()[0]
+    ) == 0
@@ -0,0 +1,65 @@
+"""
+Test khoảng báo cáo half-open [start, end) (db.period_clause, reports.resolve_period)
+"""
+from datetime import date, datetime
+
+import pytest
+
+import reports
+from config import Config
+from reports import resolve_period
+
+MARCH = (date(2024, 3, 1), date(2024, 4, 1))
+BOUNDARY_TIMES = ["2024-02-29 23:59:59", "2024-03-01 00:00:00", "2024-03-31 23:59:59", "2024-04-01 00:00:00"]
+
+
+def add_boundary_rows(db):
+    return [db.write_sync(db.insert_sale, "Lan", "0901234567", "Cắt tóc", 100000, "", created_at)
+            for created_at in BOUNDARY_TIMES]
+
+
+def period_ids(db, table="sales"):
+    return sorted(row[0] for rows in db.read_sync(lambda conn: list(db.iter_period_rows(conn, table, *MARCH)))
+                  for row in rows)
+
+
+def query_plan(db, table="sales"):
+    def explain(conn):
+        clause, params, order = db.period_clause(conn, table, *MARCH)
+        return order, " ".join(row[3] for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM {table} WHERE {clause} ORDER BY {order} DESC", params
+        ))
+    return db.read_sync(explain)
+
+
+@pytest.mark.parametrize("epoch", [False, True])
+def test_period_includes_start_and_excludes_end(database, monkeypatch, epoch):
+    ids = add_boundary_rows(database)
+    if epoch:
+        monkeypatch.setattr(Config, "DB_EPOCH_TIMESTAMPS", True)
+        database.write_sync(database.create_schema)
+        while not database.write_sync(database.run_backfill_batch, database.EPOCH_MIGRATION_VERSIONS["sales"], 10):
+            pass
+
+    order, plan = query_plan(database)
+    assert order == ("created_ts" if epoch else "created_at")
+    # Tìm theo khoảng trên index (SEARCH), không quét cả bảng (SCAN)
+    assert plan.startswith("SEARCH sales") and f"INDEX idx_sales_{order} (" in plan
+    assert period_ids(database) == ids[1:3]
+    summary = database.read_sync(database.fetch_period_summary, *MARCH)
+    assert (summary["sales"]["count"], summary["sales"]["amount"]) == (2, 200000)
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(2024, 1, 1, 0, 30, tzinfo=tz)
+
+
+def test_resolve_period_boundaries(monkeypatch):
+    monkeypatch.setattr(reports, "datetime", FixedDatetime)
+    assert resolve_period("current")[:2] == (date(2024, 1, 1), date(2024, 2, 1))
+    assert resolve_period("previous")[:2] == (date(2023, 12, 1), date(2024, 1, 1))
+    assert resolve_period("yesterday")[:2] == (date(2023, 12, 31), date(2024, 1, 1))
+    # Ngày kết thúc do người dùng nhập được tính trọn ngày
+    assert resolve_period(None, date(2024, 2, 1), date(2024, 2, 29))[:2] == (date(2024, 2, 1), date(2024, 3, 1))
@@ -0,0 +1,66 @@
+"""
+Test lưu conversation/user_data (persistence.py)
+"""
+import asyncio
+
+import persistence
+from persistence import SQLitePersistence
+
+KEY = (100, 200)
+
+
+async def reload(name="bill"):
+    """Như sau khi khởi động lại: persistence mới đọc từ database"""
+    fresh = SQLitePersistence(update_interval=60)
+    user_data = {}
+    await fresh.refresh_user_data(200, user_data)
+    return await fresh.get_conversations(name), user_data
+
+
+def test_flush_writes_batch_and_removes_finished_state(database):
+    async def scenario():
+        store = SQLitePersistence(update_interval=60)
+        await store.update_conversation("bill", KEY, 3)
+        await store.update_user_data(200, {"name": "Đức", "amount": 150000})
+        await store.flush()
+        saved = await reload()
+
+        await store.update_conversation("bill", KEY, None)
+        await store.update_user_data(200, {})
+        await store.flush()
+        return saved, await reload()
+
+    saved, finished = asyncio.run(scenario())
+    assert saved == ({KEY: 3}, {"name": "Đức", "amount": 150000})
+    assert finished == ({}, {})
+
+
+def test_failed_write_is_retried_without_overwriting_newer_changes(database, monkeypatch):
+    calls = []
+    run_write = persistence.run_write
+
+    async def flaky_run_write(fn, *args):
+        if fn is persistence.save_persistence_batch:
+            calls.append(args)
+            if len(calls) <= 2:
+                raise RuntimeError("database is locked")
+        return await run_write(fn, *args)
+
+    monkeypatch.setattr(persistence, "run_write", flaky_run_write)
+
+    async def scenario():
+        store = SQLitePersistence(update_interval=60)
+        await store.update_conversation("bill", KEY, 1)
+        await store.update_user_data(200, {"step": 1})
+        # Task ghi nền và lần ghi lại trong flush() đều lỗi: thay đổi được giữ lại
+        await store.flush()
+        assert await reload() == ({}, {})
+        # Thay đổi mới hơn của cùng key thắng khi ghi lại
+        await store.update_conversation("bill", KEY, 2)
+        await store.flush()
+        return await reload()
+
+    conversations, user_data = asyncio.run(scenario())
+    assert len(calls) == 3
+    assert conversations == {KEY: 2}
+    assert user_data == {"step": 1}
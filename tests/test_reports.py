@@ -0,0 +1,105 @@
+"""
+Test report cache và tạo file báo cáo trong process con (reports.py)
+"""
+import asyncio
+import os
+from datetime import date
+
+import db
+from reports import CachedReport, ReportCache, ReportWorkerPool, build_report_file, report_cache
+
+MARCH = (None, "current", date(2024, 3, 1), date(2024, 4, 1))
+FEBRUARY = (None, "previous", date(2024, 2, 1), date(2024, 3, 1))
+MARCH_5 = (None, "yesterday", date(2024, 3, 5), date(2024, 3, 6))
+OTHER_STORE_MARCH = ("salon_q1", "current", date(2024, 3, 1), date(2024, 4, 1))
+
+
+def cached(text="report"):
+    summary = {"sales": {"count": 1, "amount": 1, "by_label": []},
+               "expenses": {"count": 0, "amount": 0, "by_label": []}}
+    return CachedReport(summary=summary, text=text, profit_text="1")
+
+
+def test_write_invalidates_only_overlapping_entries():
+    cache = ReportCache(8)
+    for key in (MARCH, FEBRUARY, MARCH_5, OTHER_STORE_MARCH):
+        cache.put(key, cached(), cache.version)
+
+    cache.invalidate("2024-03-31")
+    assert cache.get(MARCH) is None
+    assert cache.get(FEBRUARY) is not None
+    assert cache.get(MARCH_5) is not None
+    # Store khác không bị ảnh hưởng
+    assert cache.get(OTHER_STORE_MARCH) is not None
+
+    # day=None (import): xóa mọi entry của store
+    cache.invalidate(None)
+    assert [cache.get(key) for key in (FEBRUARY, MARCH_5)] == [None, None]
+    assert cache.get(OTHER_STORE_MARCH) is not None
+
+
+def test_stale_result_and_lru_eviction():
+    cache = ReportCache(2)
+    version = cache.version
+    cache.invalidate("2024-03-05")
+    # Báo cáo tính từ snapshot trước lần invalidate không được lưu
+    cache.put(MARCH, cached(), version)
+    assert cache.get(MARCH) is None
+
+    cache.put(MARCH, cached(), cache.version)
+    cache.put(FEBRUARY, cached(), cache.version)
+    cache.get(MARCH)
+    cache.put(MARCH_5, cached(), cache.version)
+    assert cache.get(FEBRUARY) is None
+    assert cache.get(MARCH) is not None and cache.get(MARCH_5) is not None
+
+
+def test_insert_notification_reaches_shared_cache():
+    report_cache.invalidate(None)
+    report_cache.put(MARCH, cached(), report_cache.version)
+    report_cache.put(FEBRUARY, cached(), report_cache.version)
+    db.notify_write("sales", "2024-03-10")
+    assert report_cache.get(MARCH) is None
+    assert report_cache.get(FEBRUARY) is not None
+    report_cache.invalidate(None)
+
+
+def test_large_report_built_in_worker_process(database, monkeypatch):
+    # Process con (spawn) đọc Config từ biến môi trường: batch 2 dòng để có nhiều lần báo tiến độ
+    monkeypatch.setenv("REPORT_FETCH_SIZE", "2")
+    for day in range(1, 6):
+        database.write_sync(database.insert_sale, f"Khách {day}", "0901234567", "Cắt tóc", 100000, "",
+                            f"2024-03-0{day} 09:00:00")
+    start, end = date(2024, 3, 1), date(2024, 4, 1)
+    summary = database.read_sync(database.fetch_period_summary, start, end)
+    local_file, _ = database.read_sync(build_report_file, start, end, summary, "500,000")
+    with local_file:
+        expected = local_file.read()
+
+    pool = ReportWorkerPool(1, 1)
+    progress = []
+
+    async def build():
+        return await pool.build(start, end, summary, "500,000",
+                                on_progress=lambda done, total: progress.append((done, total)))
+
+    try:
+        assert pool.try_acquire(7)
+        # Giới hạn theo user: báo cáo lớn thứ hai của cùng user bị từ chối, user khác vẫn được
+        assert not pool.try_acquire(7)
+        assert pool.try_acquire(8)
+        path, filename = asyncio.run(build())
+    finally:
+        pool.release(7)
+        pool.release(8)
+        pool.shutdown()
+
+    try:
+        with open(path, "rb") as f:
+            assert f.read() == expected
+    finally:
+        os.remove(path)
+    assert filename.startswith("report_")
+    assert pool.pending == 0
+    # Mọi tiến độ đều tới trước khi build() trả về, kể cả batch cuối
+    assert progress == [(2, 5), (4, 5), (5, 5)]
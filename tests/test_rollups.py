@@ -0,0 +1,67 @@
+"""
+Test bảng tổng hợp daily_totals (db.py)
+"""
+from archive import archive_closed_periods
+
+SALES = [("Lan", "Cắt tóc", 100000, "2020-01-05 09:00:00"), ("Mai", "Gội đầu", 50000, "2020-01-05 18:30:00"),
+         ("Hoa", "Cắt tóc", 120000, "2020-02-10 10:00:00"), ("Đức", "Cắt tóc", 90000, "2099-01-01 08:00:00")]
+EXPENSES = [("Điện nước", 500000.5, "2020-01-31 12:00:00"), ("Lương", 3000000.0, "2099-01-02 12:00:00")]
+
+
+def add_rows(db):
+    for name, service, amount, created_at in SALES:
+        db.write_sync(db.insert_sale, name, "0901234567", service, amount, "", created_at)
+    for category, amount, created_at in EXPENSES:
+        db.write_sync(db.insert_expense, category, amount, "", created_at)
+
+
+def rollup(db):
+    return db.read_sync(lambda conn: sorted(conn.execute(
+        "SELECT day, kind, label, count, amount FROM daily_totals"
+    ).fetchall()))
+
+
+def expected_rollup():
+    totals = {}
+    for kind, rows in (("sales", [(s, a, c) for _, s, a, c in SALES]), ("expenses", EXPENSES)):
+        for label, amount, created_at in rows:
+            count, total = totals.get((created_at[:10], kind, label), (0, 0))
+            totals[(created_at[:10], kind, label)] = (count + 1, total + amount)
+    return sorted(key + value for key, value in totals.items())
+
+
+def test_daily_totals_match_raw_rows(database):
+    add_rows(database)
+    assert rollup(database) == expected_rollup()
+
+    # rebuild-rollups tạo lại từ dữ liệu gốc, kể cả dòng đã chuyển sang phân vùng archive
+    assert archive_closed_periods(None) == 4
+    database.write_sync(lambda conn: conn.execute("DELETE FROM daily_totals"))
+    database.write_sync(database.rebuild_rollups)
+    assert rollup(database) == expected_rollup()
+
+
+def raw_stats(db):
+    def query(conn):
+        sales = conn.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM sales").fetchone()
+        expenses = conn.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM expenses").fetchone()
+        return {"total_sales_count": sales[0], "total_sales_amount": sales[1],
+                "total_expenses_count": expenses[0], "total_expenses_amount": expenses[1],
+                "profit": sales[1] - expenses[1]}
+    return db.read_sync(query)
+
+
+def test_stats_counters_match_count_and_sum(database):
+    empty = database.read_sync(database.fetch_stats)
+    assert empty == raw_stats(database)
+    assert empty["total_sales_count"] == 0
+
+    add_rows(database)
+    assert database.read_sync(database.fetch_stats) == raw_stats(database)
+    assert raw_stats(database)["total_sales_count"] == len(SALES)
+
+    # Ghi bằng executemany (import) không cập nhật bộ đếm; rebuild tính lại từ daily_totals
+    database.write_sync(database.insert_sales_rows, [("Vy", "0907654321", "Nhuộm tóc", 400000, "",
+                                                      "2099-01-03 09:00:00")])
+    database.write_sync(database.rebuild_rollups)
+    assert database.read_sync(database.fetch_stats) == raw_stats(database)
@@ -0,0 +1,102 @@
+"""
+Test tìm kiếm FTS5 (/search): trigger đồng bộ, backfill và phân trang qua phân vùng archive
+"""
+import sys
+from datetime import date
+
+from archive import archive_batch, archive_closed_periods, archive_cutoff
+
+SALES_FTS_VERSION = 2
+
+
+def add_sale(db, name, created_at, service="Cắt tóc"):
+    return db.write_sync(db.insert_sale, name, "0901234567", service, 100000, "", created_at)
+
+
+def add_expense(db, category, created_at):
+    return db.write_sync(db.insert_expense, category, 50000.0, "", created_at)
+
+
+def search_ids(db, text, table="sales"):
+    return sorted(row[0] for row in db.read_sync(lambda conn: conn.execute(
+        f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?", (db.search_match(text),)
+    ).fetchall()))
+
+
+def check_integrity(conn, table="sales"):
+    # Chỉ kiểm tra cấu trúc index: giá trị được index đã đổi đ -> d nên không so được với bảng gốc
+    conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('integrity-check')")
+
+
+def all_pages(db, text, limit):
+    before = {"sales": sys.maxsize, "expenses": sys.maxsize}
+    pages = []
+    while any(before.values()):
+        page, before = db.read_sync(db.fetch_search_page, db.search_match(text), before, limit)
+        pages.append([(kind, row[0]) for kind, row in page])
+    return pages
+
+
+def test_triggers_fold_d_stroke_on_insert_update_delete(database):
+    row_id = add_sale(database, "Đỗ Đức", "2024-03-01 10:00:00")
+    assert search_ids(database, "duc") == search_ids(database, "Đức") == [row_id]
+
+    database.write_sync(lambda conn: conn.execute("UPDATE sales SET name = 'Lan' WHERE id = ?", (row_id,)))
+    database.write_sync(check_integrity)
+    assert search_ids(database, "duc") == []
+    assert search_ids(database, "lan") == [row_id]
+
+    database.write_sync(lambda conn: conn.execute("UPDATE sales SET name = 'Đức' WHERE id = ?", (row_id,)))
+    database.write_sync(lambda conn: conn.execute("DELETE FROM sales WHERE id = ?", (row_id,)))
+    # Trigger delete phải gửi đúng token đã index ('duc', không phải 'đuc'), nếu không dòng đã xóa vẫn khớp
+    database.write_sync(check_integrity)
+    assert search_ids(database, "duc") == []
+    other_id = add_sale(database, "Đức", "2024-03-02 10:00:00")
+    assert search_ids(database, "duc") == [other_id]
+
+
+def test_search_backfill_resumes_after_restart(database):
+    ids = [add_sale(database, f"Đức {i}", f"2024-03-0{i} 10:00:00") for i in range(1, 8)]
+    # Như database cũ trước migration sales_fts: dữ liệu có sẵn, index trống, backfill chưa chạy
+    database.write_sync(lambda conn: (
+        conn.execute("INSERT INTO sales_fts (sales_fts) VALUES ('delete-all')"),
+        conn.execute("UPDATE schema_migrations SET backfill_cursor = 0, backfill_target = ?, completed_at = NULL "
+                     "WHERE version = ?", (ids[-1], SALES_FTS_VERSION))
+    ))
+    assert search_ids(database, "duc") == []
+
+    assert not database.write_sync(database.run_backfill_batch, SALES_FTS_VERSION, 3)
+    assert search_ids(database, "duc") == ids[:3]
+
+    # Khởi động lại: backfill chạy tiếp từ cursor đã lưu, không index lại dòng đã có
+    database.router.close()
+    database.init_db()
+    assert database.read_sync(database.pending_backfills) == [SALES_FTS_VERSION]
+    while not database.write_sync(database.run_backfill_batch, SALES_FTS_VERSION, 3):
+        pass
+    assert search_ids(database, "duc") == ids
+    database.write_sync(check_integrity)
+
+
+def test_search_pages_across_archive_partitions(database):
+    sales = []
+    for i in range(12):
+        # Xen kẽ tháng đã đóng (được archive) và tháng còn mở, cả hai bảng
+        created_at = f"2020-0{i % 3 + 1}-1{i % 9} 10:00:00" if i % 2 else f"2099-01-1{i % 9} 10:00:00"
+        sales.append(add_sale(database, f"Đức {i}", created_at))
+        if i % 3 == 0:
+            add_expense(database, f"Đồ dùng {i}", f"2020-02-1{i % 9} 09:00:00")
+    expected = all_pages(database, "d", 4)
+    assert sum(len(page) for page in expected) == 16
+    assert all(len(page) == 4 for page in expected[:-1])
+
+    # Archive dở (một phần dòng đã chuyển) rồi archive hết: các trang kết quả không đổi
+    cutoff = archive_cutoff(date.today())
+    last_ids = database.read_sync(database.max_row_ids, ("sales", "expenses"))
+    database.write_sync(archive_batch, "sales", cutoff, 0, last_ids["sales"], 3)
+    assert all_pages(database, "d", 4) == expected
+
+    assert archive_closed_periods(None) == 7
+    assert database.read_sync(lambda conn: conn.execute("SELECT COUNT(*) FROM archive_partitions").fetchone()[0]) == 4
+    assert all_pages(database, "d", 4) == expected
+    assert [row_id for page in all_pages(database, "duc", 5) for _, row_id in page] == sales[::-1]
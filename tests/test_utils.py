@@ -0,0 +1,46 @@
+"""
+Test tạo payload VietQR (utils.py)
+"""
+from typing import Dict
+
+from utils import build_vietqr_payload, crc16_ccitt, to_ascii_note
+
+
+def parse_tlv(data: str) -> Dict[str, str]:
+    """Tách chuỗi EMVCo thành {ID: giá trị}"""
+    fields = {}
+    while data:
+        tag, length = data[:2], int(data[2:4])
+        fields[tag] = data[4:4 + length]
+        data = data[4 + length:]
+    return fields
+
+
+def test_crc16_ccitt_false_check_value():
+    assert crc16_ccitt(b"123456789") == 0x29B1
+    assert crc16_ccitt(b"") == 0xFFFF
+
+
+def test_vietqr_payload_fields():
+    payload = build_vietqr_payload("970436", "0123456789", 150000, "0901234567 - Cat toc")
+
+    assert payload[-8:-4] == "6304"
+    assert payload[-4:] == f"{crc16_ccitt(payload[:-4].encode('ascii')):04X}"
+    fields = parse_tlv(payload)
+    assert fields["01"] == "12"
+    assert fields["54"] == "150000"
+    assert fields["53"] == "704"
+    assert parse_tlv(fields["62"]) == {"08": "0901234567 - Cat toc"}
+    merchant = parse_tlv(fields["38"])
+    assert merchant["02"] == "QRIBFTTA"
+    assert parse_tlv(merchant["01"]) == {"00": "970436", "01": "0123456789"}
+
+
+def test_vietqr_payload_without_amount_is_static():
+    fields = parse_tlv(build_vietqr_payload("970436", "0123456789", 0, ""))
+    assert fields["01"] == "11"
+    assert "54" not in fields and "62" not in fields
+
+
+def test_to_ascii_note():
+    assert to_ascii_note("0901234567 - Gội đầu Đặc biệt") == "0901234567 - Goi dau Dac biet"
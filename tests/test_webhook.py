@@ -0,0 +1,59 @@
+"""
+Test webhook qua HTTP server nhúng (webhook.py, http_server.py)
+"""
+import asyncio
+import json
+
+from telegram.ext import ApplicationBuilder
+
+from http_server import start_server
+from webhook import SECRET_HEADER, make_webhook_handler
+
+PATH = "/webhook"
+SECRET = "s3cret"
+UPDATE = {"update_id": 7, "message": {"message_id": 1, "date": 0, "chat": {"id": 10, "type": "private"},
+                                      "text": "/start"}}
+
+
+async def request(port: int, method: str, path: str, body: bytes = b"", headers: dict = None) -> int:
+    """Gửi một request HTTP/1.1, trả về status code"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}", "Connection: close"]
+    lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+def test_webhook_statuses_and_enqueue():
+    async def scenario():
+        app = ApplicationBuilder().token("1:test").updater(None).build()
+        server = await start_server("127.0.0.1", 0, make_webhook_handler(app, PATH, SECRET))
+        port = server.sockets[0].getsockname()[1]
+        body = json.dumps(UPDATE).encode()
+        auth = {SECRET_HEADER: SECRET}
+        try:
+            statuses = {
+                "missing secret": await request(port, "POST", PATH, body),
+                "wrong secret": await request(port, "POST", PATH, body, {SECRET_HEADER: "nope"}),
+                "wrong path": await request(port, "POST", "/other", body, auth),
+                "get": await request(port, "GET", PATH, headers=auth),
+                "malformed": await request(port, "POST", PATH, b"{not json", auth),
+                "not an update": await request(port, "POST", PATH, b"[]", auth),
+            }
+            assert app.update_queue.empty()
+            statuses["valid"] = await request(port, "POST", PATH, body, auth)
+            queued = [app.update_queue.get_nowait() for _ in range(app.update_queue.qsize())]
+        finally:
+            server.close()
+            await server.wait_closed()
+        return statuses, queued
+
+    statuses, queued = asyncio.run(scenario())
+    assert statuses == {"missing secret": 403, "wrong secret": 403, "wrong path": 404, "get": 405,
+                        "malformed": 400, "not an update": 400, "valid": 200}
+    assert [update.update_id for update in queued] == [7]
+    assert queued[0].effective_chat.id == 10
@@ -0,0 +1,69 @@
+"""
+Test chia update và ghi từ worker qua process chính (workers.py)
+"""
+import threading
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+from workers import WorkerClient, WorkerPool, worker_index
+
+
+def make_update(update_id, chat_id=None, user_id=None):
+    chat = Chat(chat_id, Chat.GROUP) if chat_id is not None else None
+    user = User(user_id, "Lan", False) if user_id is not None else None
+    if chat is None:
+        return Update(update_id)
+    return Update(update_id, message=Message(update_id, datetime.now(), chat, from_user=user, text="hi"))
+
+
+def test_user_always_routes_to_same_worker():
+    # Cùng user ở các chat khác nhau: cùng worker (state ConversationHandler theo user không bị tách)
+    assert {worker_index(make_update(i, chat_id=-100 - i, user_id=42), 4, i) for i in range(10)} == {42 % 4}
+    assert worker_index(make_update(1, chat_id=-7), 4, 0) == -7 % 4
+    assert worker_index(make_update(1), 4, 6) == 2
+
+    pool = WorkerPool(3)
+    for i in range(6):
+        pool.dispatch(make_update(i, chat_id=-100 - i, user_id=5))
+    assert [inbox.qsize() for inbox in pool._inboxes] == [0, 0, 6]
+
+
+class ExitOnCall:
+    """
+    Thay event loop của worker: tin nhắn đầu tiên cần chuyển sang event loop kết thúc thread đọc inbox
+    (SystemExit trong thread là thoát êm)
+    """
+
+    def call_soon_threadsafe(self, callback, *args):
+        raise SystemExit
+
+
+# Thread đọc inbox chỉ dừng khi process worker thoát: test kết thúc nó bằng SystemExit (ExitOnCall)
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_remote_write_lands_in_main_database(database):
+    pool = WorkerPool(2)
+    # Thread ghi của process chính; worker 1 chạy trong cùng process với inbox/outbox thật
+    pool._server = threading.Thread(target=pool._serve_requests, daemon=True)
+    pool._server.start()
+    client = WorkerClient(1, pool._inboxes[1], pool._outbox)
+    client._loop = ExitOnCall()
+    reader = threading.Thread(target=client._read_inbox, daemon=True)
+    reader.start()
+    try:
+        row_id = client.submit_write(
+            None, database.insert_sale, ("Lan", "0901234567", "Gội đầu", 50000, "", "2024-03-01 09:00:00")
+        ).result(timeout=5)
+        # Lỗi của thao tác ghi được trả về cho worker
+        with pytest.raises(TypeError):
+            client.submit_write(None, database.insert_sale, ("Lan",)).result(timeout=5)
+        with pytest.raises(ValueError, match="cấp module"):
+            client.submit_write(None, lambda conn: None, ())
+    finally:
+        pool._inboxes[1].put(("notify", None, "sales", None))
+        reader.join(5)
+        pool._outbox.put(None)
+        pool._server.join()
+
+    assert database.read_sync(lambda conn: conn.execute("SELECT id, name FROM sales").fetchall()) == [(row_id, "Lan")]
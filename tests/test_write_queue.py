@@ -0,0 +1,78 @@
+"""
+Test group-commit write queue (db.WriteQueue)
+"""
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from db import ConnectionPool, WriteQueue
+
+
+class FailingConnection:
+    """Connection giả: lệnh SQL bắt đầu bằng `fail_on` ném lỗi"""
+
+    def __init__(self, conn: sqlite3.Connection, fail_on: str):
+        self._conn = conn
+        self._fail_on = fail_on
+
+    def execute(self, sql, *args):
+        if sql.startswith(self._fail_on):
+            raise sqlite3.OperationalError("database is locked")
+        return self._conn.execute(sql, *args)
+
+
+class FailingPool(ConnectionPool):
+    def __init__(self, db_name: str, fail_on: str):
+        super().__init__(db_name, readers=1)
+        self.fail_on = fail_on
+
+    @contextmanager
+    def writer(self):
+        with super().writer() as conn:
+            yield FailingConnection(conn, self.fail_on)
+
+
+def create_items(conn, value: int) -> int:
+    conn.execute("CREATE TABLE IF NOT EXISTS items (value INTEGER)")
+    conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    return value
+
+
+def broken_item(conn, value: int) -> int:
+    raise ValueError(f"bad value {value}")
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "queue.db"), readers=1)
+    yield pool
+    pool.close()
+
+
+def test_batch_commits_and_isolates_failed_item(pool):
+    queue = WriteQueue(pool, max_batch=10, max_delay_ms=50)
+    futures = [queue.submit(create_items, 1), queue.submit(broken_item, 2), queue.submit(create_items, 3)]
+    queue.close()
+
+    assert futures[0].result(timeout=2) == 1
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=2)
+    assert futures[2].result(timeout=2) == 3
+    with pool.reader() as conn:
+        assert [row[0] for row in conn.execute("SELECT value FROM items ORDER BY value")] == [1, 3]
+
+
+@pytest.mark.parametrize("fail_on", ["BEGIN", "RELEASE", "ROLLBACK TO"])
+def test_failed_batch_resolves_every_future(tmp_path, fail_on):
+    pool = FailingPool(str(tmp_path / "queue.db"), fail_on)
+    queue = WriteQueue(pool, max_batch=10, max_delay_ms=50)
+    try:
+        futures = [queue.submit(create_items, 1), queue.submit(broken_item, 2), queue.submit(create_items, 3)]
+        # Không future nào bị treo: tất cả kết thúc bằng lỗi vì batch không được commit
+        errors = [future.exception(timeout=2) for future in futures]
+        assert all(isinstance(error, (sqlite3.OperationalError, ValueError)) for error in errors)
+        assert any(isinstance(error, sqlite3.OperationalError) for error in errors)
+    finally:
+        queue.close()
+        pool.close()
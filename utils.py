@@ -1,13 +1,81 @@
 """
 Utilities module - Các hàm tiện ích
 """
+import io
+import re
+import unicodedata
 import urllib.parse
+from functools import lru_cache
 from typing import Optional
 from config import Config
 import logging
 
+try:
+    import qrcode
+except ImportError:  # pillow/qrcode là optional dependency
+    qrcode = None
+
 logger = logging.getLogger(__name__)
 
+# Mã BIN (NAPAS) của các ngân hàng phổ biến, dùng khi BANK_BIN chưa được cấu hình
+BANK_BINS = {
+    "VCB": "970436", "VIETCOMBANK": "970436",
+    "MB": "970422", "MBBANK": "970422",
+    "TCB": "970407", "TECHCOMBANK": "970407",
+    "ACB": "970416",
+    "BIDV": "970418",
+    "ICB": "970415", "VTB": "970415", "VIETINBANK": "970415",
+    "VPB": "970432", "VPBANK": "970432",
+    "TPB": "970423", "TPBANK": "970423",
+    "STB": "970403", "SACOMBANK": "970403",
+    "VBA": "970405", "AGRIBANK": "970405",
+    "VIB": "970441",
+    "SHB": "970443",
+    "HDB": "970437", "HDBANK": "970437",
+    "OCB": "970448",
+    "MSB": "970426",
+    "EIB": "970431", "EXIMBANK": "970431",
+    "SEAB": "970440", "SEABANK": "970440",
+    "LPB": "970449", "LIENVIETPOSTBANK": "970449",
+    "NAB": "970428", "NAMABANK": "970428",
+}
+
+# Nội dung chuyển khoản tối đa (ký tự ASCII) để tương thích với app ngân hàng
+MAX_ADD_INFO_LENGTH = 50
+
+# ===========================
+# Validate dữ liệu nhập (dùng chung cho handler và import CSV)
+# ===========================
+PHONE_PATTERN = re.compile(r'^0\d{9}$')  # SĐT Việt Nam: 10 số, bắt đầu bằng 0
+MIN_TEXT_LENGTH = 2  # tên khách, dịch vụ, loại chi phí
+MAX_AMOUNT = 1000000000  # 1 tỷ
+
+
+def is_valid_phone(phone: str) -> bool:
+    return bool(PHONE_PATTERN.match(phone.strip()))
+
+
+def is_valid_label(text: str) -> bool:
+    """Tên khách hàng / dịch vụ / loại chi phí: tối thiểu MIN_TEXT_LENGTH ký tự"""
+    return len(text.strip()) >= MIN_TEXT_LENGTH
+
+
+def parse_amount(text: str, number_type=int):
+    """
+    Đọc số tiền người dùng nhập, bỏ dấu phẩy/chấm phân cách hàng nghìn.
+    Raises ValueError nếu không phải số.
+    """
+    return number_type(text.strip().replace(",", "").replace(".", ""))
+
+
+def amount_error(amount) -> Optional[str]:
+    """Lý do số tiền không hợp lệ, None nếu hợp lệ"""
+    if amount <= 0:
+        return "Số tiền phải lớn hơn 0"
+    if amount > MAX_AMOUNT:
+        return "Số tiền quá lớn"
+    return None
+
 
 def generate_qr(amount: int, phone: str, service: str) -> str:
     """
@@ -34,3 +102,92 @@ def generate_qr(amount: int, phone: str, service: str) -> str:
     qr_url = f"https://img.vietqr.io/image/{Config.BANK_CODE}-{Config.BANK_ACCOUNT}-compact2.png?amount={amount}&addInfo={qr_note_encoded}"
     return qr_url
 
+
+
+# ===========================
+# VietQR (EMVCo) tạo local
+# ===========================
+def _tlv(tag: str, value: str) -> str:
+    """Một trường EMVCo: ID (2 số) + độ dài (2 số) + giá trị"""
+    return f"{tag}{len(value):02d}{value}"
+
+
+def crc16_ccitt(data: bytes) -> int:
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) theo chuẩn EMVCo"""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return crc
+
+
+def to_ascii_note(text: str) -> str:
+    """Bỏ dấu tiếng Việt và ký tự ngoài ASCII, cắt theo MAX_ADD_INFO_LENGTH"""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    normalized = unicodedata.normalize("NFD", text)
+    ascii_text = "".join(ch for ch in normalized if ch.isascii() and unicodedata.category(ch) != "Mn")
+    return ascii_text[:MAX_ADD_INFO_LENGTH].strip()
+
+
+def build_vietqr_payload(bank_bin: str, account: str, amount: int, add_info: str) -> str:
+    """
+    Tạo chuỗi payload VietQR (chuẩn EMVCo, dịch vụ QRIBFTTA - chuyển khoản tới tài khoản)
+    kèm CRC ở cuối.
+    """
+    beneficiary = _tlv("00", bank_bin) + _tlv("01", account)
+    merchant_info = _tlv("00", "A000000727") + _tlv("01", beneficiary) + _tlv("02", "QRIBFTTA")
+    payload = (
+        _tlv("00", "01")
+        + _tlv("01", "12" if amount else "11")  # 12 = QR động (có số tiền)
+        + _tlv("38", merchant_info)
+        + _tlv("53", "704")  # VND
+        + (_tlv("54", str(int(amount))) if amount else "")
+        + _tlv("58", "VN")
+        + (_tlv("62", _tlv("08", add_info)) if add_info else "")
+        + "6304"
+    )
+    return payload + f"{crc16_ccitt(payload.encode('ascii')):04X}"
+
+
+def get_bank_bin() -> Optional[str]:
+    """BIN ngân hàng từ BANK_BIN hoặc tra theo BANK_CODE"""
+    return Config.BANK_BIN or BANK_BINS.get(Config.BANK_CODE.upper())
+
+
+@lru_cache(maxsize=Config.QR_CACHE_SIZE)
+def _render_vietqr_png(bank_bin: str, account: str, amount: int, add_info: str) -> bytes:
+    payload = build_vietqr_payload(bank_bin, account, amount, add_info)
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_cache_key(amount: int, phone: str, service: str) -> str:
+    """Key cache file_id ảnh QR: mọi thứ quyết định nội dung ảnh (số tiền, SĐT, dịch vụ, tài khoản)"""
+    return f"{Config.BANK_CODE}|{Config.BANK_ACCOUNT}|{int(amount)}|{phone}|{service}"
+
+
+def local_qr_available() -> bool:
+    """True nếu có thể tạo QR local (đã cài qrcode/pillow và xác định được BIN ngân hàng)"""
+    return qrcode is not None and bool(Config.BANK_ACCOUNT) and get_bank_bin() is not None
+
+
+def generate_qr_image(amount: int, phone: str, service: str) -> bytes:
+    """
+    Tạo ảnh PNG mã VietQR ngay trong process (không gọi img.vietqr.io).
+    Ảnh được cache LRU theo (BIN, tài khoản, số tiền, nội dung).
+    
+    Raises:
+        ValueError: Nếu BANK_ACCOUNT chưa cấu hình hoặc không tạo QR local được
+    """
+    if not Config.BANK_ACCOUNT:
+        raise ValueError("BANK_ACCOUNT chưa được cấu hình trong file .env")
+    bank_bin = get_bank_bin()
+    if qrcode is None or bank_bin is None:
+        raise ValueError("Không tạo được QR local (thiếu thư viện qrcode hoặc BANK_BIN)")
+    return _render_vietqr_png(bank_bin, Config.BANK_ACCOUNT, amount, to_ascii_note(f"{phone} - {service}"))
@@ -0,0 +1,100 @@
+"""
+Webhook module - Nhận update từ Telegram qua HTTP (thay cho long polling)
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from telegram import Update
+from telegram.ext import Application
+from config import Config
+from http_server import Request, start_server
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def make_webhook_handler(app: Application, path: str, secret_token: str = None):
+    """
+    Tạo handler HTTP cho webhook: kiểm tra secret token, parse Update JSON
+    rồi đưa vào update_queue của Application (trả 200 ngay, không chờ xử lý xong)
+    """
+    async def handle(request: Request):
+        if request.path != path:
+            return 404, {}, b""
+        if request.method != "POST":
+            return 405, {"Allow": "POST"}, b""
+        if secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), secret_token
+        ):
+            logger.warning("Webhook request với secret token không hợp lệ")
+            return 403, {}, b""
+        try:
+            update = Update.de_json(json.loads(request.body), app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Webhook nhận JSON không hợp lệ: {e}")
+            return 400, {}, b""
+        if update is None:
+            return 400, {}, b""
+        await app.update_queue.put(update)
+        return 200, {}, b""
+
+    return handle
+
+
+async def _serve(app: Application):
+    path = "/" + Config.WEBHOOK_PATH.strip("/")
+    await app.initialize()
+
+    # Chỉ đăng ký webhook khi có URL công khai; chạy local thì bỏ qua để có thể POST tay
+    if Config.WEBHOOK_URL:
+        url = Config.WEBHOOK_URL.rstrip("/") + path
+        await app.bot.set_webhook(
+            url=url,
+            secret_token=Config.WEBHOOK_SECRET_TOKEN or None,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=Config.DROP_PENDING_UPDATES,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"🔗 Đã đăng ký webhook: {url}")
+    else:
+        logger.warning("WEBHOOK_URL trống - không gọi setWebhook (chế độ test local)")
+
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    server = await start_server(
+        Config.WEBHOOK_LISTEN,
+        Config.WEBHOOK_PORT,
+        make_webhook_handler(app, path, Config.WEBHOOK_SECRET_TOKEN or None),
+    )
+    logger.info(f"🌐 Webhook đang lắng nghe tại http://{Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}{path}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        await stop_event.wait()
+    finally:
+        # Ngừng nhận request mới; các update đã vào queue vẫn được xử lý trong app.stop().
+        # Không xóa webhook: Telegram giữ lại update chưa giao được và gửi lại khi bot chạy lại.
+        server.close()
+        await server.wait_closed()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def run_webhook(app: Application):
+    """Chạy bot ở chế độ webhook cho tới khi nhận SIGINT/SIGTERM"""
+    asyncio.run(_serve(app))
@@ -0,0 +1,300 @@
+"""
+Workers module - Chế độ nhiều process: process chính nhận update và chia cho WORKERS process con
+
+- Process chính (DispatchApplication) chỉ nhận update (polling/webhook), gửi sang worker theo
+  user id (cùng user luôn vào cùng worker nên state ConversationHandler không bị tách) và là
+  process DUY NHẤT ghi SQLite: worker gửi thao tác ghi (fn, args) về, process chính đưa vào write queue.
+- Worker chạy Application đầy đủ handler (không có updater), đọc DB bằng connection chỉ đọc của riêng nó
+  và gửi tin nhắn trực tiếp tới Bot API.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import pickle
+import signal
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from telegram import Update
+from telegram.ext import Application
+# API nội bộ của python-telegram-bot 20.3 (như application.py): kiểm tra lại khi nâng cấp
+from telegram.ext._application import _STOP_SIGNAL
+from config import Config
+import db
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+def worker_index(update: object, workers: int, fallback: int) -> int:
+    """Worker nhận update: user id (hoặc chat id) % số worker; update không có user/chat dùng fallback"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id % workers
+        if update.effective_chat:
+            return update.effective_chat.id % workers
+    return fallback % workers
+
+
+def _portable_error(error: BaseException) -> BaseException:
+    """Exception gửi được qua multiprocessing queue (không pickle được thì đổi sang RuntimeError)"""
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+# ===========================
+# Process chính
+# ===========================
+class WorkerPool:
+    """
+    WORKERS process con (spawn), mỗi process một inbox (update, kết quả ghi, thông báo ghi của worker khác);
+    tất cả gửi yêu cầu ghi vào chung một outbox do thread "worker-writes" của process chính phục vụ.
+    """
+
+    def __init__(self, count: int):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._outbox = self._ctx.Queue()
+        self._inboxes = [self._ctx.Queue() for _ in range(max(1, count))]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * len(self._inboxes)
+        self._server: Optional[threading.Thread] = None
+        self._round_robin = itertools.count()
+        self._ready = threading.Semaphore(0)
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._inboxes)
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=_worker_main, args=(index, self._inboxes[index], self._outbox),
+            name=f"bot-worker-{index}", daemon=False
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self, timeout: float = 60):
+        """Khởi động worker và chờ tất cả sẵn sàng để update đầu tiên không phải xếp hàng lâu"""
+        self._server = threading.Thread(target=self._serve_requests, name="worker-writes", daemon=True)
+        self._server.start()
+        for index, inbox in enumerate(self._inboxes):
+            self._spawn(index)
+            QUEUE_DEPTH.set_function(inbox.qsize, f"worker_{index}")
+        for _ in self._inboxes:
+            if not self._ready.acquire(timeout=timeout):
+                logger.warning(f"Có worker chưa sẵn sàng sau {timeout}s - vẫn tiếp tục")
+                break
+        logger.info(f"👷 Đã khởi động {len(self)} worker process")
+
+    def dispatch(self, update: Update):
+        index = worker_index(update, len(self), next(self._round_robin))
+        process = self._processes[index]
+        if not self._stopping and process is not None and not process.is_alive():
+            logger.error(f"Worker {index} đã dừng (exit code {process.exitcode}) - khởi động lại")
+            self._spawn(index)
+        self._inboxes[index].put(("update", update.to_json()))
+
+    def _reply(self, index: int, request_id: int, future: "Future[Any]"):
+        error = future.exception()
+        if error is not None:
+            self._inboxes[index].put(("result", request_id, _portable_error(error), None))
+        else:
+            self._inboxes[index].put(("result", request_id, None, future.result()))
+
+    def _serve_requests(self):
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                break
+            try:
+                if message[0] == "write":
+                    _, index, request_id, store, fn, args = message
+                    future = db.submit_write(store, fn, *args)
+                    future.add_done_callback(lambda f, i=index, r=request_id: self._reply(i, r, f))
+                elif message[0] == "ready":
+                    self._ready.release()
+                elif message[0] in ("notify", "sale"):
+                    # Worker khác cũng phải xóa cache báo cáo của ngày vừa thay đổi và thêm hóa đơn mới
+                    # vào index khách quen của mình
+                    kind, index, *payload = message
+                    for other, inbox in enumerate(self._inboxes):
+                        if other != index:
+                            inbox.put((kind, *payload))
+            except Exception as e:
+                logger.error(f"Lỗi khi xử lý yêu cầu từ worker: {e}", exc_info=True)
+                if message[0] == "write":
+                    self._inboxes[message[1]].put(("result", message[2], _portable_error(e), None))
+
+    def stop(self, timeout: float = 30):
+        """Dừng các worker (chờ xử lý nốt update và ghi persistence) rồi dừng thread ghi"""
+        self._stopping = True
+        for inbox in self._inboxes:
+            inbox.put(("stop",))
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {index} không dừng sau {timeout}s - terminate")
+                process.terminate()
+                process.join()
+        if self._server is not None:
+            self._outbox.put(None)
+            self._server.join()
+            self._server = None
+
+
+class DispatchApplication(Application):
+    """Application của process chính: không có handler, chuyển mọi update cho WorkerPool"""
+
+    def __init__(self, *, worker_pool: WorkerPool, **kwargs):
+        super().__init__(**kwargs)
+        self._worker_pool = worker_pool
+
+    async def _update_fetcher(self) -> None:
+        # Ghi đè vòng lấy update của Application (private trong PTB 20.3, xem requirements.txt)
+        while True:
+            try:
+                update = await self.update_queue.get()
+
+                if update is _STOP_SIGNAL:
+                    while not self.update_queue.empty():
+                        self.update_queue.task_done()
+                    self.update_queue.task_done()
+                    return
+
+                try:
+                    self._worker_pool.dispatch(update)
+                except Exception as e:
+                    logger.error(f"Không gửi được update cho worker: {e}", exc_info=True)
+                finally:
+                    self.update_queue.task_done()
+            except asyncio.CancelledError:
+                logger.warning("Update fetcher bị cancel - bỏ qua, chỉ dừng qua Application.stop")
+
+
+# ===========================
+# Worker process
+# ===========================
+class WorkerClient:
+    """Phía worker: nhận update/kết quả ghi qua inbox, gửi thao tác ghi về process chính"""
+
+    def __init__(self, index: int, inbox, outbox):
+        self.index = index
+        self._inbox = inbox
+        self._outbox = outbox
+        self._request_ids = itertools.count(1)
+        self._pending: Dict[int, "Future[Any]"] = {}
+        self._lock = threading.Lock()
+        self._applying_remote = False
+        self._app: Optional[Application] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    def submit_write(self, store: Optional[str], fn: Callable[..., Any], args: tuple) -> "Future[Any]":
+        # fn được gửi theo tên (pickle) nên phải là hàm cấp module
+        if "<" in fn.__qualname__:
+            raise ValueError(f"{fn.__qualname__}: thao tác ghi trong worker phải là hàm cấp module")
+        future: "Future[Any]" = Future()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+        self._outbox.put(("write", self.index, request_id, store, fn, args))
+        return future
+
+    def _forward_notify(self, kind: str, day: Optional[str]):
+        if not self._applying_remote:
+            self._outbox.put(("notify", self.index, db.current_store(), kind, day))
+
+    def _apply_notify(self, store: Optional[str], kind: str, day: Optional[str]):
+        self._applying_remote = True
+        try:
+            with db.use_store(store):
+                db.notify_write(kind, day)
+        finally:
+            self._applying_remote = False
+
+    def _forward_sale(self, name: str, phone: str, service: str, created_at: str):
+        if not self._applying_remote:
+            self._outbox.put(("sale", self.index, db.current_store(), (name, phone, service, created_at)))
+
+    def _apply_sale(self, store: Optional[str], sale: tuple):
+        self._applying_remote = True
+        try:
+            with db.use_store(store):
+                db.notify_sale(*sale)
+        finally:
+            self._applying_remote = False
+
+    def _put_update(self, data: str):
+        self._app.update_queue.put_nowait(Update.de_json(json.loads(data), self._app.bot))
+
+    def _read_inbox(self):
+        # Vẫn đọc sau "stop": lúc tắt app còn ghi persistence và chờ kết quả
+        while True:
+            message = self._inbox.get()
+            kind = message[0]
+            if kind == "result":
+                _, request_id, error, value = message
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(value)
+            elif kind == "update":
+                self._loop.call_soon_threadsafe(self._put_update, message[1])
+            elif kind == "notify":
+                self._loop.call_soon_threadsafe(self._apply_notify, *message[1:])
+            elif kind == "sale":
+                self._loop.call_soon_threadsafe(self._apply_sale, *message[1:])
+            elif kind == "stop":
+                self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def run(self, app: Application):
+        self._app = app
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        db.add_write_listener(self._forward_notify)
+        db.add_sale_listener(self._forward_sale)
+        threading.Thread(target=self._read_inbox, name="worker-inbox", daemon=True).start()
+
+        await app.initialize()
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        self._outbox.put(("ready", self.index))
+        logger.info(f"👷 Worker {self.index} sẵn sàng")
+        try:
+            await self._stopped.wait()
+        finally:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+            await app.shutdown()
+            if app.post_shutdown:
+                await app.post_shutdown(app)
+
+
+def _worker_main(index: int, inbox, outbox):
+    """Entry point của worker process"""
+    # Ctrl+C gửi cho cả process group; worker chỉ dừng khi process chính gửi "stop"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if Config.METRICS_PORT:
+        Config.METRICS_PORT += 1 + index
+    from bot import create_application
+    from reports import report_workers
+
+    client = WorkerClient(index, inbox, outbox)
+    db.set_remote_writer(client.submit_write)
+    try:
+        asyncio.run(client.run(create_application(updater=False, worker=(index, Config.WORKERS))))
+    finally:
+        report_workers.shutdown()
+        db.shutdown()